@@ -0,0 +1,78 @@
+# backfill_watched_imdb.py
+#
+# Description
+# ===========
+#
+# This script adds the "WATCHEDIMDB#*" records for the films a guild watched
+# before they were introduced, so that `/nominate` rejects them too.  It is
+# safe to run while FilmBot is serving requests and can be rerun at any time.
+#
+# Usage
+# =====
+#
+# $ python backfill_watched_imdb.py GUILD_ID
+
+import argparse
+import os
+import boto3
+from datetime import datetime
+from filmbot import (
+    WATCHEDIMDB_PK,
+    WATCHEDIMDB_SK,
+    WATCHEDIMDB_FilmName,
+    WATCHEDIMDB_DateWatched,
+    FilmBot,
+    batch_write,
+    watched_imdb_sk,
+)
+
+
+def backfill_guild(client, GuildID):
+    """
+    Write a "WATCHEDIMDB#*" record for each IMDb ID that `GuildID` has
+    watched, using the most recent time it was watched.  Return the number of
+    records written.
+    """
+    filmbot = FilmBot(DynamoDBClient=client, GuildID=GuildID)
+
+    # Films are returned most recently watched first
+    latest = {}
+    for film in filmbot.get_watched_films():
+        if film.IMDbID is not None and film.IMDbID not in latest:
+            latest[film.IMDbID] = film
+
+    batch_write(
+        client,
+        [
+            {
+                "PutRequest": {
+                    "Item": {
+                        WATCHEDIMDB_PK: {"S": GuildID},
+                        WATCHEDIMDB_SK: {"S": watched_imdb_sk(imdb_id)},
+                        WATCHEDIMDB_FilmName: {"S": film.FilmName},
+                        WATCHEDIMDB_DateWatched: {
+                            "S": datetime.isoformat(film.DateWatched)
+                        },
+                    }
+                }
+            }
+            for (imdb_id, film) in latest.items()
+        ],
+    )
+    return len(latest)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Add the watched IMDb ID records for a guild's history"
+    )
+    parser.add_argument("guild_id")
+    args = parser.parse_args()
+
+    client = boto3.client("dynamodb", region_name=os.environ["AWS_REGION"])
+    count = backfill_guild(client, args.guild_id)
+    print(f"Wrote {count} watched IMDb IDs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# benchmark_cold_start.py
+#
+# Description
+# ===========
+#
+# This script measures how long importing `lambda_function` and
+# `discord_handler` takes in a new interpreter, which is most of the time a
+# cold start spends before it can answer Discord's `PING`, and checks it
+# against the budget for each.  The budgets are well above what the imports
+# take on a developer machine (~15ms and ~60ms), so that they only fail when
+# something slow is imported at the top level.  They depend on the machine,
+# so they are checked here rather than in `test_cold_start.py`, which checks
+# that the slow modules aren't imported at all.
+#
+# It exits with a non-zero status if the median of any import is over its
+# budget.
+#
+# Usage
+# =====
+#
+# $ python benchmark_cold_start.py [--iterations N]
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# The most time in milliseconds that importing each module may take on a
+# cold start
+IMPORT_BUDGETS_MS = {
+    "lambda_function": 100,
+    "discord_handler": 250,
+}
+
+
+def import_time(module):
+    """
+    Return the cumulative time in milliseconds that `python -X importtime`
+    reports for importing `module` in a new interpreter, along with the
+    names of all of the modules that were imported.
+    """
+    env = dict(os.environ, AWS_REGION="eu-west-2", FILMBOT_PUBLIC_KEY="00")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # Each line is "import time: <self us> | <cumulative us> | <name>"
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) / 1000
+    return (times[module], set(times))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check the import time of a cold start"
+    )
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args()
+
+    over_budget = False
+    print("module            median_ms  max_ms  budget_ms")
+    for module, budget in IMPORT_BUDGETS_MS.items():
+        times = [import_time(module)[0] for _ in range(args.iterations)]
+        median = statistics.median(times)
+        over_budget |= median > budget
+        print(f"{module:<16} {median:>10.1f} {max(times):>7.1f} {budget:>10}")
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# benchmark_events.py
+#
+# Description
+# ===========
+#
+# This script compares the latency of `lambda_handler` for the API Gateway
+# mapping template events and the Lambda function URL events that it
+# accepts, from the JSON that AWS Lambda hands the function to the JSON it
+# sends back, along with the size of each event.  It signs its own requests
+# with a throwaway key, so it sets `FILMBOT_PUBLIC_KEY` to match.  Each
+# request is a new interaction signed just before the run, as duplicates and
+# old requests are turned away.
+#
+# Every run benchmarks `PING`.  With `--guild`, it also benchmarks `/peek`
+# for that guild against the FilmBot table in `AWS_REGION`, which only reads
+# from the table.  This doesn't include API Gateway's own hop, which only
+# the mapping template events go through.
+#
+# Usage
+# =====
+#
+# $ python benchmark_events.py [--guild GUILD_ID] [--iterations N]
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import time
+import uuid
+from nacl.signing import SigningKey
+import lambda_function
+
+
+def mapping_template_event(body, raw_body, signature, timestamp):
+    return {
+        "params": {
+            "header": {
+                "x-signature-ed25519": signature,
+                "x-signature-timestamp": timestamp,
+            }
+        },
+        "rawBody": raw_body,
+        "body-json": body,
+    }
+
+
+def function_url_event(body, raw_body, signature, timestamp):
+    return {
+        "version": lambda_function.HTTP_EVENT_VERSION,
+        "headers": {
+            "content-type": "application/json",
+            "x-signature-ed25519": signature,
+            "x-signature-timestamp": timestamp,
+        },
+        "body": raw_body,
+        "isBase64Encoded": False,
+    }
+
+
+EVENT_MODES = {
+    "mapping-template": mapping_template_event,
+    "function-url": function_url_event,
+}
+
+
+def signed_payload(signing_key, body, mode):
+    """Return the JSON that AWS Lambda would be invoked with for a new
+    interaction with `body` in the event `mode`."""
+    body = {**body, "id": uuid.uuid4().hex}
+    raw_body = json.dumps(body)
+    timestamp = str(int(time.time()))
+    signature = signing_key.sign(
+        (timestamp + raw_body).encode()
+    ).signature.hex()
+    return json.dumps(EVENT_MODES[mode](body, raw_body, signature, timestamp))
+
+
+def benchmark(signing_key, body, mode, Iterations):
+    """Return the latency of each of `Iterations` invocations with `body` in
+    the event `mode` in milliseconds."""
+    payloads = [
+        signed_payload(signing_key, body, mode) for _ in range(Iterations)
+    ]
+    latencies = []
+    # `lambda_handler` logs a line for every request
+    with contextlib.redirect_stdout(io.StringIO()):
+        for payload in payloads:
+            start = time.perf_counter()
+            json.dumps(
+                lambda_function.lambda_handler(json.loads(payload), None)
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the latency of the Lambda event modes"
+    )
+    parser.add_argument("--guild")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    signing_key = SigningKey.generate()
+    os.environ["FILMBOT_PUBLIC_KEY"] = signing_key.verify_key.encode().hex()
+
+    requests = {"PING": {"type": 1}}
+    if args.guild:
+        requests["/peek"] = {
+            "type": 2,
+            "application_id": "benchmark",
+            "token": "benchmark",
+            "data": {"name": "peek"},
+            "guild_id": args.guild,
+            "member": {"user": {"id": "benchmark"}},
+        }
+
+    print("request mode             bytes  median_ms  p99_ms")
+    for name, body in requests.items():
+        for mode in EVENT_MODES:
+            # Warm up so that lazy imports and clients aren't counted
+            benchmark(signing_key, body, mode, 3)
+            latencies = sorted(
+                benchmark(signing_key, body, mode, args.iterations)
+            )
+            size = len(signed_payload(signing_key, body, mode))
+            p99 = latencies[
+                min(len(latencies) - 1, len(latencies) * 99 // 100)
+            ]
+            print(
+                f"{name:<7} {mode:<16} {size:>5} "
+                f"{statistics.median(latencies):>10.3f} {p99:>7.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import math
+import struct
+from hashlib import blake2b
+
+# A serialized Bloom filter is `HEADER` followed by the bits
+HEADER = struct.Struct("<IIB")
+
+
+class BloomFilter:
+    """
+    A set of strings that takes a fixed amount of space, at the cost of
+    sometimes saying that it contains a string that was never added.  With
+    at most `Capacity` strings added, this happens for about `ErrorRate` of
+    the strings that weren't.
+    """
+
+    def __init__(self, *, Capacity, ErrorRate=0.01):
+        assert Capacity > 0
+        self.capacity = Capacity
+        size = math.ceil(-Capacity * math.log(ErrorRate) / math.log(2) ** 2)
+        self._bits = bytearray((size + 7) // 8)
+        self._hash_count = max(
+            1, round(len(self._bits) * 8 / Capacity * math.log(2))
+        )
+        self._count = 0
+
+    def _positions(self, item):
+        # Derive every hash from 2 halves of one digest (Kirsch-Mitzenmacher)
+        digest = blake2b(item.encode(), digest_size=16).digest()
+        h1, h2 = struct.unpack("<QQ", digest)
+        size = len(self._bits) * 8
+        return ((h1 + i * h2) % size for i in range(self._hash_count))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self._bits[position // 8] |= 1 << (position % 8)
+        self._count += 1
+
+    def __contains__(self, item):
+        return all(
+            self._bits[position // 8] & (1 << (position % 8))
+            for position in self._positions(item)
+        )
+
+    def __len__(self):
+        """Return the number of strings that have been added."""
+        return self._count
+
+    def isFull(self):
+        """Return whether adding more strings would make false positives
+        more likely than the error rate."""
+        return self._count >= self.capacity
+
+    def __eq__(self, other):
+        return self.toBytes() == other.toBytes()
+
+    def __repr__(self):
+        return (
+            f"BloomFilter(Capacity={self.capacity}, Count={self._count}, "
+            f"Bytes={len(self._bits)})"
+        )
+
+    @staticmethod
+    def fromItems(items, *, Capacity, ErrorRate=0.01):
+        bloom = BloomFilter(Capacity=Capacity, ErrorRate=ErrorRate)
+        for item in items:
+            bloom.add(item)
+        return bloom
+
+    def toBytes(self):
+        return (
+            HEADER.pack(self.capacity, self._count, self._hash_count)
+            + self._bits
+        )
+
+    @staticmethod
+    def fromBytes(data):
+        capacity, count, hash_count = HEADER.unpack_from(data)
+        bloom = BloomFilter.__new__(BloomFilter)
+        bloom.capacity = capacity
+        bloom._bits = bytearray(data[HEADER.size :])
+        bloom._hash_count = hash_count
+        bloom._count = count
+        return bloom
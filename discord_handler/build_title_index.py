@@ -0,0 +1,134 @@
+# build_title_index.py
+#
+# Description
+# ===========
+#
+# This script builds the title index used by `/nominate` autocomplete from the
+# public IMDb dataset (https://developer.imdb.com/non-commercial-datasets/).
+# Only movies are kept, and they are ranked by their number of votes if
+# `title.ratings.tsv.gz` is specified.
+#
+# Set the environment variable `FILMBOT_TITLE_INDEX` to the path of the
+# output file to have FilmBot search it instead of IMDb.
+#
+# Usage
+# =====
+#
+# $ python build_title_index.py title.basics.tsv.gz OUTPUT \
+#       [--ratings title.ratings.tsv.gz] [--processes N]
+
+import argparse
+import gzip
+from itertools import islice
+from multiprocessing import Pool
+from title_index import write_title_index
+
+# The number of lines of `title.basics.tsv` sent to each worker at a time
+CHUNK_SIZE = 50000
+
+# `title.basics.tsv` columns
+TCONST = 0
+TITLE_TYPE = 1
+PRIMARY_TITLE = 2
+IS_ADULT = 4
+START_YEAR = 5
+
+MISSING = "\\N"
+
+
+def open_tsv(path):
+    """Open the specified TSV `path`, which may be gzipped, skipping the
+    header line."""
+    f = (
+        gzip.open(path, "rt", encoding="utf-8")
+        if path.endswith(".gz")
+        else open(path, "r", encoding="utf-8")
+    )
+    next(f, None)
+    return f
+
+
+def chunks(lines, size):
+    """Yield arrays of at most `size` lines from `lines`."""
+    while True:
+        chunk = list(islice(lines, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def parse_basics(lines):
+    """
+    Return an array of `(IMDbID, Title, Year)` tuples for the movies in the
+    specified `title.basics.tsv` `lines`.
+    """
+    movies = []
+    for line in lines:
+        columns = line.rstrip("\n").split("\t")
+        if columns[TITLE_TYPE] != "movie" or columns[IS_ADULT] == "1":
+            continue
+        year = columns[START_YEAR]
+        movies.append(
+            (
+                columns[TCONST].removeprefix("tt"),
+                columns[PRIMARY_TITLE],
+                None if year == MISSING else int(year),
+            )
+        )
+    return movies
+
+
+def read_votes(path):
+    """Return a dictionary of IMDb IDs against their number of votes from the
+    specified `title.ratings.tsv` `path`."""
+    votes = {}
+    with open_tsv(path) as f:
+        for line in f:
+            tconst, _, num_votes = line.rstrip("\n").split("\t")
+            votes[tconst.removeprefix("tt")] = int(num_votes)
+    return votes
+
+
+def build_title_index(
+    BasicsPath, OutputPath, RatingsPath=None, Processes=None
+):
+    """
+    Write a title index of the movies in `BasicsPath` to `OutputPath`,
+    ranked by the votes in `RatingsPath` if specified, parsing with
+    `Processes` worker processes.  Return the number of movies written.
+    """
+    votes = read_votes(RatingsPath) if RatingsPath else {}
+
+    films = []
+    with open_tsv(BasicsPath) as f, Pool(Processes) as pool:
+        for movies in pool.imap(parse_basics, chunks(f, CHUNK_SIZE)):
+            films += [
+                (title, year, votes.get(imdb_id, 0), imdb_id)
+                for (imdb_id, title, year) in movies
+            ]
+
+    write_title_index(OutputPath, films)
+    return len(films)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the /nominate title index from IMDb's dataset"
+    )
+    parser.add_argument("basics")
+    parser.add_argument("output")
+    parser.add_argument("--ratings", default=None)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    count = build_title_index(
+        args.basics,
+        args.output,
+        RatingsPath=args.ratings,
+        Processes=args.processes,
+    )
+    print(f"Wrote {count} movies to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class LRUCache:
+    """
+    A cache of at most `MaxSize` entries that evicts the least recently used
+    entry when full, and treats entries older than `TTL` seconds as missing.
+    Empty values are kept for `NegativeTTL` seconds instead if specified, so
+    that lookups that found nothing can be retried sooner.  It is safe to
+    use from multiple threads.
+    """
+
+    def __init__(
+        self, *, MaxSize, TTL, NegativeTTL=None, Clock=time.monotonic
+    ):
+        assert MaxSize > 0
+        self._max_size = MaxSize
+        self._ttl = TTL
+        self._negative_ttl = TTL if NegativeTTL is None else NegativeTTL
+        self._clock = Clock
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Return the value cached for the specified `key`, or `None` if there
+        is no value or it has expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expiry, value = entry
+                if self._clock() < expiry:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """Cache the specified `value` for the specified `key`."""
+        ttl = self._ttl if value else self._negative_ttl
+        with self._lock:
+            self._entries[key] = (self._clock() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """Remove the value cached for the specified `key`, if any."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,108 @@
+from collections import namedtuple
+from cache import LRUCache
+from filmbot import (
+    TABLE_NAME,
+    CATALOG_PK,
+    CATALOG_Runtime,
+    CATALOG_ReleaseYear,
+    CATALOG_IMDbTitle,
+    batch_get,
+    catalog_key,
+    keyed,
+    unkeyed,
+)
+
+# Catalog records never change once written, so they can be kept for a long
+# time in AWS Lambda "hot starts".  Films that aren't in the catalog yet are
+# looked for again sooner as they are probably being enriched.
+CATALOG_CACHE_SIZE = 4096
+CATALOG_CACHE_TTL = 24 * 60 * 60
+CATALOG_CACHE_NEGATIVE_TTL = 60
+
+FilmMetadata = namedtuple(
+    "FilmMetadata", ["Runtime", "ReleaseYear", "IMDbTitle"]
+)
+
+# What we cache for a film that isn't in the catalog
+NOT_IN_CATALOG = ()
+
+catalog_cache = LRUCache(
+    MaxSize=CATALOG_CACHE_SIZE,
+    TTL=CATALOG_CACHE_TTL,
+    NegativeTTL=CATALOG_CACHE_NEGATIVE_TTL,
+)
+
+
+def metadata_to_item(IMDbID, metadata):
+    """Return the catalog record for `IMDbID`, leaving out any of its
+    `metadata` that isn't known."""
+    item = catalog_key(IMDbID)
+    for name, value in [
+        (CATALOG_Runtime, metadata.Runtime),
+        (CATALOG_ReleaseYear, metadata.ReleaseYear),
+        (CATALOG_IMDbTitle, metadata.IMDbTitle),
+    ]:
+        if value is not None:
+            item[name] = keyed(value)
+    return item
+
+
+def metadata_from_item(item):
+    """Return the `FilmMetadata` in the specified catalog record."""
+
+    def get(name):
+        return unkeyed(item[name]) if name in item else None
+
+    return FilmMetadata(
+        Runtime=get(CATALOG_Runtime),
+        ReleaseYear=get(CATALOG_ReleaseYear),
+        IMDbTitle=get(CATALOG_IMDbTitle),
+    )
+
+
+def get_catalog_entries(client, IMDbIDs):
+    """
+    Return a dictionary of each of the specified `IMDbIDs` that is in the
+    catalog against its `FilmMetadata`.  Films we have looked up recently
+    are answered from memory, and the rest are read in batches.
+    """
+    entries = {}
+    missing = []
+    for imdb_id in dict.fromkeys(filter(None, IMDbIDs)):
+        metadata = catalog_cache.get(imdb_id)
+        if metadata is None:
+            missing.append(imdb_id)
+        elif metadata != NOT_IN_CATALOG:
+            entries[imdb_id] = metadata
+
+    if missing:
+        found = {
+            item[CATALOG_PK]["S"].removeprefix("CATALOG#"): item
+            for item in batch_get(client, list(map(catalog_key, missing)))
+        }
+        for imdb_id in missing:
+            if imdb_id in found:
+                entries[imdb_id] = metadata_from_item(found[imdb_id])
+                catalog_cache.put(imdb_id, entries[imdb_id])
+            else:
+                catalog_cache.put(imdb_id, NOT_IN_CATALOG)
+
+    return entries
+
+
+def put_catalog_entry(client, IMDbID, metadata):
+    """
+    Add the `metadata` for `IMDbID` to the catalog, unless another container
+    beat us to it.  Return whether it was added.
+    """
+    try:
+        client.put_item(
+            TableName=TABLE_NAME,
+            Item=metadata_to_item(IMDbID, metadata),
+            ConditionExpression=f"attribute_not_exists({CATALOG_PK})",
+        )
+    except client.exceptions.ConditionalCheckFailedException:
+        return False
+    finally:
+        catalog_cache.invalidate(IMDbID)
+    return True
@@ -0,0 +1,134 @@
+import json
+import os
+
+# Discord drops responses that take longer than 3 seconds, so slow commands
+# are acknowledged straight away and then run again by a worker, which
+# edits the acknowledgement with the real response through the
+# interaction's webhook.  The worker is the AWS Lambda function named in this
+# environment variable (normally the same function), invoked asynchronously.
+# Without it, every command is answered synchronously.
+DEFER_FUNCTION = "FILMBOT_DEFER_FUNCTION"
+
+# The key that marks an event as a deferred command for the worker to run.
+# Events from Discord can't have it, as API Gateway only passes on the
+# request's `params`, `rawBody` and `body-json`, and function URL events are
+# rebuilt in that form.
+DEFERRED = "filmbot-deferred"
+
+DISCORD_API = "https://discord.com/api/v10"
+
+# How long we wait for Discord to accept a webhook request
+WEBHOOK_TIMEOUT = 5
+
+# Discord rejects API requests without a user agent in this form
+USER_AGENT = "DiscordBot (FilmBot, 1.0)"
+
+# `lambda_function` imports this module for `DEFERRED` on every cold start,
+# so modules that are only needed to defer commands are imported when used
+_deferrer = None
+_webhook_client = None
+
+
+class DiscordWebhookClient:
+    """Edits interaction responses and sends follow-up messages through the
+    webhook of an interaction, which needs no bot token."""
+
+    def __init__(self, BaseURL=DISCORD_API, Timeout=WEBHOOK_TIMEOUT):
+        self._base_url = BaseURL
+        self._timeout = Timeout
+
+    def _request(self, method, path, data=None):
+        import urllib.request
+
+        request = urllib.request.Request(
+            self._base_url + path,
+            method=method,
+            data=None if data is None else json.dumps(data).encode(),
+            headers={
+                "Content-Type": "application/json",
+                "User-Agent": USER_AGENT,
+            },
+        )
+        with urllib.request.urlopen(request, timeout=self._timeout) as r:
+            return r.read()
+
+    def edit_original_response(self, ApplicationID, Token, data):
+        self._request(
+            "PATCH",
+            f"/webhooks/{ApplicationID}/{Token}/messages/@original",
+            data,
+        )
+
+    def delete_original_response(self, ApplicationID, Token):
+        self._request(
+            "DELETE", f"/webhooks/{ApplicationID}/{Token}/messages/@original"
+        )
+
+    def create_followup_message(self, ApplicationID, Token, data):
+        self._request("POST", f"/webhooks/{ApplicationID}/{Token}", data)
+
+
+class LambdaDeferrer:
+    """Sends deferred commands to an AWS Lambda function to run."""
+
+    def __init__(self, lambda_client, FunctionName):
+        self._lambda = lambda_client
+        self._function_name = FunctionName
+
+    def send(self, event):
+        self._lambda.invoke(
+            FunctionName=self._function_name,
+            InvocationType="Event",
+            Payload=json.dumps({**event, DEFERRED: True}).encode(),
+        )
+
+
+class LocalDeferrer:
+    """Runs deferred commands on a background thread, for running locally
+    and in tests."""
+
+    def __init__(self, client):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._client = client
+        self._worker = ThreadPoolExecutor(max_workers=1)
+        self._pending = []
+
+    def send(self, event):
+        from discord_handler import handle_deferred
+
+        self._pending = [f for f in self._pending if not f.done()]
+        self._pending.append(
+            self._worker.submit(
+                handle_deferred, {**event, DEFERRED: True}, self._client
+            )
+        )
+
+    def wait(self):
+        """Wait for all deferred commands sent so far to be delivered."""
+        while self._pending:
+            self._pending.pop(0).result()
+
+
+def get_deferrer():
+    """Return where slow commands are sent to run, or `None` if they should
+    be answered synchronously."""
+    global _deferrer
+    if _deferrer is None:
+        function_name = os.environ.get(DEFER_FUNCTION)
+        if function_name:
+            import boto3
+
+            _deferrer = LambdaDeferrer(
+                boto3.client("lambda", region_name=os.environ["AWS_REGION"]),
+                FunctionName=function_name,
+            )
+    return _deferrer
+
+
+def get_webhook_client():
+    """Return the client that deferred responses are delivered with."""
+    global _webhook_client
+    if _webhook_client is None:
+        _webhook_client = DiscordWebhookClient()
+    return _webhook_client
@@ -1,9 +1,20 @@
-from filmbot import FilmBot, VotingStatus, AttendanceStatus, Film
+from filmbot import (
+    FilmBot,
+    VotingStatus,
+    AttendanceStatus,
+    Film,
+    Attendance,
+    User,
+)
 from UserError import UserError
+from tracing import traced
+from nomination_choices import (
+    get_nomination_choices,
+    update_nomination_choices,
+    invalidate_nomination_choices,
+)
 import datetime as dt
-from itertools import islice
-from uuid import uuid1
-from imdb import IMDb
+import time
 
 MAX_MESSAGE_SIZE = 2000
 
@@ -15,6 +26,70 @@ MAX_MESSAGE_SIZE = 2000
 # of the DynamoDB block size (4KB) in order to minimize cost.
 HISTORY_LIMIT = 80
 
+# Discord drops autocomplete responses that take longer than 3 seconds after
+# it sent the interaction, so leave some time for the response to get back
+AUTOCOMPLETE_DEADLINE = 2.0
+
+# The maximum length of an autocomplete choice's name and value
+MAX_CHOICE_SIZE = 100
+
+# The number of `/nominate` autocomplete results we show, and how many we
+# search for so that the guild's ranking has some to choose from
+MAX_NOMINATE_CHOICES = 5
+RANKING_CANDIDATES = 15
+
+# The function that handles each application command, and the autocomplete
+# of its options, by command name.  Modules that only some commands need are
+# imported by those commands rather than here, e.g. `film_search` imports the
+# `imdb` package which takes longer to import than everything else we use.
+# This keeps cold starts quick for the commands that don't need them.
+APPLICATION_COMMANDS = {}
+AUTOCOMPLETE_COMMANDS = {}
+
+# The application commands that can take longer than the 3 seconds Discord
+# gives us.  These are acknowledged straight away and run by a worker if we
+# have one (see `deferral.py`), as is any other command when there is less
+# than `MIN_SYNC_BUDGET` seconds left before our deadline.
+DEFERRED_COMMANDS = set()
+MIN_SYNC_BUDGET = 1.0
+
+# The application commands whose response is ephemeral, as Discord needs to
+# know this up front when they are deferred
+EPHEMERAL_COMMANDS = set()
+
+# Appended to responses that left out results because we ran out of time
+TRUNCATED_NOTE = "\n\n(Some results were left out, please try again.)"
+
+# What deferred commands show if they fail unexpectedly, as Discord would
+# otherwise leave the acknowledgement "thinking" until it times out
+DEFERRED_FAILURE_MESSAGE = "Sorry, something went wrong. Please try again."
+
+
+def application_command(name, *, Deferred=False, Ephemeral=False):
+    """Register the decorated function as the handler of `/name`, which is
+    `Deferred` if it can be slow and `Ephemeral` if only the user sees its
+    response."""
+
+    def register(handler):
+        APPLICATION_COMMANDS[name] = handler
+        if Deferred:
+            DEFERRED_COMMANDS.add(name)
+        if Ephemeral:
+            EPHEMERAL_COMMANDS.add(name)
+        return handler
+
+    return register
+
+
+def autocomplete(name):
+    """Register the decorated function as the autocomplete of `/name`."""
+
+    def register(handler):
+        AUTOCOMPLETE_COMMANDS[name] = handler
+        return handler
+
+    return register
+
 
 class DiscordRequest:
     PING = 1
@@ -54,24 +129,28 @@ class MessageComponentID:
     ATTENDANCE = "register_attendance"
     SHAME = "shame"
     MORE_HISTORY = "more_history#"
-
-
-def films_to_choices(films):
-    return list(
-        map(
-            lambda n: {
-                "name": n.FilmName,
-                "value": n.FilmID,
-            },
-            films,
-        )
-    )
+    MORE_ATTENDANCE = "more_attendance#"
 
 
 def encode_IMDB(imdb_id, film_name):
     return f"IMDB:{imdb_id}:{film_name}"
 
 
+def search_result_to_choice(r, Watched=False):
+    name = r.Title if r.Year is None else f"{r.Title} ({r.Year})"
+    # Only flag the name shown so the flag isn't part of the nomination
+    display_name = f"{name} (watched)" if Watched else name
+    return {"name": display_name, "value": encode_IMDB(r.IMDbID, name)}
+
+
+def autocomplete_query(body):
+    """Return what has been typed so far into the option being completed."""
+    for option in body["data"].get("options", []):
+        if option.get("focused", False):
+            return option["value"]
+    return ""
+
+
 def decode_film(film_name_or_id):
     if film_name_or_id.startswith("IMDB:"):
         parts = film_name_or_id.split(":", 3)
@@ -115,8 +194,9 @@ def display_users_by_nomination(users):
         return f"{position}. [No nomination] <@{discordUserID}>"
 
 
-def display_watched(f: Film, user):
-    film = f"**{f.FilmName}**" if user in f.UsersAttended else f.FilmName
+def display_watched(f: Film, member: User):
+    attended = member is not None and f.attendedBy(member)
+    film = f"**{f.FilmName}**" if attended else f.FilmName
     return f"- <t:{int(f.DateWatched.timestamp())}:d> {film} - <@{f.DiscordUserID}>"
 
 
@@ -127,9 +207,10 @@ def get_history(filmbot: FilmBot, user, nextKey=None, MessagePrefix=""):
     if films:
         message = MessagePrefix
 
+        member = filmbot.get_user(user)
         lastFilmKey = None
         for film in films:
-            line = display_watched(film, user) + "\n"
+            line = display_watched(film, member) + "\n"
             if len(message) + len(line) > MAX_MESSAGE_SIZE:
                 nextKey = lastFilmKey
                 break
@@ -163,10 +244,120 @@ def get_history(filmbot: FilmBot, user, nextKey=None, MessagePrefix=""):
     return result
 
 
+def display_attended(a: Attendance):
+    return f"- <t:{int(a.DateWatched.timestamp())}:d> {a.FilmName}"
+
+
+def get_attendance_history(
+    filmbot: FilmBot, user, nextKey=None, MessagePrefix=""
+):
+    # The button's `custom_id` is limited to 100 characters so we leave out
+    # the `ATTENDED#<user>#` prefix of the sort key, which is implied by the
+    # user pressing the button
+    prefix = f"ATTENDED#{user}#"
+    (attended, nextKey) = filmbot.get_attendance_after(
+        DiscordUserID=user,
+        Limit=HISTORY_LIMIT,
+        ExclusiveStartKey=prefix + nextKey if nextKey else None,
+    )
+    if attended:
+        message = MessagePrefix
+
+        lastKey = None
+        for a in attended:
+            line = display_attended(a) + "\n"
+            if len(message) + len(line) > MAX_MESSAGE_SIZE:
+                nextKey = lastKey
+                break
+
+            lastKey = a.SK
+            message += line
+    else:
+        message = "You have not attended any films."
+
+    result = {
+        "type": DiscordResponse.CHANNEL_MESSAGE_WITH_SOURCE,
+        "data": {
+            "content": message,
+            "flags": DiscordFlag.EPHEMERAL_FLAG,
+        },
+    }
+    if nextKey:
+        result["data"]["components"] = [
+            {
+                "type": DiscordMessageComponent.ACTION_ROW,
+                "components": [
+                    {
+                        "type": DiscordMessageComponent.BUTTON,
+                        "label": "More History",
+                        "style": DiscordStyle.PRIMARY,
+                        "custom_id": MessageComponentID.MORE_ATTENDANCE
+                        + nextKey.removeprefix(prefix),
+                    }
+                ],
+            }
+        ]
+    return result
+
+
+def search_history(filmbot: FilmBot, user, options):
+    def parse_date(name):
+        if name not in options:
+            return None
+        try:
+            return dt.datetime.fromisoformat(options[name])
+        except ValueError:
+            raise UserError(
+                f"'{options[name]}' is not a valid date, use YYYY-MM-DD"
+            )
+
+    after = parse_date("from")
+    before = parse_date("to")
+    if before is not None:
+        # Include every film watched on the `to` date
+        before += dt.timedelta(days=1)
+
+    (films, nextKey) = filmbot.search_watched_films(
+        Limit=HISTORY_LIMIT,
+        DiscordUserID=options.get("nominator"),
+        TitlePrefix=options.get("title"),
+        After=after,
+        Before=before,
+    )
+    if films:
+        # Filtered searches can't be paged with a button as the filters
+        # won't fit in the button's `custom_id`
+        footer = "\nNot all matches are shown, narrow your search to see more."
+        message = "Here are the matching films that have been watched:\n"
+        member = filmbot.get_user(user)
+        for film in films:
+            line = display_watched(film, member) + "\n"
+            if len(message) + len(line) + len(footer) > MAX_MESSAGE_SIZE:
+                nextKey = film.SK
+                break
+
+            message += line
+
+        if nextKey:
+            message += footer
+    else:
+        message = "No watched films match your search."
+
+    return {
+        "type": DiscordResponse.CHANNEL_MESSAGE_WITH_SOURCE,
+        "data": {
+            "content": message,
+            "flags": DiscordFlag.EPHEMERAL_FLAG,
+        },
+    }
+
+
 def register_attendance(*, FilmBot, DiscordUserID, DateTime):
     status = FilmBot.record_attendance_vote(
         DiscordUserID=DiscordUserID, DateTime=DateTime
     )
+    # Attendance counts as a vote for the user's nomination
+    invalidate_nomination_choices(FilmBot.guildID)
     response = {
         "type": DiscordResponse.CHANNEL_MESSAGE_WITH_SOURCE,
         "data": {
@@ -183,39 +374,61 @@ def register_attendance(*, FilmBot, DiscordUserID, DateTime):
     return response
 
 
-def handle_application_command(event, client):
-    """
-    Handle the 6 application commands that we support:
-      * /nominate [FilmName]
-      * /vote [FilmID]
-      * /peek
-      * /watch [FilmID]
-      * /here
-    """
-    now = dt.datetime.now()
-    body = event["body-json"]
-    command = body["data"]["name"]
-    guild_id = body["guild_id"]
-    filmbot = FilmBot(DynamoDBClient=client, GuildID=guild_id)
-    user_id = body["member"]["user"]["id"]
-    if command == "nominate":
-        film_name_or_imdb = body["data"]["options"][0]["value"]
-        film_name, imdb_id = decode_film(film_name_or_imdb)
-
-        film_id = str(uuid1())
-        filmbot.nominate_film(
-            DiscordUserID=user_id,
-            FilmName=film_name,
-            IMDbID=imdb_id,
-            NewFilmID=film_id,
-            DateTime=now,
-        )
+@application_command("nominate")
+def nominate(filmbot: FilmBot, body, *, UserID, DateTime):
+    from enrichment import get_enrichment_queue
+
+    film_name_or_imdb = body["data"]["options"][0]["value"]
+    film_name, imdb_id = decode_film(film_name_or_imdb)
+
+    filmbot.nominate_film(
+        DiscordUserID=UserID,
+        FilmName=film_name,
+        IMDbID=imdb_id,
+        DateTime=DateTime,
+    )
+    if imdb_id is not None:
+        try:
+            get_enrichment_queue(filmbot.client).send(imdb_id)
+        except Exception as e:
+            # Without the metadata we fall back to default values
+            print(f"Failed to queue film for enrichment: {e}")
+    recent_nominations = filmbot.get_recent_nominations()
+    if filmbot.truncated:
+        invalidate_nomination_choices(filmbot.guildID)
+    else:
+        update_nomination_choices(filmbot.guildID, recent_nominations)
+    nominations = sorted(recent_nominations, key=Film.sortKey)
+    return {
+        "type": DiscordResponse.CHANNEL_MESSAGE_WITH_SOURCE,
+        "data": {
+            "content": (
+                f"<@{UserID}> has successfully nominated {film_name}.\n\n"
+                + "The current list of nominations are:\n"
+                + "\n".join(
+                    map(
+                        display_nomination,
+                        enumerate(nominations),
+                    )
+                )
+            )
+        },
+    }
+
+
+@application_command("vote")
+def vote(filmbot: FilmBot, body, *, UserID, DateTime):
+    film_id = body["data"]["options"][0]["value"]
+    status = filmbot.cast_preference_vote(DiscordUserID=UserID, FilmID=film_id)
+    invalidate_nomination_choices(filmbot.guildID)
+    film_name = filmbot.get_nominated_film(film_id).FilmName
+    if status == VotingStatus.COMPLETE:
         return {
             "type": DiscordResponse.CHANNEL_MESSAGE_WITH_SOURCE,
             "data": {
                 "content": (
-                    f"<@{user_id}> has successfully nominated {film_name}.\n\n"
-                    + "The current list of nominations are:\n"
+                    f"<@{UserID}> has voted for {film_name}.\n\n"
+                    "This was the final vote and the standings are:\n"
                     + "\n".join(
                         map(
                             display_nomination,
@@ -225,208 +438,299 @@ def handle_application_command(event, client):
                 )
             },
         }
-    elif command == "vote":
-        film_id = body["data"]["options"][0]["value"]
-        status = filmbot.cast_preference_vote(
-            DiscordUserID=user_id, FilmID=film_id
+    else:
+        return {
+            "type": DiscordResponse.CHANNEL_MESSAGE_WITH_SOURCE,
+            "data": {
+                "content": f"<@{UserID}> has voted for {film_name}",
+            },
+        }
+
+
+@application_command("peek", Ephemeral=True)
+def peek(filmbot: FilmBot, body, *, UserID, DateTime):
+    users = filmbot.get_users_by_nomination()
+    content = ""
+    components = None
+    if not users:
+        content += "There are no current nominations. Each user can nominate with the `/nominate` command."
+    else:
+        content += "The current list of nominations are:\n" + "\n".join(
+            map(
+                display_users_by_nomination,
+                enumerate(users),
+            )
         )
-        film_name = filmbot.get_nominated_film(film_id).FilmName
-        if status == VotingStatus.COMPLETE:
-            return {
-                "type": DiscordResponse.CHANNEL_MESSAGE_WITH_SOURCE,
-                "data": {
-                    "content": (
-                        f"<@{user_id}> has voted for {film_name}.\n\n"
-                        "This was the final vote and the standings are:\n"
-                        + "\n".join(
-                            map(
-                                display_nomination,
-                                enumerate(filmbot.get_nominations()),
-                            )
-                        )
-                    )
-                },
-            }
-        else:
-            return {
-                "type": DiscordResponse.CHANNEL_MESSAGE_WITH_SOURCE,
-                "data": {
-                    "content": f"<@{user_id}> has voted for {film_name}",
-                },
-            }
 
-    elif command == "peek":
-        users = filmbot.get_users_by_nomination()
-        content = ""
-        components = None
-        if not users:
-            content += "There are no current nominations. Each user can nominate with the `/nominate` command."
+        toNominate = list(
+            filter(lambda u: u["User"].NominatedFilmID is None, users)
+        )
+        toVote = list(filter(lambda u: u["User"].VoteID is None, users))
+
+        if toVote:
+            content += "\n\nand these users need to vote:\n"
+
+            def print_user(u):
+                return "- <@" + u["User"].DiscordUserID + ">"
+
+            content += "\n".join(map(print_user, toVote))
         else:
-            content += "The current list of nominations are:\n" + "\n".join(
-                map(
-                    display_users_by_nomination,
-                    enumerate(users),
-                )
-            )
+            content += "All users have voted."
+
+        if toNominate or toVote:
+            components = [
+                {
+                    "type": DiscordMessageComponent.ACTION_ROW,
+                    "components": [
+                        {
+                            "type": DiscordMessageComponent.BUTTON,
+                            "label": "Publicly Shame",
+                            "style": DiscordStyle.DANGER,
+                            "custom_id": MessageComponentID.SHAME,
+                        }
+                    ],
+                }
+            ]
 
-            toNominate = list(
-                filter(lambda u: u["User"].NominatedFilmID is None, users)
-            )
-            toVote = list(filter(lambda u: u["User"].VoteID is None, users))
+    result = {
+        "type": DiscordResponse.CHANNEL_MESSAGE_WITH_SOURCE,
+        "data": {
+            "content": content,
+            "flags": DiscordFlag.EPHEMERAL_FLAG,
+        },
+    }
+    if components:
+        result["data"]["components"] = components
+    return result
 
-            if toVote:
-                content += "\n\nand these users need to vote:\n"
 
-                def print_user(u):
-                    return "- <@" + u["User"].DiscordUserID + ">"
+@application_command("watch", Deferred=True)
+def watch(filmbot: FilmBot, body, *, UserID, DateTime):
+    from guild_ranking import record_watched_film
+    from warmup import record_screening
 
-                content += "\n".join(map(print_user, toVote))
-            else:
-                content += "All users have voted."
+    film_id = body["data"]["options"][0]["value"]
+    film = filmbot.start_watching_film(
+        FilmID=film_id, DateTime=DateTime, PresentUserIDs=[UserID]
+    )
+    invalidate_nomination_choices(filmbot.guildID)
+    try:
+        record_watched_film(filmbot, film)
+    except Exception as e:
+        # The ranking only affects the order of autocomplete results
+        print(f"Failed to update the guild's ranking: {e}")
+    try:
+        record_screening(filmbot.client, filmbot.guildID, DateTime)
+    except Exception as e:
+        # This only means that the next screening isn't warmed up for
+        print(f"Failed to record the screening: {e}")
+    return {
+        "type": DiscordResponse.CHANNEL_MESSAGE_WITH_SOURCE,
+        "data": {
+            "content": (
+                f"Started watching {film.FilmName}!\n\n"
+                + f"Everyone other than <@{UserID}> should record their attendance below or using `/here`.\n\n"
+                + f"<@{film.DiscordUserID}> can now nominated their next suggestion with `/nominate`.\n"
+            ),
+            "components": [
+                {
+                    "type": DiscordMessageComponent.ACTION_ROW,
+                    "components": [
+                        {
+                            "type": DiscordMessageComponent.BUTTON,
+                            "label": "Register Attendance",
+                            "style": DiscordStyle.PRIMARY,
+                            "custom_id": MessageComponentID.ATTENDANCE,
+                        }
+                    ],
+                }
+            ],
+        },
+    }
 
-            if toNominate or toVote:
-                components = [
-                    {
-                        "type": DiscordMessageComponent.ACTION_ROW,
-                        "components": [
-                            {
-                                "type": DiscordMessageComponent.BUTTON,
-                                "label": "Publicly Shame",
-                                "style": DiscordStyle.DANGER,
-                                "custom_id": MessageComponentID.SHAME,
-                            }
-                        ],
-                    }
-                ]
 
-        result = {
-            "type": DiscordResponse.CHANNEL_MESSAGE_WITH_SOURCE,
-            "data": {
-                "content": content,
-                "flags": DiscordFlag.EPHEMERAL_FLAG,
-            },
-        }
-        if components:
-            result["data"]["components"] = components
-        return result
-
-    elif command == "watch":
-        film_id = body["data"]["options"][0]["value"]
-        film = filmbot.start_watching_film(
-            FilmID=film_id, DateTime=now, PresentUserIDs=[user_id]
-        )
-        return {
-            "type": DiscordResponse.CHANNEL_MESSAGE_WITH_SOURCE,
-            "data": {
-                "content": (
-                    f"Started watching {film.FilmName}!\n\n"
-                    + f"Everyone other than <@{user_id}> should record their attendance below or using `/here`.\n\n"
-                    + f"<@{film.DiscordUserID}> can now nominated their next suggestion with `/nominate`.\n"
-                ),
-                "components": [
-                    {
-                        "type": DiscordMessageComponent.ACTION_ROW,
-                        "components": [
-                            {
-                                "type": DiscordMessageComponent.BUTTON,
-                                "label": "Register Attendance",
-                                "style": DiscordStyle.PRIMARY,
-                                "custom_id": MessageComponentID.ATTENDANCE,
-                            }
-                        ],
-                    }
-                ],
-            },
-        }
-    elif command == "here":
-        return register_attendance(
-            FilmBot=filmbot, DiscordUserID=user_id, DateTime=now
-        )
-    elif command == "history":
-        return get_history(
+@application_command("here")
+def here(filmbot: FilmBot, body, *, UserID, DateTime):
+    return register_attendance(
+        FilmBot=filmbot, DiscordUserID=UserID, DateTime=DateTime
+    )
+
+
+@application_command("history", Deferred=True, Ephemeral=True)
+def history(filmbot: FilmBot, body, *, UserID, DateTime):
+    options = {
+        option["name"]: option["value"]
+        for option in body["data"].get("options", [])
+    }
+    if options.pop("attended", False):
+        if options:
+            raise UserError(
+                "The `attended` option cannot be combined with other options"
+            )
+        return get_attendance_history(
             filmbot,
-            user_id,
-            MessagePrefix="Here are the films that have been watched:\n",
+            UserID,
+            MessagePrefix="Here are the films that you have attended:\n",
         )
-    else:
-        raise Exception(f"Unknown application command (/{command})")
+    elif options:
+        return search_history(filmbot, UserID, options)
+
+    return get_history(
+        filmbot,
+        UserID,
+        MessagePrefix="Here are the films that have been watched:\n",
+    )
+
+
+def note_truncated(response):
+    """Tell the user that `response` is missing results, if there's room."""
+    data = response.get("data", {})
+    content = data.get("content")
+    if content and len(content) + len(TRUNCATED_NOTE) <= MAX_MESSAGE_SIZE:
+        data["content"] = content + TRUNCATED_NOTE
+    return response
 
 
-def handle_autocomplete(event, client):
+def handle_application_command(event, client, Deadline=None):
     """
-    Handle the autocomplete for 3 of the application commands that we support:
+    Handle the 6 application commands that we support:
       * /nominate [FilmName]
       * /vote [FilmID]
+      * /peek
       * /watch [FilmID]
+      * /here
+      * /history [nominator] [title] [from] [to] [attended]
     """
+    now = dt.datetime.now()
     body = event["body-json"]
     command = body["data"]["name"]
-    guild_id = body["guild_id"]
-    if command == "nominate":
-        ia = IMDb()
+    handler = APPLICATION_COMMANDS.get(command)
+    if handler is None:
+        raise Exception(f"Unknown application command (/{command})")
 
-        partial_film_name = body["data"]["options"][0]["value"]
+    filmbot = FilmBot(
+        DynamoDBClient=client, GuildID=body["guild_id"], Deadline=Deadline
+    )
+    response = handler(
+        filmbot, body, UserID=body["member"]["user"]["id"], DateTime=now
+    )
+    if filmbot.truncated:
+        response = note_truncated(response)
+    return response
 
-        # Get 2x the number of results we expect as `search_movie` also
-        # finds TV shows etc. and we will trim it down to `MAX_RESULTS`
-        # afterwards.
-        MAX_RESULTS = 5
-        results = ia.search_movie(partial_film_name, results=MAX_RESULTS * 2)
-        return {
-            "type": DiscordResponse.APPLICATION_COMMAND_AUTOCOMPLETE_RESULT,
-            "data": {
-                "choices": list(
-                    map(
-                        lambda r: {
-                            "name": f"{r['title']} ({r['year']})",
-                            "value": encode_IMDB(
-                                r.movieID, f"{r['title']} ({r['year']})"
-                            ),
-                        },
-                        islice(
-                            filter(lambda r: r["kind"] == "movie", results),
-                            MAX_RESULTS,
-                        ),
-                    )
-                )
-            },
-        }
 
-    elif command == "vote":
-        user_id = body["member"]["user"]["id"]
-        filmbot = FilmBot(DynamoDBClient=client, GuildID=guild_id)
-        nominations = filmbot.get_nominations()
-
-        # Reorder to have the oldest film show up first and filter out
-        # our nomination as we can't vote for it.
-        final_nominations = sorted(
-            filter(lambda f: f.DiscordUserID != user_id, nominations),
-            key=lambda f: f.DateNominated,
-            reverse=True,
-        )
-        return {
-            "type": DiscordResponse.APPLICATION_COMMAND_AUTOCOMPLETE_RESULT,
-            "data": {
-                "choices": films_to_choices(final_nominations),
-            },
-        }
-    elif command == "watch":
-        filmbot = FilmBot(DynamoDBClient=client, GuildID=guild_id)
+@autocomplete("nominate")
+def nominate_autocomplete(client, body, *, Deadline):
+    from concurrent.futures import TimeoutError
+    from film_search import search_films, search_cache, provider_latencies
+    from guild_ranking import GuildRanking, prefetch_guild_ranking
 
-        # Keep the films ordered with the highest nominated film at the top
-        # as this is most likely the one we are going to watch
-        nominations = filmbot.get_nominations()
-        return {
-            "type": DiscordResponse.APPLICATION_COMMAND_AUTOCOMPLETE_RESULT,
-            "data": {
-                "choices": films_to_choices(nominations),
-            },
-        }
-    else:
+    partial_film_name = body["data"]["options"][0]["value"]
+
+    start = time.monotonic()
+    ranking = prefetch_guild_ranking(client, body["guild_id"])
+    (results, source) = search_films(
+        partial_film_name,
+        Limit=RANKING_CANDIDATES,
+        DynamoDBClient=client,
+        UserID=body["member"]["user"]["id"],
+        Deadline=Deadline,
+    )
+    try:
+        ranking = ranking.result(timeout=max(0, Deadline - time.monotonic()))
+    except TimeoutError:
+        # Better to show the results in the order they were found than none
+        ranking = GuildRanking()
+    results = ranking.rerank(results)[:MAX_NOMINATE_CHOICES]
+    latency = (time.monotonic() - start) * 1000
+    print(
+        f"nominate autocomplete source={source} latency={latency:.1f}ms "
+        f"hit_rate={search_cache.hit_rate:.2f} "
+        f"{source}_latencies=({provider_latencies.get(source, 'n/a')})"
+    )
+
+    choices = [
+        search_result_to_choice(r, Watched=ranking.hasWatched(r))
+        for r in results
+    ]
+    if not choices and partial_film_name.strip():
+        # Nominating without an IMDb ID is better than nothing
+        name = partial_film_name.strip()[:MAX_CHOICE_SIZE]
+        choices = [{"name": name, "value": name}]
+    return choices
+
+
+@autocomplete("vote")
+def vote_autocomplete(client, body, *, Deadline):
+    filmbot = FilmBot(
+        DynamoDBClient=client, GuildID=body["guild_id"], Deadline=Deadline
+    )
+
+    # Have the newest film show up first and filter out our nomination
+    # as we can't vote for it.
+    return get_nomination_choices(filmbot).vote_choices(
+        autocomplete_query(body), UserID=body["member"]["user"]["id"]
+    )
+
+
+@autocomplete("watch")
+def watch_autocomplete(client, body, *, Deadline):
+    filmbot = FilmBot(
+        DynamoDBClient=client, GuildID=body["guild_id"], Deadline=Deadline
+    )
+
+    # Keep the films ordered with the highest nominated film at the top
+    # as this is most likely the one we are going to watch
+    return get_nomination_choices(filmbot).watch_choices(
+        autocomplete_query(body)
+    )
+
+
+def interaction_age(event, Now=None):
+    """
+    Return how many seconds ago Discord sent the interaction in `event`, from
+    the time that it signed the request with, or 0 if we don't know.
+    """
+    header = event.get("params", {}).get("header", {})
+    try:
+        sent = int(header["x-signature-timestamp"])
+    except (KeyError, ValueError):
+        return 0
+    now = time.time() if Now is None else Now
+    # The timestamp is in whole seconds, so the interaction may have been sent
+    # up to a second after it
+    return max(0, now - (sent + 1))
+
+
+def handle_autocomplete(event, client, Deadline=None):
+    """
+    Handle the autocomplete for 3 of the application commands that we support:
+      * /nominate [FilmName]
+      * /vote [FilmID]
+      * /watch [FilmID]
+    """
+    body = event["body-json"]
+    command = body["data"]["name"]
+    handler = AUTOCOMPLETE_COMMANDS.get(command)
+    if handler is None:
         raise Exception(f"Autocomplete not supported for /{command}")
 
+    # Discord's clock starts when it sends the interaction, which may have
+    # waited on a cold start before it reached us
+    deadline = (
+        time.monotonic() - interaction_age(event) + AUTOCOMPLETE_DEADLINE
+    )
+    if Deadline is not None:
+        deadline = min(deadline, Deadline)
+    return {
+        "type": DiscordResponse.APPLICATION_COMMAND_AUTOCOMPLETE_RESULT,
+        "data": {
+            "choices": handler(client, body, Deadline=deadline),
+        },
+    }
+
 
-def handle_message_component(event, client):
+def handle_message_component(event, client, Deadline=None):
     body = event["body-json"]
     now = dt.datetime.now()
     component_type = body["data"]["component_type"]
@@ -435,13 +739,17 @@ def handle_message_component(event, client):
 
     custom_id = body["data"]["custom_id"]
     if custom_id == MessageComponentID.ATTENDANCE:
-        filmbot = FilmBot(DynamoDBClient=client, GuildID=body["guild_id"])
+        filmbot = FilmBot(
+            DynamoDBClient=client, GuildID=body["guild_id"], Deadline=Deadline
+        )
         user_id = body["member"]["user"]["id"]
         return register_attendance(
             FilmBot=filmbot, DiscordUserID=user_id, DateTime=now
         )
     elif custom_id == MessageComponentID.SHAME:
-        filmbot = FilmBot(DynamoDBClient=client, GuildID=body["guild_id"])
+        filmbot = FilmBot(
+            DynamoDBClient=client, GuildID=body["guild_id"], Deadline=Deadline
+        )
         users = filmbot.get_users().values()
         message = []
         toNominate = list(filter(lambda u: u.NominatedFilmID is None, users))
@@ -468,48 +776,143 @@ def handle_message_component(event, client):
             "data": {"content": "\n".join(message)},
         }
     elif custom_id.startswith(MessageComponentID.MORE_HISTORY):
-        filmbot = FilmBot(DynamoDBClient=client, GuildID=body["guild_id"])
+        filmbot = FilmBot(
+            DynamoDBClient=client, GuildID=body["guild_id"], Deadline=Deadline
+        )
         return get_history(
             filmbot,
             body["member"]["user"]["id"],
             nextKey=custom_id.removeprefix(MessageComponentID.MORE_HISTORY),
         )
+    elif custom_id.startswith(MessageComponentID.MORE_ATTENDANCE):
+        filmbot = FilmBot(
+            DynamoDBClient=client, GuildID=body["guild_id"], Deadline=Deadline
+        )
+        return get_attendance_history(
+            filmbot,
+            body["member"]["user"]["id"],
+            nextKey=custom_id.removeprefix(MessageComponentID.MORE_ATTENDANCE),
+        )
     else:
         raise Exception(
             f"Unknown 'custom_id' for button component ({custom_id})!"
         )
 
 
-def handle_discord(event, client):
+def user_error_response(e):
+    # If we get a `UserError` it's something we can display to the user
+    return {
+        "type": DiscordResponse.CHANNEL_MESSAGE_WITH_SOURCE,
+        "data": {
+            "content": str(e),
+            "flags": DiscordFlag.EPHEMERAL_FLAG,
+        },
+    }
+
+
+def run_application_command(event, client, Deadline=None):
+    try:
+        return handle_application_command(event, client, Deadline=Deadline)
+    except UserError as e:
+        return user_error_response(e)
+
+
+def defer_application_command(event, Deadline=None):
+    """
+    Send the application command in `event` to be run by a worker and return
+    Discord's acknowledgement if it is slow or there isn't much time left
+    before `Deadline`.  Otherwise, or if there is no worker or it couldn't be
+    sent to one, return `None` as it should be run now.
+    """
+    from deferral import get_deferrer
+
+    command = event["body-json"]["data"]["name"]
+    short_of_time = (
+        Deadline is not None and Deadline - time.monotonic() < MIN_SYNC_BUDGET
+    )
+    if command not in DEFERRED_COMMANDS and not short_of_time:
+        return None
+    deferrer = get_deferrer()
+    if deferrer is None:
+        return None
+    try:
+        deferrer.send(event)
+    except Exception as e:
+        print(f"Failed to defer /{command}, running it now: {e}")
+        return None
+
+    response = {"type": DiscordResponse.DEFERRED_CHANNEL_MESSAGE_WITH_SOURCE}
+    if command in EPHEMERAL_COMMANDS:
+        response["data"] = {"flags": DiscordFlag.EPHEMERAL_FLAG}
+    return response
+
+
+def handle_deferred(event, client, Deadline=None):
+    """
+    Run the application command in `event` that `handle_discord` deferred,
+    and deliver its response by editing the acknowledgement.  Return the
+    response.
+    """
+    from deferral import get_webhook_client
+
+    body = event["body-json"]
+    command = body["data"]["name"]
+    try:
+        response = run_application_command(event, client, Deadline=Deadline)
+    except Exception as e:
+        print(f"Deferred /{command} failed: {e}")
+        response = {
+            "type": DiscordResponse.CHANNEL_MESSAGE_WITH_SOURCE,
+            "data": {
+                "content": DEFERRED_FAILURE_MESSAGE,
+                "flags": DiscordFlag.EPHEMERAL_FLAG,
+            },
+        }
+
+    webhook = get_webhook_client()
+    data = dict(response["data"])
+    ephemeral = bool(data.pop("flags", 0) & DiscordFlag.EPHEMERAL_FLAG)
+    try:
+        if ephemeral and command not in EPHEMERAL_COMMANDS:
+            # The acknowledgement is public so can't be edited into an
+            # ephemeral message, e.g. a `UserError` from `/watch`
+            webhook.delete_original_response(
+                body["application_id"], body["token"]
+            )
+            webhook.create_followup_message(
+                body["application_id"], body["token"], response["data"]
+            )
+        else:
+            webhook.edit_original_response(
+                body["application_id"], body["token"], data
+            )
+    except Exception as e:
+        # Raising would have AWS Lambda retry, which would run it again
+        print(f"Failed to deliver deferred /{command}: {e}")
+    return response
+
+
+@traced("handle_discord")
+def handle_discord(event, client, Deadline=None):
+    """
+    Handle the Discord interaction in `event`, aiming to respond by the
+    `time.monotonic()` time `Deadline` if there is one.
+    """
     body = event["body-json"]
     type = body["type"]
     if type == DiscordRequest.PING:
         return {"type": DiscordResponse.PONG}
     elif type == DiscordRequest.APPLICATION_COMMAND:
-        try:
-            return handle_application_command(event, client)
-        except UserError as e:
-            # If we get a `UserError` it's something we can display to the user
-            return {
-                "type": DiscordResponse.CHANNEL_MESSAGE_WITH_SOURCE,
-                "data": {
-                    "content": str(e),
-                    "flags": DiscordFlag.EPHEMERAL_FLAG,
-                },
-            }
+        deferred = defer_application_command(event, Deadline=Deadline)
+        if deferred is not None:
+            return deferred
+        return run_application_command(event, client, Deadline=Deadline)
     elif type == DiscordRequest.MESSAGE_COMPONENT:
         try:
-            return handle_message_component(event, client)
+            return handle_message_component(event, client, Deadline=Deadline)
         except UserError as e:
-            # If we get a `UserError` it's something we can display to the user
-            return {
-                "type": DiscordResponse.CHANNEL_MESSAGE_WITH_SOURCE,
-                "data": {
-                    "content": str(e),
-                    "flags": DiscordFlag.EPHEMERAL_FLAG,
-                },
-            }
+            return user_error_response(e)
     elif type == DiscordRequest.APPLICATION_COMMAND_AUTOCOMPLETE:
-        return handle_autocomplete(event, client)
+        return handle_autocomplete(event, client, Deadline=Deadline)
     else:
         raise Exception(f"Unknown type ({type})!")
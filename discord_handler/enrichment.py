@@ -0,0 +1,121 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from catalog import FilmMetadata, get_catalog_entries, put_catalog_entry
+from film_search import get_imdb
+from tracing import span
+
+# Films nominated with an IMDb ID have their runtime, year and title looked
+# up on IMDb and added to the catalog, if they aren't already in it.  IMDb is
+# far too slow to ask while responding to Discord, so the films to enrich
+# are sent to the SQS queue at the URL in this environment variable and
+# enriched by `lambda_function.enrichment_handler`.  Without it, films are
+# enriched on a background thread of the container that nominated them.
+ENRICHMENT_QUEUE_URL = "FILMBOT_ENRICHMENT_QUEUE_URL"
+
+_enrichment_queue = None
+
+
+def parse_runtime(runtimes):
+    """Return the first runtime in minutes from IMDb's list of runtimes,
+    e.g. `["117", "USA:116"]`, or `None` if there isn't one."""
+    for runtime in runtimes or []:
+        minutes = runtime.rsplit(":", 1)[-1].strip()
+        if minutes.isdigit():
+            return int(minutes)
+    return None
+
+
+def fetch_film_metadata(IMDbID):
+    """Return the `FilmMetadata` for the specified `IMDbID` from IMDb."""
+    with span("imdb.get_movie", IMDbID=IMDbID):
+        movie = get_imdb().get_movie(IMDbID, info=["main"])
+    return FilmMetadata(
+        Runtime=parse_runtime(movie.get("runtimes")),
+        ReleaseYear=movie.get("year"),
+        IMDbTitle=movie.get("title"),
+    )
+
+
+def enrich_film(client, IMDbID):
+    """
+    Add the metadata for `IMDbID` to the catalog if it isn't already there.
+    Return whether it was added.
+    """
+    if IMDbID in get_catalog_entries(client, [IMDbID]):
+        return False
+    return put_catalog_entry(client, IMDbID, fetch_film_metadata(IMDbID))
+
+
+class SQSEnrichmentQueue:
+    """Sends films to enrich to an SQS queue."""
+
+    def __init__(self, sqs_client, QueueUrl):
+        self._sqs = sqs_client
+        self._queue_url = QueueUrl
+
+    def send(self, IMDbID):
+        self._sqs.send_message(
+            QueueUrl=self._queue_url,
+            MessageBody=json.dumps({"IMDbID": IMDbID}),
+        )
+
+
+class LocalEnrichmentQueue:
+    """
+    Enriches films on a background thread, for when there is no SQS queue.
+    In AWS Lambda this may not finish until the container next handles a
+    request, which is fine as the metadata isn't needed straight away.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._worker = ThreadPoolExecutor(max_workers=1)
+        self._pending = []
+
+    def send(self, IMDbID):
+        self._pending = [f for f in self._pending if not f.done()]
+        self._pending.append(self._worker.submit(self._enrich, IMDbID))
+
+    def _enrich(self, IMDbID):
+        try:
+            enrich_film(self._client, IMDbID)
+        except Exception as e:
+            print(f"Failed to enrich film {IMDbID}: {e}")
+
+    def wait(self):
+        """Wait for all films sent so far to be enriched."""
+        while self._pending:
+            self._pending.pop(0).result()
+
+
+def get_enrichment_queue(client):
+    """Return the queue that films to enrich are sent to."""
+    global _enrichment_queue
+    if _enrichment_queue is None:
+        queue_url = os.environ.get(ENRICHMENT_QUEUE_URL)
+        if queue_url:
+            import boto3
+
+            _enrichment_queue = SQSEnrichmentQueue(
+                boto3.client("sqs", region_name=os.environ["AWS_REGION"]),
+                QueueUrl=queue_url,
+            )
+        else:
+            _enrichment_queue = LocalEnrichmentQueue(client)
+    return _enrichment_queue
+
+
+def handle_enrichment_event(event, client):
+    """
+    Enrich the film in each message of the specified SQS `event`, and return
+    the IDs of the messages that failed so that only they are retried.
+    """
+    failures = []
+    for record in event["Records"]:
+        try:
+            enrich_film(client, json.loads(record["body"])["IMDbID"])
+        except Exception as e:
+            print(f"Failed to enrich film {record['body']}: {e}")
+            failures.append({"itemIdentifier": record["messageId"]})
+    return {"batchItemFailures": failures}
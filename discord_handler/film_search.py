@@ -0,0 +1,458 @@
+import os
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from itertools import islice
+from threading import Lock
+from cache import LRUCache
+from filmbot import (
+    TABLE_NAME,
+    batch_get,
+    batch_write,
+    keyed,
+    normalize_title,
+    unkeyed,
+)
+from metrics import LatencyHistogram
+from tracing import span
+from title_index import TitleIndex, SearchResult
+
+# Discord sends an autocomplete request for every character typed, so most
+# searches are repeated within a short time by the same user, or across
+# users nominating popular films
+SEARCH_CACHE_SIZE = 1024
+SEARCH_CACHE_TTL = 24 * 60 * 60
+
+# Searches that found nothing are cached for less time as they're more likely
+# to be a typo, or a film that IMDb doesn't know about yet
+SEARCH_CACHE_NEGATIVE_TTL = 10 * 60
+
+# Searches are also cached in the FilmBot table so that they outlive the
+# Lambda container that made them.  Each query has its own partition, which
+# is separate from any guild, and DynamoDB deletes items once they are past
+# their `ExpiresAt` time.
+SEARCH_PK = "PK"
+SEARCH_SK = "SK"
+SEARCH_Results = "Results"
+SEARCH_ExpiresAt = "ExpiresAt"
+
+# Each user's most recent search is kept so that as they type more of a
+# title we can filter it instead of searching again.  To make that work for
+# as long as possible, we search for more results than we show.
+SEARCH_SUPERSET_SIZE = 25
+RECENT_SEARCHES_SIZE = 256
+RECENT_SEARCHES_TTL = 5 * 60
+
+# These are created outside of `search_films` so they can be reused in AWS
+# Lambda "hot starts"
+search_cache = LRUCache(
+    MaxSize=SEARCH_CACHE_SIZE,
+    TTL=SEARCH_CACHE_TTL,
+    NegativeTTL=SEARCH_CACHE_NEGATIVE_TTL,
+)
+recent_searches = LRUCache(
+    MaxSize=RECENT_SEARCHES_SIZE, TTL=RECENT_SEARCHES_TTL
+)
+_imdb = None
+_title_index = None
+
+# Writes to the search cache table happen in the background so we can
+# respond to Discord without waiting for them.  In AWS Lambda they may not
+# finish until the container next handles a request, which is fine for a
+# cache.
+_table_writer = ThreadPoolExecutor(max_workers=1)
+_pending_table_writes = []
+# IMDb searches start writes from `_provider_pool` threads
+_pending_table_writes_lock = Lock()
+
+# Searches that might block are run on these threads so that we can stop
+# waiting for them at the deadline.  Searches we stop waiting for keep
+# running, so there are enough threads for a few of them to pile up.
+_provider_pool = ThreadPoolExecutor(max_workers=8)
+
+
+class SearchSource:
+    INDEX = "index"
+    CACHE = "cache"
+    TABLE = "table"
+    IMDB = "imdb"
+    REFINED = "refined"
+    TIMEOUT = "timeout"
+
+
+# How long each search provider takes, so that their budgets can be tuned
+provider_latencies = {
+    SearchSource.INDEX: LatencyHistogram(),
+    SearchSource.CACHE: LatencyHistogram(),
+    SearchSource.TABLE: LatencyHistogram(),
+    SearchSource.IMDB: LatencyHistogram(),
+}
+
+
+def get_imdb():
+    """Return the `IMDb` instance shared by all searches.  `imdb` takes a
+    long time to import, so it is only imported once it is needed."""
+    global _imdb
+    if _imdb is None:
+        from imdb import IMDb
+
+        _imdb = IMDb()
+    return _imdb
+
+
+def get_title_index():
+    """
+    Return the `TitleIndex` at the path in the `FILMBOT_TITLE_INDEX`
+    environment variable, or `None` if there isn't one.
+    """
+    global _title_index
+    if _title_index is None:
+        path = os.environ.get("FILMBOT_TITLE_INDEX")
+        if path and os.path.exists(path):
+            _title_index = TitleIndex(path)
+    return _title_index
+
+
+def search_key(query, Limit):
+    """Return the key of the search table item for the normalized `query`
+    with at most `Limit` results."""
+    return {
+        SEARCH_PK: {"S": f"AUTOCOMPLETE#{query}"},
+        SEARCH_SK: {"S": f"LIMIT#{Limit}"},
+    }
+
+
+def search_to_item(query, Limit, results, Now):
+    """Return the search table item for the specified `results` of the
+    normalized `query`, that were found at the specified `Now`."""
+    ttl = SEARCH_CACHE_TTL if results else SEARCH_CACHE_NEGATIVE_TTL
+    return {
+        **search_key(query, Limit),
+        SEARCH_Results: {
+            "L": [
+                {
+                    "M": {
+                        "IMDbID": {"S": r.IMDbID},
+                        "Title": {"S": r.Title},
+                        "Year": keyed(r.Year),
+                    }
+                }
+                for r in results
+            ]
+        },
+        SEARCH_ExpiresAt: {"N": str(int(Now + ttl))},
+    }
+
+
+def search_from_item(item, Now):
+    """Return the results in the specified search table `item`, or `None` if
+    it has expired by `Now` but hasn't been deleted yet."""
+    if int(item[SEARCH_ExpiresAt]["N"]) <= Now:
+        return None
+    return [
+        SearchResult(
+            IMDbID=r["M"]["IMDbID"]["S"],
+            Title=r["M"]["Title"]["S"],
+            Year=unkeyed(r["M"]["Year"]),
+        )
+        for r in item[SEARCH_Results]["L"]
+    ]
+
+
+def put_table_search_async(client, query, Limit, results):
+    """Start writing the specified `results` of the normalized `query` to the
+    search cache table."""
+    item = search_to_item(query, Limit, results, time.time())
+    write = _table_writer.submit(
+        client.put_item, TableName=TABLE_NAME, Item=item
+    )
+    with _pending_table_writes_lock:
+        finished = [w for w in _pending_table_writes if w.done()]
+        for w in finished:
+            _pending_table_writes.remove(w)
+        _pending_table_writes.append(write)
+
+    for w in finished:
+        if w.exception() is not None:
+            print(f"Failed to cache search: {w.exception()}")
+
+
+def wait_for_table_writes():
+    """Wait for all writes to the search cache table to finish, raising the
+    first error if any failed."""
+    while True:
+        with _pending_table_writes_lock:
+            if not _pending_table_writes:
+                return
+            write = _pending_table_writes.pop(0)
+        write.result()
+
+
+def search_imdb(query, Limit):
+    """Return an array of at most `Limit` `SearchResult`s from IMDb for the
+    films matching the normalized `query`."""
+
+    # Get 2x the number of results we expect as `search_movie` also finds TV
+    # shows etc. and we will trim it down to `Limit` afterwards.
+    movies = get_imdb().search_movie(query, results=Limit * 2)
+    return [
+        SearchResult(IMDbID=m.movieID, Title=m["title"], Year=m.get("year"))
+        for m in islice(
+            filter(lambda m: m.get("kind") == "movie", movies), Limit
+        )
+    ]
+
+
+def matches_query(title, words):
+    """Return whether each of the specified normalized query `words` is the
+    start of a word in the specified `title`."""
+    title_words = normalize_title(title).split()
+    return all(any(t.startswith(w) for t in title_words) for w in words)
+
+
+def refine_search(query, Limit, previous_query, superset, truncated):
+    """
+    Return an array of at most `Limit` `SearchResult`s for the normalized
+    `query` taken from the `superset` of results for `previous_query`, or
+    `None` if we need to search again.  `truncated` is whether there were
+    more results for `previous_query` than are in `superset`.
+    """
+    if not query.startswith(previous_query):
+        return None
+
+    words = query.split()
+    matches = [r for r in superset if matches_query(r.Title, words)]
+    if not matches or (truncated and len(matches) < Limit):
+        return None
+
+    # Titles that start with what has been typed so far are the most likely,
+    # otherwise keep the order IMDb gave us
+    matches.sort(key=lambda r: not normalize_title(r.Title).startswith(query))
+    return matches[:Limit]
+
+
+class SearchProvider(ABC):
+    """
+    A source of film search results.  `budget` is how many seconds a search
+    is expected to take, after which we start asking the next provider as
+    well.  `local` providers don't block so are asked directly.
+    """
+
+    name = None
+    budget = None
+    local = False
+
+    @abstractmethod
+    def search(self, query, Limit):
+        """Return an array of at most `Limit` `SearchResult`s for the
+        normalized `query`, or `None` if this provider can't answer it."""
+
+
+class TitleIndexProvider(SearchProvider):
+    name = SearchSource.INDEX
+    budget = 0.01
+    local = True
+
+    def __init__(self, title_index):
+        self._title_index = title_index
+
+    def search(self, query, Limit):
+        # Let IMDb find films that are newer than the index
+        return self._title_index.search(query, Limit=Limit) or None
+
+
+class MemoryCacheProvider(SearchProvider):
+    name = SearchSource.CACHE
+    budget = 0.001
+    local = True
+
+    def search(self, query, Limit):
+        return search_cache.get((query, Limit))
+
+
+class TableCacheProvider(SearchProvider):
+    name = SearchSource.TABLE
+    budget = 0.2
+
+    def __init__(self, client):
+        self._client = client
+
+    def search(self, query, Limit):
+        response = self._client.get_item(
+            TableName=TABLE_NAME, Key=search_key(query, Limit)
+        )
+        if "Item" not in response:
+            return None
+        results = search_from_item(response["Item"], time.time())
+        if results is not None:
+            search_cache.put((query, Limit), results)
+        return results
+
+
+class IMDbProvider(SearchProvider):
+    name = SearchSource.IMDB
+    budget = 2.0
+
+    def __init__(self, client):
+        self._client = client
+
+    def search(self, query, Limit):
+        # Fill the caches here so that a search which finishes after we stop
+        # waiting for it still helps the next keystroke
+        results = search_imdb(query, Limit)
+        search_cache.put((query, Limit), results)
+        if self._client is not None:
+            put_table_search_async(self._client, query, Limit, results)
+        return results
+
+
+def timed_search(provider, query, Limit):
+    """Search `provider` and record how long it took."""
+    start = time.monotonic()
+    try:
+        with span(f"search.{provider.name}", query=query, limit=Limit):
+            return provider.search(query, Limit)
+    finally:
+        provider_latencies[provider.name].record(time.monotonic() - start)
+
+
+def race_providers(providers, query, Limit, Deadline=None):
+    """
+    Search each of `providers` in turn, starting the next one as soon as the
+    previous one can't answer or is over its budget, and return a tuple of
+    the first results found and the name of the provider that found them.
+    Return `(None, None)` if none of them answered by the `Deadline` (a
+    `time.monotonic()` time).
+    """
+    pending = {}
+    remaining = list(providers)
+    hedge_at = None
+    while True:
+        now = time.monotonic()
+        if Deadline is not None and now >= Deadline:
+            return (None, None)
+
+        if remaining and (not pending or now >= hedge_at):
+            provider = remaining.pop(0)
+            if provider.local:
+                results = timed_search(provider, query, Limit)
+                if results is not None:
+                    return (results, provider.name)
+            else:
+                # Run with our context so that the provider's DynamoDB calls
+                # count towards this request's metrics
+                future = _provider_pool.submit(
+                    copy_context().run, timed_search, provider, query, Limit
+                )
+                pending[future] = provider
+                hedge_at = now + provider.budget
+            continue
+
+        if not pending:
+            return (None, None)
+
+        timeouts = []
+        if remaining:
+            timeouts.append(hedge_at - now)
+        if Deadline is not None:
+            timeouts.append(Deadline - now)
+        done, _ = wait(
+            pending,
+            timeout=min(timeouts) if timeouts else None,
+            return_when=FIRST_COMPLETED,
+        )
+        for future in done:
+            provider = pending.pop(future)
+            try:
+                results = future.result()
+            except Exception as e:
+                print(f"Search provider {provider.name} failed: {e}")
+                results = None
+            if results is not None:
+                return (results, provider.name)
+
+
+def search_films(
+    partial_film_name,
+    *,
+    Limit,
+    DynamoDBClient=None,
+    UserID=None,
+    Deadline=None,
+):
+    """
+    Return a tuple where the first element is an array of at most `Limit`
+    `SearchResult`s for the films matching `partial_film_name`, and the
+    second element is the `SearchSource` that answered the search.
+
+    We search the local title index if there is one, then IMDb, with
+    results cached in memory and, if `DynamoDBClient` is specified, in the
+    FilmBot table.  If `UserID` is specified then we answer from the results
+    of their last search when we can.  If nothing has answered by the
+    `Deadline` (a `time.monotonic()` time) then return no results and
+    `SearchSource.TIMEOUT`.
+    """
+    query = normalize_title(partial_film_name)
+    if not query:
+        return ([], SearchSource.CACHE)
+
+    if UserID is not None:
+        recent = recent_searches.get(UserID)
+        if recent is not None:
+            results = refine_search(query, Limit, *recent)
+            if results is not None:
+                return (results, SearchSource.REFINED)
+
+    providers = []
+    title_index = get_title_index()
+    if title_index is not None:
+        providers.append(TitleIndexProvider(title_index))
+    providers.append(MemoryCacheProvider())
+    if DynamoDBClient is not None:
+        providers.append(TableCacheProvider(DynamoDBClient))
+    providers.append(IMDbProvider(DynamoDBClient))
+
+    size = Limit if UserID is None else max(Limit, SEARCH_SUPERSET_SIZE)
+    results, source = race_providers(providers, query, size, Deadline)
+    if results is None:
+        return ([], SearchSource.TIMEOUT)
+
+    # The title index is fast enough that refining its results isn't worth
+    # it, and it ranks them differently
+    if UserID is not None and source != SearchSource.INDEX:
+        recent_searches.put(UserID, (query, results, len(results) >= size))
+    return (results[:Limit], source)
+
+
+def warm_search_cache(client, prefixes, *, Limit):
+    """
+    Search IMDb for each of the specified `prefixes` that isn't already in
+    the search cache table and add them to it.  Return the number of
+    searches that were added.
+    """
+    queries = list(dict.fromkeys(filter(None, map(normalize_title, prefixes))))
+
+    now = time.time()
+    cached = set(
+        item[SEARCH_PK]["S"]
+        for item in batch_get(
+            client, [search_key(query, Limit) for query in queries]
+        )
+        if search_from_item(item, now) is not None
+    )
+
+    requests = []
+    for query in queries:
+        if search_key(query, Limit)[SEARCH_PK]["S"] in cached:
+            continue
+        results = search_imdb(query, Limit)
+        requests.append(
+            {
+                "PutRequest": {
+                    "Item": search_to_item(query, Limit, results, time.time())
+                }
+            }
+        )
+    batch_write(client, requests)
+    return len(requests)
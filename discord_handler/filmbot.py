@@ -1,7 +1,11 @@
-from pprint import pprint
 from enum import Enum
 from UserError import UserError
-from datetime import timedelta, datetime
+from datetime import timedelta, datetime, timezone
+from uuid import UUID
+from secrets import randbits
+from random import uniform
+from time import monotonic, sleep
+from tracing import traced_methods
 
 TABLE_NAME = "FilmBotTable"
 
@@ -10,6 +14,13 @@ USER_SK = "SK"
 USER_NominatedFilmID = "NominatedFilmID"
 USER_VoteID = "VoteID"
 USER_AttendanceVoteID = "AttendanceVoteID"
+USER_MemberIndex = "MemberIndex"
+
+# A single record per guild that allocates each user's `MemberIndex`
+MEMBERS_PK = "PK"
+MEMBERS_SK = "SK"
+MEMBERS_SKValue = "MEMBERS"
+MEMBERS_NextMemberIndex = "NextMemberIndex"
 
 
 FILM_PK = "PK"
@@ -20,7 +31,94 @@ FILM_DiscordUserID = "DiscordUserID"
 FILM_CastVotes = "CastVotes"
 FILM_AttendanceVotes = "AttendanceVotes"
 FILM_UsersAttended = "UsersAttended"
+FILM_AttendedBitmap = "AttendedBitmap"
+FILM_AttendedIndexes = "AttendedIndexes"
 FILM_DateNominated = "DateNominated"
+FILM_NominatorHistory = "NominatorHistory"
+FILM_TitleHistory = "TitleHistory"
+FILM_Runtime = "Runtime"
+
+# Metadata about each film on IMDb is kept in its own partition, outside of
+# any guild, so that it's only stored and looked up once however many guilds
+# nominate the film.  Guild film records refer to it by their `IMDbID`.
+CATALOG_PK = "PK"
+CATALOG_SK = "SK"
+CATALOG_SKValue = "CATALOG"
+CATALOG_Runtime = "Runtime"
+CATALOG_ReleaseYear = "ReleaseYear"
+CATALOG_IMDbTitle = "IMDbTitle"
+
+# A record per IMDb ID that a guild has watched, so that nominating a film
+# that has already been watched is rejected by a single condition check
+WATCHEDIMDB_PK = "PK"
+WATCHEDIMDB_SK = "SK"
+WATCHEDIMDB_FilmName = "FilmName"
+WATCHEDIMDB_DateWatched = "DateWatched"
+
+ATTENDANCE_PK = "PK"
+ATTENDANCE_SK = "SK"
+ATTENDANCE_FilmName = "FilmName"
+
+# Sparse global secondary indexes over watched films only.  Both are
+# partitioned by the guild ID (`PK`) so that a filtered `/history` lookup is a
+# single indexed query within that guild.
+NOMINATOR_HISTORY_INDEX = "NominatorHistoryIndex"
+TITLE_HISTORY_INDEX = "TitleHistoryIndex"
+
+# Watched film sort key suffixes come in 2 formats:
+#   - v1: `DateTimeStarted.isoformat() + "#" + FilmID`
+#   - v2: `"~" + base32(DateTimeStarted) + "#" + compact(FilmID)`
+# where v2 timestamps are a fixed width so they sort correctly and v2
+# suffixes always sort after v1 suffixes.  This means that when migrating
+# from the most recently watched film backwards, the most recently watched
+# film is always the first in the partition.
+WATCHED_V2_MARKER = "~"
+
+# An upper bound for any watched film sort key suffix
+WATCHED_SUFFIX_MAX = "~~"
+
+# Crockford's base32 alphabet, which is in ASCII order so encoded
+# fixed-width integers sort in the same order as the integers
+BASE32_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+# The number of base32 digits for a microsecond timestamp (55 bits lasts
+# until the year 3111)
+WATCHED_TIME_WIDTH = 11
+
+# The prefix for UUID film IDs that have been compacted into base32
+COMPACT_UUID_PREFIX = "="
+
+# Film IDs are ULIDs: a 48-bit millisecond timestamp followed by 80 random
+# bits, both in base32, so that they sort in the order they were created.
+# Films nominated before this used uuid1 film IDs, which have no usable order.
+FILM_ID_TIME_WIDTH = 10
+FILM_ID_RANDOM_WIDTH = 16
+
+# The maximum number of requests in a single `batch_write_item` call
+MAX_BATCH_WRITE = 25
+
+# The maximum number of keys in a single `batch_get_item` call
+MAX_BATCH_GET = 100
+
+# The number of times we try to record attendance before giving up because
+# other requests keep changing the same records at the same time
+ATTENDANCE_RETRIES = 5
+
+# The most time in seconds that we wait before the first retry of recording
+# attendance.  This doubles for each retry, and we wait a random time up to it
+# so that users who voted together don't all retry together.
+ATTENDANCE_BACKOFF = 0.025
+
+# The minimum time between starting to watch films
+WATCH_COOLDOWN = timedelta(days=1)
+
+# Attendance can be recorded until a film's runtime plus `ATTENDANCE_GRACE`
+# after it started, or `DEFAULT_ATTENDANCE_WINDOW` if we don't know its
+# runtime.  This is capped below `WATCH_COOLDOWN` otherwise it would be
+# possible to have several films watched concurrently.
+ATTENDANCE_GRACE = timedelta(hours=1)
+DEFAULT_ATTENDANCE_WINDOW = timedelta(hours=4)
+MAX_ATTENDANCE_WINDOW = WATCH_COOLDOWN - timedelta(hours=1)
 
 
 class User:
@@ -31,11 +129,13 @@ class User:
         NominatedFilmID,
         VoteID,
         AttendanceVoteID,
+        MemberIndex=None,
     ):
         self.DiscordUserID = DiscordUserID
         self.NominatedFilmID = NominatedFilmID
         self.VoteID = VoteID
         self.AttendanceVoteID = AttendanceVoteID
+        self.MemberIndex = MemberIndex
 
     @property
     def SK(self):
@@ -47,13 +147,14 @@ class User:
             and self.NominatedFilmID == other.NominatedFilmID
             and self.VoteID == other.VoteID
             and self.AttendanceVoteID == other.AttendanceVoteID
+            and self.MemberIndex == other.MemberIndex
         )
 
     def __hash__(self):
         return hash(self.DiscordUserID)
 
     def toDict(self, *, GuildID):
-        return {
+        result = {
             "PK": {"S": GuildID},
             "SK": {"S": self.SK},
             "NominatedFilmID": keyed(self.NominatedFilmID),
@@ -61,6 +162,12 @@ class User:
             "AttendanceVoteID": keyed(self.AttendanceVoteID),
         }
 
+        # Users are only given a member index once they attend a film
+        if self.MemberIndex is not None:
+            result["MemberIndex"] = keyed(self.MemberIndex)
+
+        return result
+
     @staticmethod
     def fromDict(dict):
         return User(
@@ -68,7 +175,133 @@ class User:
             NominatedFilmID=unkeyed(dict[USER_NominatedFilmID]),
             VoteID=unkeyed(dict[USER_VoteID]),
             AttendanceVoteID=unkeyed(dict[USER_AttendanceVoteID]),
+            MemberIndex=unkeyed(dict.get(USER_MemberIndex, {"NULL": True})),
+        )
+
+
+def write_varints(numbers):
+    """Return the non-negative `numbers` as LEB128 variable length
+    integers, which take a byte for each 7 bits of each number."""
+    result = bytearray()
+    for n in numbers:
+        while n >= 0x80:
+            result.append(n & 0x7F | 0x80)
+            n >>= 7
+        result.append(n)
+    return bytes(result)
+
+
+def read_varints(data):
+    """Return the list of numbers in the `data` from `write_varints`."""
+    numbers = []
+    n = 0
+    shift = 0
+    for byte in data:
+        n |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            numbers.append(n)
+            n = 0
+            shift = 0
+    return numbers
+
+
+class MemberBitmap:
+    """
+    An immutable set of member indexes, where the member with `MemberIndex`
+    `i` is in the set if bit `i` is set.  As member indexes are allocated
+    densely, this takes 1 bit per member of the guild instead of around 20
+    bytes per attendee for a set of Discord IDs.
+
+    Member indexes are never freed, so a film attended by a few members with
+    high indexes would still take `maxIndex / 8` bytes as a plain bitmap.
+    `toBytes` run-length encodes the bitmap instead when that is smaller, so
+    that each run of attendees costs a few bytes however high their indexes.
+    """
+
+    # The first byte of `toBytes` says how the rest is encoded
+    RAW = 0
+    RUN_LENGTH = 1
+
+    def __init__(self, bits=0):
+        assert bits >= 0
+        self._bits = bits
+
+    @staticmethod
+    def fromIndexes(indexes):
+        bits = 0
+        for index in indexes:
+            bits |= 1 << index
+        return MemberBitmap(bits)
+
+    @staticmethod
+    def fromBytes(data):
+        encoding, data = (data[0], data[1:])
+        if encoding == MemberBitmap.RAW:
+            return MemberBitmap(int.from_bytes(data, "little"))
+
+        assert encoding == MemberBitmap.RUN_LENGTH
+        numbers = iter(read_varints(data))
+        bits = 0
+        position = 0
+        for gap, run in zip(numbers, numbers):
+            position += gap
+            bits |= ((1 << run) - 1) << position
+            position += run
+        return MemberBitmap(bits)
+
+    def runs(self):
+        """Yield a tuple of the number of clear bits before each run of set
+        bits, and the length of that run."""
+        bits = self._bits
+        while bits:
+            gap = (bits & -bits).bit_length() - 1
+            bits >>= gap
+            run = (~bits & (bits + 1)).bit_length() - 1
+            bits >>= run
+            yield (gap, run)
+
+    def toBytes(self):
+        raw = bytes([MemberBitmap.RAW]) + self._bits.to_bytes(
+            (self._bits.bit_length() + 7) // 8, "little"
         )
+        run_length = bytes([MemberBitmap.RUN_LENGTH]) + write_varints(
+            n for run in self.runs() for n in run
+        )
+        return min(raw, run_length, key=len)
+
+    def __contains__(self, index):
+        return (self._bits >> index) & 1 == 1
+
+    def __iter__(self):
+        bits = self._bits
+        index = 0
+        while bits:
+            if bits & 1:
+                yield index
+            bits >>= 1
+            index += 1
+
+    def __len__(self):
+        return bin(self._bits).count("1")
+
+    def __or__(self, other):
+        return MemberBitmap(self._bits | other._bits)
+
+    def __and__(self, other):
+        return MemberBitmap(self._bits & other._bits)
+
+    def __sub__(self, other):
+        return MemberBitmap(self._bits & ~other._bits)
+
+    def __eq__(self, other):
+        return isinstance(other, MemberBitmap) and self._bits == other._bits
+
+    def __hash__(self):
+        return hash(self._bits)
+
+    def __repr__(self):
+        return f"MemberBitmap({sorted(self)})"
 
 
 class Film:
@@ -84,6 +317,8 @@ class Film:
         UsersAttended,
         DateNominated,
         DateWatched,
+        AttendedBitmap=None,
+        Runtime=None,
     ):
         self.FilmID = FilmID
         self.FilmName = FilmName
@@ -95,12 +330,27 @@ class Film:
         self.DateNominated = DateNominated
         self.DateWatched = DateWatched
 
+        # Films watched after member indexes were added record attendance in
+        # `AttendedBitmap` and leave `UsersAttended` as `None`
+        self.AttendedBitmap = AttendedBitmap
+
+        # Copied from the film's catalog record, if there is one, when we
+        # start watching it.  It is in minutes.
+        self.Runtime = Runtime
+
+        # The sort key of a watched film that was read from a record that
+        # hasn't been migrated to v2 sort keys
+        self.LegacySK = None
+
     @property
     def SK(self):
+        if self.LegacySK is not None:
+            return self.LegacySK
+
         return (
             f"FILM#NOMINATED#{self.FilmID}"
             if self.DateWatched is None
-            else f"FILM#WATCHED#{datetime.isoformat(self.DateWatched)}#{self.FilmID}"
+            else f"FILM#WATCHED#{watched_suffix(self.DateWatched, self.FilmID)}"
         )
 
     def __eq__(self, other):
@@ -114,6 +364,8 @@ class Film:
             and self.UsersAttended == other.UsersAttended
             and self.DateNominated == other.DateNominated
             and self.DateWatched == other.DateWatched
+            and self.AttendedBitmap == other.AttendedBitmap
+            and self.Runtime == other.Runtime
         )
 
     def __repr__(self):
@@ -127,11 +379,36 @@ class Film:
             f"AttendanceVotes={self.AttendanceVotes}\n"
             f"UsersAttended={self.UsersAttended}\n"
             f"DateNominated={self.DateNominated}\n"
-            f"DateWatched={self.DateWatched}"
+            f"DateWatched={self.DateWatched}\n"
+            f"AttendedBitmap={self.AttendedBitmap}\n"
+            f"Runtime={self.Runtime}"
         )
 
+    def attendedBy(self, user):
+        """Return whether the specified `user` attended this film."""
+        if self.AttendedBitmap is not None:
+            return (
+                user.MemberIndex is not None
+                and user.MemberIndex in self.AttendedBitmap
+            )
+        return (
+            self.UsersAttended is not None
+            and user.DiscordUserID in self.UsersAttended
+        )
+
+    def attendanceCutoff(self):
+        """Return the datetime after which attendance can no longer be
+        recorded for this watched film."""
+        assert self.DateWatched is not None
+        window = (
+            DEFAULT_ATTENDANCE_WINDOW
+            if self.Runtime is None
+            else timedelta(minutes=self.Runtime) + ATTENDANCE_GRACE
+        )
+        return self.DateWatched + min(window, MAX_ATTENDANCE_WINDOW)
+
     def toDict(self, *, GuildID):
-        return {
+        result = {
             "PK": {"S": GuildID},
             "SK": {"S": self.SK},
             "FilmName": {"S": self.FilmName},
@@ -147,13 +424,38 @@ class Film:
             "DateNominated": {"S": datetime.isoformat(self.DateNominated)},
         }
 
+        if self.AttendedBitmap is not None:
+            result["AttendedBitmap"] = keyed(self.AttendedBitmap.toBytes())
+
+        if self.Runtime is not None:
+            result[FILM_Runtime] = keyed(self.Runtime)
+
+        # Only watched films have these attributes so that the history
+        # indexes stay sparse
+        if self.DateWatched is not None:
+            suffix = self.SK.removeprefix("FILM#WATCHED#")
+            result["NominatorHistory"] = {
+                "S": f"{self.DiscordUserID}#{suffix}"
+            }
+            result["TitleHistory"] = {
+                "S": f"{normalize_title(self.FilmName)}#{suffix}"
+            }
+
+        return result
+
     @staticmethod
     def fromDict(dict):
-        sk_parts = dict[FILM_SK]["S"].split("#")
+        sk = dict[FILM_SK]["S"]
+        sk_parts = sk.split("#")
         assert len(sk_parts) >= 3
         assert sk_parts[0] == "FILM"
-        return Film(
-            FilmID=sk_parts[-1],
+        if sk_parts[1] == "WATCHED":
+            date_watched, film_id = extract_watched(sk)
+        else:
+            date_watched, film_id = (None, sk_parts[-1])
+
+        film = Film(
+            FilmID=film_id,
             FilmName=dict[FILM_FilmName]["S"],
             IMDbID=unkeyed(dict[FILM_IMDbID]),
             DiscordUserID=dict[FILM_DiscordUserID]["S"],
@@ -163,12 +465,21 @@ class Film:
             DateNominated=datetime.fromisoformat(
                 dict[FILM_DateNominated]["S"]
             ),
-            DateWatched=(
-                datetime.fromisoformat(sk_parts[2])
-                if sk_parts[1] == "WATCHED"
-                else None
-            ),
+            DateWatched=date_watched,
         )
+        if FILM_AttendedBitmap in dict:
+            film.AttendedBitmap = MemberBitmap.fromBytes(
+                unkeyed(dict[FILM_AttendedBitmap])
+            )
+        if FILM_AttendedIndexes in dict:
+            film.AttendedBitmap = (
+                film.AttendedBitmap or MemberBitmap()
+            ) | MemberBitmap.fromIndexes(unkeyed(dict[FILM_AttendedIndexes]))
+        if FILM_Runtime in dict:
+            film.Runtime = unkeyed(dict[FILM_Runtime])
+        if film.SK != sk:
+            film.LegacySK = sk
+        return film
 
     @staticmethod
     def sortKey(film):
@@ -185,15 +496,188 @@ class Film:
         )
 
 
+class Attendance:
+    def __init__(
+        self,
+        *,
+        DiscordUserID,
+        FilmID,
+        FilmName,
+        DateWatched,
+    ):
+        self.DiscordUserID = DiscordUserID
+        self.FilmID = FilmID
+        self.FilmName = FilmName
+        self.DateWatched = DateWatched
+
+        # The sort key of a record that hasn't been migrated to v2 sort keys
+        self.LegacySK = None
+
+    @property
+    def SK(self):
+        if self.LegacySK is not None:
+            return self.LegacySK
+
+        return f"ATTENDED#{self.DiscordUserID}#{watched_suffix(self.DateWatched, self.FilmID)}"
+
+    def __eq__(self, other):
+        return (
+            self.DiscordUserID == other.DiscordUserID
+            and self.FilmID == other.FilmID
+            and self.FilmName == other.FilmName
+            and self.DateWatched == other.DateWatched
+        )
+
+    def __repr__(self):
+        return (
+            f"SK={self.SK}\n"
+            f"DiscordUserID={self.DiscordUserID}\n"
+            f"FilmID={self.FilmID}\n"
+            f"FilmName={self.FilmName}\n"
+            f"DateWatched={self.DateWatched}"
+        )
+
+    def toDict(self, *, GuildID):
+        return {
+            "PK": {"S": GuildID},
+            "SK": {"S": self.SK},
+            "FilmName": {"S": self.FilmName},
+        }
+
+    @staticmethod
+    def fromDict(dict):
+        sk = dict[ATTENDANCE_SK]["S"]
+        ATTENDED, user_id, suffix = sk.split("#", 2)
+        assert ATTENDED == "ATTENDED"
+        date_watched, film_id = parse_watched_suffix(suffix)
+        attendance = Attendance(
+            DiscordUserID=user_id,
+            FilmID=film_id,
+            FilmName=dict[ATTENDANCE_FilmName]["S"],
+            DateWatched=date_watched,
+        )
+        if attendance.SK != sk:
+            attendance.LegacySK = sk
+        return attendance
+
+
+def normalize_title(FilmName):
+    """Return the specified `FilmName` in a canonical form for searching,
+    ignoring case and differences in whitespace."""
+    return " ".join(FilmName.casefold().split())
+
+
+def encode_base32(value, width):
+    """Return the specified non-negative integer `value` encoded as exactly
+    `width` base32 digits."""
+    assert 0 <= value < 32**width
+    digits = []
+    for _ in range(width):
+        digits.append(BASE32_ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(digits))
+
+
+def decode_base32(digits):
+    """Return the integer encoded by the specified base32 `digits`."""
+    value = 0
+    for digit in digits:
+        value = (value << 5) | BASE32_ALPHABET.index(digit)
+    return value
+
+
+def watched_time(DateTime):
+    """Return the specified `DateTime` as a fixed-width base32 string.  Naive
+    datetimes are assumed to be UTC."""
+    if DateTime.tzinfo is not None:
+        DateTime = DateTime.astimezone(timezone.utc).replace(tzinfo=None)
+    micros = (DateTime - datetime(1970, 1, 1)) // timedelta(microseconds=1)
+    return encode_base32(micros, WATCHED_TIME_WIDTH)
+
+
+def new_film_id(DateTime):
+    """Return a new film ID that sorts after the IDs of all films created
+    before the specified `DateTime`.  Naive datetimes are assumed to be
+    UTC."""
+    if DateTime.tzinfo is not None:
+        DateTime = DateTime.astimezone(timezone.utc).replace(tzinfo=None)
+    millis = (DateTime - datetime(1970, 1, 1)) // timedelta(milliseconds=1)
+    return encode_base32(millis, FILM_ID_TIME_WIDTH) + encode_base32(
+        randbits(5 * FILM_ID_RANDOM_WIDTH), FILM_ID_RANDOM_WIDTH
+    )
+
+
+def is_time_ordered_film_id(FilmID):
+    """Return whether the specified `FilmID` was created by `new_film_id`."""
+    return len(FilmID) == FILM_ID_TIME_WIDTH + FILM_ID_RANDOM_WIDTH and all(
+        c in BASE32_ALPHABET for c in FilmID
+    )
+
+
+def compact_film_id(FilmID):
+    """Return the specified `FilmID` in its most compact form for a sort
+    key."""
+    try:
+        uuid = UUID(FilmID)
+    except ValueError:
+        return FilmID
+
+    # Only compact canonical UUIDs so that we can round trip them
+    if str(uuid) != FilmID:
+        return FilmID
+    return COMPACT_UUID_PREFIX + encode_base32(uuid.int, 26)
+
+
+def expand_film_id(compact):
+    """Return the film ID that was compacted into `compact` by
+    `compact_film_id`."""
+    if compact.startswith(COMPACT_UUID_PREFIX):
+        return str(UUID(int=decode_base32(compact[1:])))
+    return compact
+
+
+def watched_suffix(DateTime, FilmID):
+    """Return the part of a watched film's sort key that follows
+    `FILM#WATCHED#` for a film with the specified `FilmID` that was watched at
+    the specified `DateTime`."""
+    return (
+        f"{WATCHED_V2_MARKER}{watched_time(DateTime)}#"
+        f"{compact_film_id(FilmID)}"
+    )
+
+
+def watched_bound(DateTime):
+    """Return a string that sorts after the suffix of all films watched
+    before the specified `DateTime` and before all those watched at or after
+    it."""
+    return f"{WATCHED_V2_MARKER}{watched_time(DateTime)}"
+
+
+def parse_watched_suffix(suffix):
+    """Return a tuple of the watched datetime and the film ID from the
+    specified `suffix` in either the v1 or v2 format."""
+    watch_time, film_id = suffix.split("#")
+    if watch_time.startswith(WATCHED_V2_MARKER):
+        micros = decode_base32(watch_time[1:])
+        return (
+            datetime(1970, 1, 1) + timedelta(microseconds=micros),
+            expand_film_id(film_id),
+        )
+    else:
+        return (datetime.fromisoformat(watch_time), film_id)
+
+
 def extract_SK(sortKeyValue):
     return sortKeyValue.split("#")[-1]
 
 
 def extract_watched(sortKeyValue):
-    FILM, WATCHED, watch_time, film_id = sortKeyValue.split("#")
+    """Return a tuple of the watched datetime and the film ID from the
+    specified watched film `sortKeyValue` in either the v1 or v2 format."""
+    FILM, WATCHED, suffix = sortKeyValue.split("#", 2)
     assert FILM == "FILM"
     assert WATCHED == "WATCHED"
-    return watch_time, film_id
+    return parse_watched_suffix(suffix)
 
 
 def keyed(v):
@@ -204,8 +688,12 @@ def keyed(v):
         return {"N": str(v)}
     elif isinstance(v, str):
         return {"S": v}
+    elif isinstance(v, set) and v and all(isinstance(i, int) for i in v):
+        return {"NS": list(map(str, v))}
     elif isinstance(v, set):
         return {"SS": list(v)}
+    elif isinstance(v, bytes):
+        return {"B": v}
     elif v is None:
         return {"NULL": True}
     else:
@@ -233,6 +721,10 @@ def unkeyed(v):
             return int(value)
         elif type_name == "SS":
             return set(value)
+        elif type_name == "NS":
+            return set(map(int, value))
+        elif type_name == "B":
+            return bytes(value)
         elif type_name == "NULL":
             return None
         else:
@@ -249,6 +741,40 @@ def unkey_map(map):
     return result
 
 
+def watched_imdb_sk(IMDbID):
+    return f"WATCHEDIMDB#{IMDbID}"
+
+
+def catalog_key(IMDbID):
+    """Return the key of the catalog record for `IMDbID`."""
+    return {
+        CATALOG_PK: {"S": f"CATALOG#{IMDbID}"},
+        CATALOG_SK: {"S": CATALOG_SKValue},
+    }
+
+
+def batch_get(client, keys):
+    """Return an array of the items with the specified `keys` that exist,
+    read with `batch_get_item`."""
+    items = []
+    for i in range(0, len(keys), MAX_BATCH_GET):
+        unprocessed = {TABLE_NAME: {"Keys": keys[i : i + MAX_BATCH_GET]}}
+        while unprocessed:
+            response = client.batch_get_item(RequestItems=unprocessed)
+            items += response["Responses"].get(TABLE_NAME, [])
+            unprocessed = response.get("UnprocessedKeys", {})
+    return items
+
+
+def batch_write(client, requests):
+    """Write all of the specified `requests` with `batch_write_item`."""
+    for i in range(0, len(requests), MAX_BATCH_WRITE):
+        unprocessed = {TABLE_NAME: requests[i : i + MAX_BATCH_WRITE]}
+        while unprocessed:
+            response = client.batch_write_item(RequestItems=unprocessed)
+            unprocessed = response.get("UnprocessedItems", {})
+
+
 class VotingStatus(Enum):
     UNCOMPLETE = 0
     COMPLETE = 1
@@ -259,10 +785,18 @@ class AttendanceStatus(Enum):
     ALREADY_REGISTERED = 1
 
 
+@traced_methods
 class FilmBot:
-    def __init__(self, DynamoDBClient, GuildID):
+    def __init__(self, DynamoDBClient, GuildID, Deadline=None):
+        """
+        `Deadline` is the `time.monotonic()` time that we should respond by,
+        after which reads that are only displayed return what they have read
+        so far (see `truncated`) and we stop retrying.
+        """
         self._dynamodb_client = DynamoDBClient
         self._guildID = GuildID
+        self._deadline = Deadline
+        self._truncated = False
 
     @property
     def client(self):
@@ -272,14 +806,29 @@ class FilmBot:
     def guildID(self):
         return self._guildID
 
-    def __query(self, kwargs):
+    @property
+    def outOfTime(self):
+        return self._deadline is not None and monotonic() >= self._deadline
+
+    @property
+    def truncated(self):
+        """Whether any results have been left out as we ran out of time."""
+        return self._truncated
+
+    def __query(self, kwargs, Truncate=False):
         """
         Run a DynamoDB query with the specified `kwargs` and return the result.
+        If `Truncate` is set, stop reading pages once we are out of time and
+        return what we have so far.  This must only be used for results that
+        are displayed, not for results that we go on to write from.
         """
         start_key = None
         results = []
         while True:
             if start_key:
+                if Truncate and self.outOfTime:
+                    self._truncated = True
+                    return results
                 kwargs["ExclusiveStartKey"] = start_key
             response = self.client.query(**kwargs)
             results += response["Items"]
@@ -311,6 +860,73 @@ class FilmBot:
 
         return {user.DiscordUserID: user for user in users}
 
+    def get_user(self, DiscordUserID):
+        """
+        Return the `User` for the specified `DiscordUserID`, or `None` if they
+        are not registered.
+        """
+        response = self.client.get_item(
+            TableName=TABLE_NAME,
+            Key={
+                USER_PK: {"S": self.guildID},
+                USER_SK: {"S": f"DISCORDUSER#{DiscordUserID}"},
+            },
+        )
+        if "Item" not in response:
+            return None
+        return User.fromDict(response["Item"])
+
+    def __member_index(self, user):
+        """
+        Return the `MemberIndex` of the specified `user`, allocating them the
+        next unused index if they don't have one yet.
+
+        The counter and the user are updated separately, outside of the
+        transaction that records attendance, so an index can be orphaned:
+        when another request allocates the user an index first, or when we
+        fail between the two writes.  An orphaned index is never set in any
+        `MemberBitmap`, which only costs a clear bit that run-length encoding
+        makes cheap, and it is never reused, so it can't be mistaken for
+        another member.  An index allocated before a transaction that fails
+        stays with its user and is used by their next attempt.
+        """
+        if user.MemberIndex is not None:
+            return user.MemberIndex
+
+        response = self.client.update_item(
+            TableName=TABLE_NAME,
+            Key={
+                MEMBERS_PK: {"S": self.guildID},
+                MEMBERS_SK: {"S": MEMBERS_SKValue},
+            },
+            ExpressionAttributeValues={":One": {"N": "1"}},
+            UpdateExpression=f"ADD {MEMBERS_NextMemberIndex} :One",
+            ReturnValues="UPDATED_NEW",
+        )
+        index = int(response["Attributes"][MEMBERS_NextMemberIndex]["N"]) - 1
+
+        try:
+            self.client.update_item(
+                TableName=TABLE_NAME,
+                Key={
+                    USER_PK: {"S": self.guildID},
+                    USER_SK: {"S": user.SK},
+                },
+                ExpressionAttributeValues={":Index": {"N": str(index)}},
+                ConditionExpression=(
+                    f"attribute_exists({USER_SK}) AND "
+                    f"attribute_not_exists({USER_MemberIndex})"
+                ),
+                UpdateExpression=f"SET {USER_MemberIndex} = :Index",
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            # Another request allocated this user an index first, so use
+            # theirs and leave `index` unused
+            return self.get_user(user.DiscordUserID).MemberIndex
+
+        user.MemberIndex = index
+        return index
+
     def get_nominated_film(self, FilmID):
         """
         Return a `Film` object for the nominated film with the specified `FilmID`.
@@ -336,24 +952,39 @@ class FilmBot:
         """Return an array of currently nominated films in the order that they should
         be watched based on their vote tally."""
 
-        nominations = map(
-            Film.fromDict,
-            self.__query(
-                {
-                    "TableName": TABLE_NAME,
-                    "ExpressionAttributeValues": {
-                        ":GuildID": {"S": self.guildID},
-                        ":FilmPrefix": {"S": "FILM#NOMINATED#"},
+        return sorted(self.get_recent_nominations(), key=Film.sortKey)
+
+    def get_recent_nominations(self, Truncate=True):
+        """Return an array of currently nominated films ordered by most
+        recently nominated.  Unless `Truncate` is `False`, we stop reading
+        them at the deadline (see `truncated`)."""
+
+        nominations = list(
+            map(
+                Film.fromDict,
+                self.__query(
+                    {
+                        "TableName": TABLE_NAME,
+                        "ExpressionAttributeValues": {
+                            ":GuildID": {"S": self.guildID},
+                            ":FilmPrefix": {"S": "FILM#NOMINATED#"},
+                        },
+                        "KeyConditionExpression": (
+                            f"{FILM_PK} = :GuildID AND "
+                            f"begins_with({FILM_SK}, :FilmPrefix)"
+                        ),
+                        "ScanIndexForward": False,
                     },
-                    "KeyConditionExpression": (
-                        f"{FILM_PK} = :GuildID AND "
-                        f"begins_with({FILM_SK}, :FilmPrefix)"
-                    ),
-                }
-            ),
+                    Truncate=Truncate,
+                ),
+            )
         )
 
-        return sorted(nominations, key=Film.sortKey)
+        # Time ordered film IDs are already in order, but uuid1 film IDs from
+        # before them are not
+        if all(is_time_ordered_film_id(n.FilmID) for n in nominations):
+            return nominations
+        return sorted(nominations, key=lambda n: n.DateNominated, reverse=True)
 
     def get_users_by_nomination(self):
         """Return an array of users with details of their (optionally) nominated films.
@@ -380,7 +1011,8 @@ class FilmBot:
                     f"{FILM_SK} BETWEEN :UserPrefix AND :FilmPrefix"
                 ),
                 "ScanIndexForward": False,  # Backwards so we get films first
-            }
+            },
+            Truncate=True,
         ):
             sk_parts = result[FILM_SK]["S"].split("#")
             if sk_parts[0] == "FILM":
@@ -471,6 +1103,156 @@ class FilmBot:
             LastEvaluateKey = LastEvaluateKey[FILM_SK]["S"]
         return (list(map(Film.fromDict, response["Items"])), LastEvaluateKey)
 
+    def search_watched_films(
+        self,
+        *,
+        Limit,
+        DiscordUserID=None,
+        TitlePrefix=None,
+        After=None,
+        Before=None,
+        ExclusiveStartKey=None,
+    ):
+        """
+        Return a tuple where the first element is an array of maximum `Limit`
+        watched films that were nominated by the optionally specified
+        `DiscordUserID`, have a title starting with the optionally specified
+        `TitlePrefix`, and were watched at or after the optionally specified
+        `After` and before the optionally specified `Before` datetimes.  The
+        second element is a string to pass as `ExclusiveStartKey` to get the
+        next batch of films, or `None` if there are no more films.
+
+        Films are ordered by most recently watched, except when searching by
+        `TitlePrefix` without `DiscordUserID` where they are ordered by title.
+        """
+        # Note that date ranges only include films with v2 sort keys, as v1
+        # sort keys sort before every v2 one whatever their date
+        if After is not None:
+            lower = watched_bound(After)
+        elif Before is not None:
+            lower = WATCHED_V2_MARKER
+        else:
+            lower = ""
+        upper = WATCHED_SUFFIX_MAX if Before is None else watched_bound(Before)
+        values = {":GuildID": {"S": self.guildID}}
+        query = {
+            "TableName": TABLE_NAME,
+            "ExpressionAttributeValues": values,
+            "ScanIndexForward": False,
+            "Limit": Limit,
+        }
+
+        # Use whichever index can satisfy the most selective filter as a key
+        # condition and apply the remaining filters to the results
+        if DiscordUserID is not None:
+            index_key = FILM_NominatorHistory
+            query["IndexName"] = NOMINATOR_HISTORY_INDEX
+            values[":Lower"] = {"S": f"{DiscordUserID}#{lower}"}
+            values[":Upper"] = {"S": f"{DiscordUserID}#{upper}"}
+            query["KeyConditionExpression"] = (
+                f"{FILM_PK} = :GuildID AND "
+                f"{FILM_NominatorHistory} BETWEEN :Lower AND :Upper"
+            )
+            if TitlePrefix is not None:
+                values[":TitlePrefix"] = {"S": normalize_title(TitlePrefix)}
+                query["FilterExpression"] = (
+                    f"begins_with({FILM_TitleHistory}, :TitlePrefix)"
+                )
+        elif TitlePrefix is not None:
+            index_key = FILM_TitleHistory
+            query["IndexName"] = TITLE_HISTORY_INDEX
+            query["ScanIndexForward"] = True
+            values[":TitlePrefix"] = {"S": normalize_title(TitlePrefix)}
+            query["KeyConditionExpression"] = (
+                f"{FILM_PK} = :GuildID AND "
+                f"begins_with({FILM_TitleHistory}, :TitlePrefix)"
+            )
+            if After is not None or Before is not None:
+                values[":Lower"] = {"S": f"FILM#WATCHED#{lower}"}
+                values[":Upper"] = {"S": f"FILM#WATCHED#{upper}"}
+                query["FilterExpression"] = (
+                    f"{FILM_SK} BETWEEN :Lower AND :Upper"
+                )
+        else:
+            index_key = FILM_SK
+            values[":Lower"] = {"S": f"FILM#WATCHED#{lower}"}
+            values[":Upper"] = {"S": f"FILM#WATCHED#{upper}"}
+            query["KeyConditionExpression"] = (
+                f"{FILM_PK} = :GuildID AND "
+                f"{FILM_SK} BETWEEN :Lower AND :Upper"
+            )
+
+        if ExclusiveStartKey:
+            # All index sort keys end with the suffix of the film's sort key
+            # so we can reconstruct the full key from the index's sort key
+            suffix = "#".join(ExclusiveStartKey.rsplit("#", 2)[-2:])
+            query["ExclusiveStartKey"] = {
+                FILM_PK: {"S": self.guildID},
+                FILM_SK: {"S": f"FILM#WATCHED#{suffix}"},
+                index_key: {"S": ExclusiveStartKey},
+            }
+
+        # `Limit` applies to the items read before they are filtered, so keep
+        # reading until we have `Limit` films or there are no more to read
+        items = []
+        while True:
+            response = self.client.query(**query)
+            items += response["Items"]
+            LastEvaluateKey = response.get("LastEvaluatedKey", None)
+            if len(items) >= Limit or not LastEvaluateKey:
+                break
+            query["ExclusiveStartKey"] = LastEvaluateKey
+
+        # Simplify the `LastEvaluateKey` to just the index's sort key value,
+        # which is that of the last film we return if we read too many
+        if len(items) > Limit:
+            items = items[:Limit]
+            LastEvaluateKey = items[-1][index_key]["S"]
+        elif LastEvaluateKey:
+            LastEvaluateKey = LastEvaluateKey[index_key]["S"]
+        return (list(map(Film.fromDict, items)), LastEvaluateKey)
+
+    def get_attendance_after(
+        self, *, DiscordUserID, Limit, ExclusiveStartKey=None
+    ):
+        """
+        Return a tuple where the first element is an array of maximum `Limit`
+        `Attendance` objects for the films that `DiscordUserID` attended,
+        ordered by most recently watched, and the second element is a string
+        representing the `ExclusiveStartKey` parameter to pass into the next
+        call to get the next batch.  If there are no more films then the
+        second element is `None`.
+        """
+        query = {
+            "TableName": TABLE_NAME,
+            "ExpressionAttributeValues": {
+                ":GuildID": {"S": self.guildID},
+                ":AttendedPrefix": {"S": f"ATTENDED#{DiscordUserID}#"},
+            },
+            "KeyConditionExpression": (
+                f"{ATTENDANCE_PK} = :GuildID AND "
+                f"begins_with({ATTENDANCE_SK}, :AttendedPrefix)"
+            ),
+            "ScanIndexForward": False,
+            "Limit": Limit,
+        }
+        if ExclusiveStartKey:
+            query["ExclusiveStartKey"] = {
+                "PK": {"S": self.guildID},
+                "SK": {"S": ExclusiveStartKey},
+            }
+
+        response = self.client.query(**query)
+
+        # Simplify the `LastEvaluateKey` to just the sort key value
+        LastEvaluateKey = response.get("LastEvaluatedKey", None)
+        if LastEvaluateKey:
+            LastEvaluateKey = LastEvaluateKey[ATTENDANCE_SK]["S"]
+        return (
+            list(map(Attendance.fromDict, response["Items"])),
+            LastEvaluateKey,
+        )
+
     def get_all_films(self):
         """
         Return an array watched and unwatched films in the order that they were
@@ -500,17 +1282,23 @@ class FilmBot:
         *,
         DiscordUserID,
         FilmName,
-        NewFilmID,
         IMDbID,
         DateTime,
+        NewFilmID=None,
     ):
         """
         Attempt to nominate the specified `FilmName` as the film choice, with
         the specified `IMDbID` for the specified `DiscordUserID`.  If
         `DiscordUserID` is not a registered user then register them.  If
-        `DiscordUserID` already has a nomination then throw an exception.
+        `DiscordUserID` already has a nomination, or the guild has already
+        watched `IMDbID`, then throw an exception.  Return the ID of the
+        nominated film, which is `NewFilmID` if specified or a new time
+        ordered ID otherwise.
         """
 
+        if NewFilmID is None:
+            NewFilmID = new_film_id(DateTime)
+
         new_film = Film(
             FilmID=NewFilmID,
             FilmName=FilmName,
@@ -524,51 +1312,114 @@ class FilmBot:
             DateWatched=None,
         )
 
-        try:
-            self.client.transact_write_items(
-                TransactItems=[
-                    {
-                        "Update": {
-                            "TableName": TABLE_NAME,
-                            "Key": {
-                                USER_PK: {"S": self.guildID},
-                                USER_SK: {"S": f"DISCORDUSER#{DiscordUserID}"},
-                            },
-                            "ExpressionAttributeValues": {
-                                ":NewFilmID": {"S": NewFilmID},
-                                ":Null": {"NULL": True},
-                            },
-                            "ConditionExpression": (
-                                f"attribute_not_exists({USER_SK}) OR "
-                                f"{USER_NominatedFilmID} = :Null"
-                            ),
-                            # Make sure to null out the other fields in case we didn't have a user yet
-                            # These should both be Null at this point as we can only nominate after we
-                            # watch a film and these are cleared
-                            "UpdateExpression": (
-                                f"SET {USER_NominatedFilmID} = :NewFilmID, "
-                                f"{USER_VoteID} = :Null, "
-                                f"{USER_AttendanceVoteID} = :Null"
-                            ),
-                        }
+        items = [
+            {
+                "Update": {
+                    "TableName": TABLE_NAME,
+                    "Key": {
+                        USER_PK: {"S": self.guildID},
+                        USER_SK: {"S": f"DISCORDUSER#{DiscordUserID}"},
                     },
-                    {
-                        "Put": {
-                            "TableName": TABLE_NAME,
-                            "Item": new_film.toDict(GuildID=self.guildID),
-                            # Make sure we haven't reused this film ID before
-                            "ConditionExpression": f"attribute_not_exists({FILM_SK})",
-                        }
+                    "ExpressionAttributeValues": {
+                        ":NewFilmID": {"S": NewFilmID},
+                        ":Null": {"NULL": True},
                     },
-                ]
+                    "ConditionExpression": (
+                        f"attribute_not_exists({USER_SK}) OR "
+                        f"{USER_NominatedFilmID} = :Null"
+                    ),
+                    # Make sure to null out the other fields in case we didn't have a user yet
+                    # These should both be Null at this point as we can only nominate after we
+                    # watch a film and these are cleared
+                    "UpdateExpression": (
+                        f"SET {USER_NominatedFilmID} = :NewFilmID, "
+                        f"{USER_VoteID} = :Null, "
+                        f"{USER_AttendanceVoteID} = :Null"
+                    ),
+                }
+            },
+            {
+                "Put": {
+                    "TableName": TABLE_NAME,
+                    "Item": new_film.toDict(GuildID=self.guildID),
+                    # Make sure we haven't reused this film ID before
+                    "ConditionExpression": f"attribute_not_exists({FILM_SK})",
+                }
+            },
+        ]
+        if IMDbID is not None:
+            items.append(
+                {
+                    "ConditionCheck": {
+                        "TableName": TABLE_NAME,
+                        "Key": {
+                            WATCHEDIMDB_PK: {"S": self.guildID},
+                            WATCHEDIMDB_SK: {"S": watched_imdb_sk(IMDbID)},
+                        },
+                        "ConditionExpression": (
+                            f"attribute_not_exists({WATCHEDIMDB_SK})"
+                        ),
+                    }
+                }
             )
+
+        try:
+            self.client.transact_write_items(TransactItems=items)
         except self.client.exceptions.TransactionCanceledException as e:
+            reasons = e.response.get("CancellationReasons", [])
+            if (
+                len(reasons) == len(items) == 3
+                and reasons[2]["Code"] == "ConditionalCheckFailed"
+            ):
+                raise UserError(self.__already_watched_message(IMDbID))
+
             # This can also occur if we pass in a reused FilmID, but that is
-            # impossible if we're using a UUID properly.
+            # impossible with 80 random bits per millisecond.
             raise UserError(
                 "Unable to nominate a film as you have already nominated one"
             )
 
+        return NewFilmID
+
+    def __already_watched_message(self, IMDbID):
+        response = self.client.get_item(
+            TableName=TABLE_NAME,
+            Key={
+                WATCHEDIMDB_PK: {"S": self.guildID},
+                WATCHEDIMDB_SK: {"S": watched_imdb_sk(IMDbID)},
+            },
+        )
+        item = response.get("Item")
+        if item is None:
+            return "This film has already been watched"
+        date_watched = datetime.fromisoformat(
+            item[WATCHEDIMDB_DateWatched]["S"]
+        )
+        return (
+            f"{item[WATCHEDIMDB_FilmName]['S']} was already watched on "
+            f"<t:{int(date_watched.timestamp())}:d>"
+        )
+
+    def get_watched_imdb_ids(self):
+        """Return the set of IMDb IDs of the films that have been watched."""
+        return set(
+            item[WATCHEDIMDB_SK]["S"].removeprefix("WATCHEDIMDB#")
+            for item in self.__query(
+                {
+                    "TableName": TABLE_NAME,
+                    "ExpressionAttributeValues": {
+                        ":GuildID": {"S": self.guildID},
+                        ":Prefix": {"S": "WATCHEDIMDB#"},
+                    },
+                    "KeyConditionExpression": (
+                        f"{WATCHEDIMDB_PK} = :GuildID AND "
+                        f"begins_with({WATCHEDIMDB_SK}, :Prefix)"
+                    ),
+                    "ProjectionExpression": WATCHEDIMDB_SK,
+                }
+            )
+        )
+
     def cast_preference_vote(self, *, DiscordUserID, FilmID):
         """
         Attempt to cast a vote for `FilmID` by `DiscordUserID` and return
@@ -730,7 +1581,7 @@ class FilmBot:
 
         if response["Items"]:
             latest_watched_film = Film.fromDict(response["Items"][0])
-            if DateTime < latest_watched_film.DateWatched + timedelta(days=1):
+            if DateTime < latest_watched_film.DateWatched + WATCH_COOLDOWN:
                 raise UserError(
                     "At least 24 hours must pass before watching films"
                 )
@@ -803,7 +1654,49 @@ class FilmBot:
                 )
 
         film.DateWatched = DateTime
-        film.UsersAttended = set(PresentUserIDs)
+        film.Runtime = self.__catalog_runtime(film.IMDbID)
+        film.AttendedBitmap = MemberBitmap.fromIndexes(
+            self.__member_index(all_users[user_id])
+            for user_id in PresentUserIDs
+        )
+
+        # Record the attendance against each user as well so that a user's
+        # attendance can be read without reading every watched film
+        for user_id in set(PresentUserIDs):
+            items.append(
+                {
+                    "Put": {
+                        "TableName": TABLE_NAME,
+                        "Item": Attendance(
+                            DiscordUserID=user_id,
+                            FilmID=FilmID,
+                            FilmName=film.FilmName,
+                            DateWatched=DateTime,
+                        ).toDict(GuildID=self.guildID),
+                    }
+                }
+            )
+
+        # Record that we've watched this film so it can't be nominated again
+        if film.IMDbID is not None:
+            items.append(
+                {
+                    "Put": {
+                        "TableName": TABLE_NAME,
+                        "Item": {
+                            WATCHEDIMDB_PK: {"S": self.guildID},
+                            WATCHEDIMDB_SK: {
+                                "S": watched_imdb_sk(film.IMDbID)
+                            },
+                            WATCHEDIMDB_FilmName: {"S": film.FilmName},
+                            WATCHEDIMDB_DateWatched: {
+                                "S": datetime.isoformat(DateTime)
+                            },
+                        },
+                    }
+                }
+            )
+
         items += [
             {
                 "Delete": {
@@ -828,26 +1721,48 @@ class FilmBot:
 
         return film
 
+    def __catalog_runtime(self, IMDbID):
+        """Return the runtime in the catalog for `IMDbID`, or `None` if it
+        isn't known."""
+        # `catalog` imports this module
+        from catalog import get_catalog_entries
+
+        metadata = get_catalog_entries(self.client, [IMDbID]).get(IMDbID)
+        return None if metadata is None else metadata.Runtime
+
     def record_attendance_vote(self, *, DiscordUserID, DateTime):
         """
         Attempt to record that the `DiscordUserID` is present and watching
         the film at the specified `DateTime`.  Throw an exception if the
         user is not registered or there is no film currently being watched.
         """
-        response = self.client.get_item(
-            TableName=TABLE_NAME,
-            Key={
-                USER_PK: {"S": self.guildID},
-                USER_SK: {"S": f"DISCORDUSER#{DiscordUserID}"},
-            },
-        )
-        if "Item" not in response:
+        for attempt in range(ATTENDANCE_RETRIES):
+            if attempt > 0:
+                if self.outOfTime:
+                    break
+                delay = uniform(0, ATTENDANCE_BACKOFF * 2 ** (attempt - 1))
+                if self._deadline is not None:
+                    delay = min(delay, self._deadline - monotonic())
+                sleep(max(delay, 0))
+            try:
+                return self.__record_attendance_vote(
+                    DiscordUserID=DiscordUserID, DateTime=DateTime
+                )
+            except self.client.exceptions.TransactionCanceledException:
+                # Either another request was writing the same records, our
+                # attendance was recorded in the meantime, or the film was
+                # migrated.  Reading everything again will sort it out.
+                pass
+
+        raise UserError("Unable to record your attendance, please try again")
+
+    def __record_attendance_vote(self, *, DiscordUserID, DateTime):
+        user = self.get_user(DiscordUserID)
+        if user is None:
             raise UserError(
                 "You cannot register attendance until you have nominated"
             )
 
-        user = User.fromDict(response["Item"])
-
         # Do nothing if the user has already recorded their attendance
         if user.AttendanceVoteID is not None:
             return AttendanceStatus.ALREADY_REGISTERED
@@ -879,11 +1794,7 @@ class FilmBot:
                 "Cannot record attendance for a film that hasn't yet started"
             )
 
-        # TODO: Get runtime from IMDB and use this
-        # Note that this must never be greater than the watch cooldown
-        # period (currently 24 hours) otherwise it would be possible to
-        # have several films watched concurrently
-        end_time = latest_watched_film.DateWatched + timedelta(hours=4)
+        end_time = latest_watched_film.attendanceCutoff()
         if DateTime > end_time:
             raise UserError(
                 f"The cutoff for registering attendance was {end_time}"
@@ -908,17 +1819,26 @@ class FilmBot:
                 }
             },
             {
-                # Add our user to the set of those who attended
+                # Add our user to those who attended
                 "Update": {
                     "TableName": TABLE_NAME,
                     "Key": {
                         FILM_PK: {"S": self.guildID},
                         FILM_SK: {"S": latest_watched_film.SK},
                     },
-                    "ExpressionAttributeValues": {
-                        ":User": {"SS": [DiscordUserID]},
-                    },
-                    "UpdateExpression": f"ADD {FILM_UsersAttended} :User",
+                    **self.__add_attendee(latest_watched_film, user),
+                }
+            },
+            {
+                # Record the attendance against our user
+                "Put": {
+                    "TableName": TABLE_NAME,
+                    "Item": Attendance(
+                        DiscordUserID=user.DiscordUserID,
+                        FilmID=latest_watched_film.FilmID,
+                        FilmName=latest_watched_film.FilmName,
+                        DateWatched=latest_watched_film.DateWatched,
+                    ).toDict(GuildID=self.guildID),
                 }
             },
         ]
@@ -950,3 +1870,27 @@ class FilmBot:
             )
         self.client.transact_write_items(TransactItems=items)
         return AttendanceStatus.REGISTERED
+
+    def __add_attendee(self, film, user):
+        """
+        Return the arguments of an update to the specified watched `film` that
+        adds the specified `user` to those who attended it.
+        """
+        if film.AttendedBitmap is None:
+            # Films watched before member indexes were added
+            name = FILM_UsersAttended
+            value = {"SS": [user.DiscordUserID]}
+        else:
+            # DynamoDB can't set a bit for us, so we add our member index to a
+            # set that is merged into the bitmap when the film is read.  Unlike
+            # rewriting the bitmap, this doesn't conflict with other users
+            # recording their attendance at the same time.
+            name = FILM_AttendedIndexes
+            value = {"NS": [str(self.__member_index(user))]}
+        return {
+            "ExpressionAttributeValues": {":Attendee": value},
+            # Make sure the film hasn't been moved to a new sort key by
+            # `migrate_sort_keys.py` since we read it
+            "ConditionExpression": f"attribute_exists({FILM_SK})",
+            "UpdateExpression": f"ADD {name} :Attendee",
+        }
@@ -0,0 +1,110 @@
+# flame_graph.py
+#
+# Description
+# ===========
+#
+# This script turns a `.pstats` profile written by `lambda_function.py` (see
+# `FILMBOT_PROFILE_DIR` in `profiling.py`) into "folded" stacks, one line per
+# stack of `;` separated functions followed by the microseconds spent in it.
+# These can be drawn as a flame graph by `flamegraph.pl` or speedscope.
+#
+# `cProfile` only records which function called which, not whole stacks, so
+# the time of a function called from several places is split between them in
+# proportion to the time each caller spent in it.  Following every path
+# through the call graph takes exponential time, so stacks that would get
+# less than `MIN_STACK_SHARE` of the profile's time aren't followed, which
+# leaves out what would be too narrow to see in a flame graph anyway.
+#
+# Usage
+# =====
+#
+# $ python flame_graph.py PROFILE.pstats > profile.folded
+# $ flamegraph.pl profile.folded > profile.svg
+
+import argparse
+import pstats
+from collections import defaultdict
+from profiling import function_name
+
+# Stacks are cut off at this depth, which only recursive code reaches
+MAX_DEPTH = 64
+
+# Functions that spent less than this share of their time outside of their
+# profiled callers are only shown below those callers, as the difference is
+# usually rounding
+MIN_ROOT_SHARE = 0.01
+
+# Stacks that would get less than this share of the profile's time, along
+# with the stacks below them, are left out.  As each level of stacks shares
+# out the profile's time, this bounds how many stacks we follow at each
+# depth by its inverse.
+MIN_STACK_SHARE = 0.0001
+
+
+def folded_stacks(stats):
+    """
+    Return a dictionary of folded stacks to the microseconds spent in the
+    last function of each stack, from the specified `pstats.Stats`.
+    """
+    # The cumulative time of each callee for each of its callers, and the
+    # share of each function's time that wasn't spent in a profiled caller,
+    # i.e. it was called from outside of the profile
+    callees = defaultdict(list)
+    roots = {}
+    for function, (_, _, _, cumtime, callers) in stats.stats.items():
+        called = 0.0
+        for caller, (_, _, _, edge_cumtime) in callers.items():
+            if caller != function:
+                callees[caller].append((function, edge_cumtime))
+                called += edge_cumtime
+        if called == 0:
+            roots[function] = 1.0
+        elif cumtime > 0 and called < cumtime * (1 - MIN_ROOT_SHARE):
+            roots[function] = 1 - called / cumtime
+
+    total = sum(stats.stats[root][3] * share for root, share in roots.items())
+    min_seconds = total * MIN_STACK_SHARE
+    folded = defaultdict(float)
+
+    def visit(function, share, stack):
+        _, _, tottime, cumtime, _ = stats.stats[function]
+        stack = stack + [function_name(function)]
+        folded[";".join(stack)] += tottime * share
+        if len(stack) >= MAX_DEPTH or cumtime == 0:
+            return
+        for callee, edge_cumtime in callees[function]:
+            if function_name(callee) in stack:
+                # Recursion is already counted in the function's own time
+                continue
+            callee_cumtime = stats.stats[callee][3]
+            if callee_cumtime > 0 and share * edge_cumtime >= min_seconds:
+                visit(
+                    callee,
+                    share * edge_cumtime / callee_cumtime,
+                    stack,
+                )
+
+    for root, share in roots.items():
+        visit(root, share, [])
+
+    return {
+        stack: round(seconds * 1_000_000)
+        for (stack, seconds) in folded.items()
+        if round(seconds * 1_000_000) > 0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Turn a .pstats profile into folded stacks"
+    )
+    parser.add_argument("profile")
+    args = parser.parse_args()
+
+    stacks = folded_stacks(pstats.Stats(args.profile))
+    for stack, microseconds in sorted(stacks.items()):
+        print(f"{stack} {microseconds}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+import json
+import re
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import copy_context
+from bloom import BloomFilter
+from cache import LRUCache
+from catalog import get_catalog_entries
+from filmbot import TABLE_NAME, normalize_title
+
+# A single record per guild that holds its `GuildRanking`
+RANKING_PK = "PK"
+RANKING_SK = "SK"
+RANKING_SKValue = "RANKING"
+RANKING_FilmCount = "FilmCount"
+RANKING_Tokens = "Tokens"
+RANKING_Decades = "Decades"
+RANKING_WatchedFilter = "WatchedFilter"
+
+# Rankings written before `WatchedFilter` have a set of IMDb IDs instead
+RANKING_WatchedIMDbIDs = "WatchedIMDbIDs"
+
+# Only the most common title words are kept so that the record stays small
+MAX_RANKING_TOKENS = 500
+
+# Words that say nothing about what a guild likes to watch
+STOP_WORDS = {"the", "and", "of", "a", "an", "in", "on", "to", "for", "de"}
+
+# How many places a film can move up the results for each film watched by the
+# guild with the same title word or from the same decade, as a fraction of
+# all of the films the guild has watched
+TOKEN_WEIGHT = 2.0
+DECADE_WEIGHT = 3.0
+
+# Watched IMDb IDs are kept in a Bloom filter, which is resized from the
+# guild's history whenever it fills up.  The odd film being wrongly shown as
+# watched in autocomplete doesn't matter as `nominate_film` checks properly.
+MIN_WATCHED_CAPACITY = 64
+WATCHED_ERROR_RATE = 0.01
+
+# The number of times we read and update a guild's ranking before giving up
+# because other `/watch` commands keep changing it
+RANKING_RETRIES = 3
+
+# Rankings only change when a film is watched, so are kept for a long time
+# in AWS Lambda "hot starts".  Guilds without a ranking are looked up again
+# sooner, as it is built by the first film they watch, possibly in another
+# container.
+RANKING_CACHE_SIZE = 256
+RANKING_CACHE_TTL = 60 * 60
+RANKING_CACHE_NEGATIVE_TTL = 60
+
+ranking_cache = LRUCache(
+    MaxSize=RANKING_CACHE_SIZE,
+    TTL=RANKING_CACHE_TTL,
+    NegativeTTL=RANKING_CACHE_NEGATIVE_TTL,
+)
+
+# Rankings that aren't in memory are read while the search that they rerank
+# is running
+_ranking_reader = ThreadPoolExecutor(max_workers=4)
+
+# Film names chosen from `/nominate` autocomplete end with the year
+YEAR_SUFFIX = re.compile(r"\s*\((\d{4})\)$")
+
+
+def split_film_name(FilmName):
+    """Return a tuple of the title and year (or `None`) of a film name."""
+    match = YEAR_SUFFIX.search(FilmName)
+    if match is None:
+        return (FilmName, None)
+    return (FilmName[: match.start()], int(match.group(1)))
+
+
+def title_tokens(title):
+    """Return the set of words in `title` that are worth ranking by."""
+    return {
+        word
+        for word in normalize_title(title).split()
+        if len(word) > 1 and word not in STOP_WORDS
+    }
+
+
+def decade(year):
+    return None if year is None else str(year // 10 * 10)
+
+
+def watched_filter(IMDbIDs):
+    """Return a Bloom filter of `IMDbIDs` with room for as many again."""
+    IMDbIDs = set(IMDbIDs)
+    capacity = MIN_WATCHED_CAPACITY
+    while capacity < 2 * len(IMDbIDs):
+        capacity *= 2
+    return BloomFilter.fromItems(
+        IMDbIDs, Capacity=capacity, ErrorRate=WATCHED_ERROR_RATE
+    )
+
+
+class GuildRanking:
+    """
+    What a guild has watched, used to rank `/nominate` autocomplete results
+    by what the guild tends to watch and to push down films it has already
+    watched.
+    """
+
+    def __init__(
+        self, *, FilmCount=0, Tokens=None, Decades=None, Watched=None
+    ):
+        self.FilmCount = FilmCount
+        self.Tokens = Counter(Tokens or {})
+        self.Decades = Counter(Decades or {})
+        self.Watched = watched_filter([]) if Watched is None else Watched
+
+    def __eq__(self, other):
+        return (
+            self.FilmCount == other.FilmCount
+            and self.Tokens == other.Tokens
+            and self.Decades == other.Decades
+            and self.Watched == other.Watched
+        )
+
+    def __bool__(self):
+        """A ranking is empty until the guild has watched a film."""
+        return self.FilmCount > 0
+
+    def __repr__(self):
+        return (
+            f"FilmCount={self.FilmCount}\n"
+            f"Tokens={dict(self.Tokens)}\n"
+            f"Decades={dict(self.Decades)}\n"
+            f"Watched={self.Watched}"
+        )
+
+    @staticmethod
+    def fromFilms(films, Catalog=None):
+        """Return the ranking for the watched films in `films`, using their
+        metadata in the `Catalog` dictionary of IMDb IDs if specified."""
+        watched = [f for f in films if f.DateWatched is not None]
+        ranking = GuildRanking(
+            Watched=watched_filter(f.IMDbID for f in watched if f.IMDbID)
+        )
+        for film in watched:
+            ranking.add(film, (Catalog or {}).get(film.IMDbID))
+        return ranking
+
+    def add(self, film, Metadata=None):
+        """Add the specified watched `film` to this ranking, using its
+        catalog `Metadata` if specified rather than the name it was
+        nominated with."""
+        title, year = split_film_name(film.FilmName)
+        if Metadata is not None:
+            title = Metadata.IMDbTitle or title
+            year = Metadata.ReleaseYear or year
+        self.FilmCount += 1
+        self.Tokens.update(title_tokens(title))
+        if year is not None:
+            self.Decades[decade(year)] += 1
+        if film.IMDbID is not None and film.IMDbID not in self.Watched:
+            self.Watched.add(film.IMDbID)
+
+        if len(self.Tokens) > MAX_RANKING_TOKENS:
+            self.Tokens = Counter(
+                dict(self.Tokens.most_common(MAX_RANKING_TOKENS))
+            )
+
+    def hasWatched(self, result):
+        """Return whether the guild has watched the film in `result`."""
+        return result.IMDbID in self.Watched
+
+    def rerank(self, results):
+        """
+        Return the specified array of `SearchResult`s reordered so that films
+        like those the guild has watched come first and films it has already
+        watched come last.
+        """
+        if self.FilmCount == 0:
+            return results
+
+        def rank(item):
+            position, r = item
+            affinity = TOKEN_WEIGHT * sum(
+                self.Tokens.get(t, 0) for t in title_tokens(r.Title)
+            ) + DECADE_WEIGHT * self.Decades.get(decade(r.Year), 0)
+            return (
+                r.IMDbID in self.Watched,
+                position - affinity / self.FilmCount,
+            )
+
+        return [r for (_, r) in sorted(enumerate(results), key=rank)]
+
+    def toDict(self, *, GuildID):
+        return {
+            RANKING_PK: {"S": GuildID},
+            RANKING_SK: {"S": RANKING_SKValue},
+            RANKING_FilmCount: {"N": str(self.FilmCount)},
+            RANKING_Tokens: {
+                "S": json.dumps(dict(self.Tokens), separators=(",", ":"))
+            },
+            RANKING_Decades: {
+                "S": json.dumps(dict(self.Decades), separators=(",", ":"))
+            },
+            RANKING_WatchedFilter: {"B": self.Watched.toBytes()},
+        }
+
+    @staticmethod
+    def fromDict(dict):
+        return GuildRanking(
+            FilmCount=int(dict[RANKING_FilmCount]["N"]),
+            Tokens=json.loads(dict[RANKING_Tokens]["S"]),
+            Decades=json.loads(dict[RANKING_Decades]["S"]),
+            Watched=(
+                BloomFilter.fromBytes(dict[RANKING_WatchedFilter]["B"])
+                if RANKING_WatchedFilter in dict
+                else watched_filter(
+                    dict.get(RANKING_WatchedIMDbIDs, {}).get("SS", [])
+                )
+            ),
+        )
+
+
+def ranking_key(GuildID):
+    return {
+        RANKING_PK: {"S": GuildID},
+        RANKING_SK: {"S": RANKING_SKValue},
+    }
+
+
+def read_guild_ranking(client, GuildID):
+    """Return the `GuildRanking` stored for `GuildID`, or `None` if it
+    hasn't been built yet."""
+    response = client.get_item(
+        TableName=TABLE_NAME, Key=ranking_key(GuildID), ConsistentRead=True
+    )
+    if "Item" not in response:
+        return None
+    return GuildRanking.fromDict(response["Item"])
+
+
+def get_guild_ranking(client, GuildID):
+    """
+    Return the `GuildRanking` for `GuildID` from memory if we have read it
+    before, otherwise from the table.  A guild without a ranking yet gets
+    an empty one, which leaves results in the order they were found.
+    """
+    ranking = ranking_cache.get(GuildID)
+    if ranking is None:
+        ranking = read_guild_ranking(client, GuildID) or GuildRanking()
+        ranking_cache.put(GuildID, ranking)
+    return ranking
+
+
+def prefetch_guild_ranking(client, GuildID):
+    """
+    Return a `Future` of the `GuildRanking` for `GuildID`, which is read from
+    the table in the background if it isn't in memory.  The read carries on
+    if we stop waiting for it, so it is in memory for the next request.
+    """
+    ranking = ranking_cache.get(GuildID)
+    if ranking is not None:
+        future = Future()
+        future.set_result(ranking)
+        return future
+    # Run with our context so that the read counts towards this request's
+    # metrics
+    return _ranking_reader.submit(
+        copy_context().run, get_guild_ranking, client, GuildID
+    )
+
+
+def record_watched_film(filmbot, film):
+    """
+    Add the `film` that `filmbot`'s guild has just started watching to its
+    ranking.  A guild without a ranking has it built from all of its
+    watched films instead, which includes `film`.
+    """
+    client = filmbot.client
+    for attempt in range(RANKING_RETRIES):
+        if attempt > 0 and filmbot.outOfTime:
+            break
+        ranking = read_guild_ranking(client, filmbot.guildID)
+        if ranking is None:
+            films = filmbot.get_all_films()
+            catalog = get_catalog_entries(
+                client, [f.IMDbID for f in films if f.DateWatched is not None]
+            )
+            ranking = GuildRanking.fromFilms(films, Catalog=catalog)
+            condition = f"attribute_not_exists({RANKING_SK})"
+            values = None
+        else:
+            condition = f"{RANKING_FilmCount} = :FilmCount"
+            values = {":FilmCount": {"N": str(ranking.FilmCount)}}
+            catalog = get_catalog_entries(client, [film.IMDbID])
+            ranking.add(film, catalog.get(film.IMDbID))
+            if ranking.Watched.isFull():
+                ranking.Watched = watched_filter(
+                    filmbot.get_watched_imdb_ids()
+                )
+
+        put = {
+            "TableName": TABLE_NAME,
+            "Item": ranking.toDict(GuildID=filmbot.guildID),
+            "ConditionExpression": condition,
+        }
+        if values is not None:
+            put["ExpressionAttributeValues"] = values
+        try:
+            client.put_item(**put)
+        except client.exceptions.ConditionalCheckFailedException:
+            # Another film was watched since we read the ranking
+            continue
+
+        ranking_cache.put(filmbot.guildID, ranking)
+        return ranking
+
+    print(f"Gave up updating the ranking for guild {filmbot.guildID}")
+    return None
@@ -0,0 +1,249 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from request_log import dumps
+from tracing import span
+
+# The CloudWatch namespace of the metrics we emit
+METRICS_NAMESPACE = "FilmBot"
+
+# The DynamoDB client methods that we measure, by whether their consumed
+# capacity is read or write capacity
+READ_OPERATIONS = {
+    "get_item",
+    "query",
+    "scan",
+    "batch_get_item",
+    "transact_get_items",
+}
+WRITE_OPERATIONS = {
+    "put_item",
+    "update_item",
+    "delete_item",
+    "batch_write_item",
+    "transact_write_items",
+}
+
+# Operations that return a page of results per call
+PAGED_OPERATIONS = {"query", "scan"}
+
+# The name and unit of each metric emitted for a request
+EMF_METRICS = [
+    ("Latency", "Milliseconds"),
+    ("DynamoDBLatency", "Milliseconds"),
+    ("DynamoDBCalls", "Count"),
+    ("DynamoDBPages", "Count"),
+    ("DynamoDBRetries", "Count"),
+    ("DynamoDBErrors", "Count"),
+    ("ReadCapacityUnits", "Count"),
+    ("WriteCapacityUnits", "Count"),
+]
+
+# The `RequestMetrics` of the request being handled, so that DynamoDB calls
+# deep inside `FilmBot` are attributed to the command that made them.  Calls
+# made on other threads are only attributed if the thread was started with a
+# copy of the context, e.g. `executor.submit(copy_context().run, ...)`.
+_current_request = ContextVar("current_request", default=None)
+
+_metrics_sink = None
+
+
+class OperationMetrics:
+    """The totals of a request's calls of one DynamoDB operation."""
+
+    def __init__(self):
+        self.Calls = 0
+        self.Pages = 0
+        self.Errors = 0
+        self.Retries = 0
+        self.Latency = 0.0
+        self.ReadCapacityUnits = 0.0
+        self.WriteCapacityUnits = 0.0
+
+    def toDict(self):
+        return {
+            "Calls": self.Calls,
+            "Pages": self.Pages,
+            "Errors": self.Errors,
+            "Retries": self.Retries,
+            "LatencyMs": round(self.Latency * 1000, 1),
+            "ReadCapacityUnits": self.ReadCapacityUnits,
+            "WriteCapacityUnits": self.WriteCapacityUnits,
+        }
+
+
+def consumed_capacity(Operation, response):
+    """Return a tuple of the read and write capacity units consumed by the
+    specified `response` to `Operation`."""
+    consumed = response.get("ConsumedCapacity") or []
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+    read, write = (0.0, 0.0)
+    for c in consumed:
+        if "ReadCapacityUnits" in c or "WriteCapacityUnits" in c:
+            read += c.get("ReadCapacityUnits", 0)
+            write += c.get("WriteCapacityUnits", 0)
+        elif Operation in WRITE_OPERATIONS:
+            write += c.get("CapacityUnits", 0)
+        else:
+            read += c.get("CapacityUnits", 0)
+    return (read, write)
+
+
+class RequestMetrics:
+    """
+    The latency of handling a request for `Command` from `Guild`, and the
+    DynamoDB calls made while handling it by operation.
+    """
+
+    def __init__(self, *, Command, Guild):
+        self.Command = Command
+        self.Guild = Guild
+        self.Latency = None
+        self.Operations = {}
+        self._lock = Lock()
+
+    def record(self, Operation, response, *, Latency, Failed=False):
+        """Record a call of `Operation` that took `Latency` seconds and
+        returned the specified `response` (or error response)."""
+        read, write = consumed_capacity(Operation, response)
+        retries = response.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+        with self._lock:
+            op = self.Operations.setdefault(Operation, OperationMetrics())
+            op.Calls += 1
+            op.Pages += Operation in PAGED_OPERATIONS
+            op.Errors += Failed
+            op.Retries += retries
+            op.Latency += Latency
+            op.ReadCapacityUnits += read
+            op.WriteCapacityUnits += write
+
+    def total(self, name):
+        """Return the total of the `OperationMetrics` field `name` over all
+        operations."""
+        return sum(getattr(op, name) for op in self.Operations.values())
+
+    def toEMF(self, Timestamp=None):
+        """Return this request as a CloudWatch Embedded Metric Format record,
+        with the totals as metrics by `Command` and the breakdown by
+        operation as a property for Logs Insights."""
+        if Timestamp is None:
+            Timestamp = time.time()
+        return {
+            "_aws": {
+                "Timestamp": int(Timestamp * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": METRICS_NAMESPACE,
+                        "Dimensions": [["Command"]],
+                        "Metrics": [
+                            {"Name": name, "Unit": unit}
+                            for (name, unit) in EMF_METRICS
+                        ],
+                    }
+                ],
+            },
+            "Command": self.Command or "unknown",
+            "Guild": self.Guild,
+            "Latency": round((self.Latency or 0) * 1000, 1),
+            "DynamoDBLatency": round(self.total("Latency") * 1000, 1),
+            "DynamoDBCalls": self.total("Calls"),
+            "DynamoDBPages": self.total("Pages"),
+            "DynamoDBRetries": self.total("Retries"),
+            "DynamoDBErrors": self.total("Errors"),
+            "ReadCapacityUnits": self.total("ReadCapacityUnits"),
+            "WriteCapacityUnits": self.total("WriteCapacityUnits"),
+            "Operations": {
+                name: op.toDict() for (name, op) in self.Operations.items()
+            },
+        }
+
+
+class EMFSink:
+    """Prints each request's metrics as an Embedded Metric Format log line,
+    which CloudWatch turns into metrics without any API calls."""
+
+    def emit(self, metrics):
+        print(dumps(metrics.toEMF()))
+
+
+class InMemorySink:
+    """Keeps each request's metrics in `requests`, for tests."""
+
+    def __init__(self):
+        self.requests = []
+
+    def emit(self, metrics):
+        self.requests.append(metrics)
+
+
+def get_metrics_sink():
+    """Return the sink that each request's metrics are emitted to."""
+    global _metrics_sink
+    if _metrics_sink is None:
+        _metrics_sink = EMFSink()
+    return _metrics_sink
+
+
+@contextmanager
+def measure_request(*, Command, Guild):
+    """
+    Attribute the DynamoDB calls made in this context to `Command` and
+    `Guild`, and emit them with the time the context took once it exits.
+    """
+    metrics = RequestMetrics(Command=Command, Guild=Guild)
+    token = _current_request.set(metrics)
+    start = time.perf_counter()
+    try:
+        yield metrics
+    finally:
+        metrics.Latency = time.perf_counter() - start
+        _current_request.reset(token)
+        get_metrics_sink().emit(metrics)
+
+
+class InstrumentedClient:
+    """
+    Wraps a DynamoDB client to trace each call, and to record the latency,
+    consumed capacity, pages and retries of each call made within
+    `measure_request`.  Everything else
+    is passed through to the client, e.g. `exceptions`.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+        if name not in READ_OPERATIONS and name not in WRITE_OPERATIONS:
+            return method
+
+        def measured(**kwargs):
+            with span(
+                f"DynamoDB.{name}",
+                **{"db.system": "dynamodb", "db.operation": name},
+            ):
+                return measure(**kwargs)
+
+        def measure(**kwargs):
+            metrics = _current_request.get()
+            if metrics is None:
+                return method(**kwargs)
+
+            kwargs.setdefault("ReturnConsumedCapacity", "TOTAL")
+            start = time.perf_counter()
+            try:
+                response = method(**kwargs)
+            except Exception as e:
+                metrics.record(
+                    name,
+                    getattr(e, "response", {}),
+                    Latency=time.perf_counter() - start,
+                    Failed=True,
+                )
+                raise
+            metrics.record(name, response, Latency=time.perf_counter() - start)
+            return response
+
+        return measured
@@ -3,43 +3,293 @@
 # Description
 # ===========
 #
-# This script will be invoked when Discord sends application/slash commands
+# This script will be invoked when Discord sends application/slash commands,
+# either through API Gateway with a mapping template that passes on the
+# request's `params`, `rawBody` and parsed `body-json`, or straight from a
+# Lambda function URL (or an HTTP API), whose "version 2.0" events have the
+# raw `body` which we parse once its signature has been verified.
+# `enrichment_handler` is invoked with batches of films to enrich from the
+# SQS queue in `FILMBOT_ENRICHMENT_QUEUE_URL`, if there is one.
 #
 # Requirements
 # ============
 #
 # The environment variable `FILMBOT_PUBLIC_KEY` must be set to the public key
 # of the Discord Application
+#
+# Requests are only handled if Discord signed them with that key within
+# `SIGNATURE_WINDOW` seconds of our clock, and if this container hasn't
+# already been sent the same interaction, so replayed and duplicated requests
+# never reach DynamoDB.  The Lambda's clock is kept in sync by AWS.
+#
+# Every request logs a line of JSON with its command, guild, latency and
+# outcome.  The full event and response are only logged for failed requests
+# and for the fraction of requests in `FILMBOT_LOG_SAMPLE_RATE` (default 1%).
+# It also logs a line of CloudWatch Embedded Metric Format with its latency
+# and the cost of its DynamoDB calls (see `instrumentation.py`).
+#
+# Setting `FILMBOT_TRACE_FILE` writes a span for each step of each request to
+# that file (see `tracing.py`), and requests from the guilds in
+# `FILMBOT_PROFILE_GUILDS` are profiled (see `profiling.py`).
+#
+# Deadlines
+# =========
+#
+# Each request has a deadline: the sooner of Discord's 3 second window and
+# the time AWS Lambda has left for us.  Reads that are only displayed stop
+# paging once it passes, retries give up, and commands are deferred to a
+# worker when there is little time left (see `discord_handler.py`).
+#
+# Cold starts
+# ===========
+#
+# Discord sends a `PING` when the interactions endpoint is set and expects a
+# quick reply, so `boto3` and `discord_handler` are only imported once we get
+# a request that needs them.  `test_cold_start.py` checks that they aren't
+# imported with this module, and `benchmark_cold_start.py` checks that
+# importing it stays within its budget.
+#
+# Events with `"filmbot-warmup": true`, e.g. from an EventBridge schedule,
+# import everything up front, connect to DynamoDB and load the guilds that
+# usually watch a film in the next couple of hours (see `warmup.py`).
 
-import os
+import base64
 import json
-import boto3
-from discord_handler import handle_discord
+import os
+import time
 from nacl.signing import VerifyKey
 from nacl.exceptions import BadSignatureError
+from cache import LRUCache
+from deferral import DEFERRED
+from instrumentation import InstrumentedClient, measure_request
+from profiling import profile_request
+from request_log import dumps, log_request, request_summary
+from tracing import span, traced
+from warmup import WARMUP
 
 MESSAGE_WITH_SOURCE = 4
 
-# Initialize `boto3` outside of `lambda_handler` as it can be reused
-# in AWS Lambda "hot starts".
-client = boto3.client("dynamodb", region_name=os.environ["AWS_REGION"])
+# The `type` of Discord's `PING` request and of our `PONG` response
+PING = 1
+PONG = 1
+
+# The `version` of Lambda function URL and HTTP API payloads
+HTTP_EVENT_VERSION = "2.0"
+
+# Discord signs the time that it sent each request, so a request signed more
+# than this many seconds either side of our clock is a replay and is turned
+# away before it reaches DynamoDB
+SIGNATURE_WINDOW = 60
+
+# The interactions this container has recently been sent, so that duplicate
+# deliveries of them are turned away as well.  Older duplicates are outside
+# of `SIGNATURE_WINDOW` anyway.
+SEEN_INTERACTIONS_SIZE = 4096
+seen_interactions = LRUCache(
+    MaxSize=SEEN_INTERACTIONS_SIZE, TTL=2 * SIGNATURE_WINDOW
+)
 
+# Discord drops responses that take longer than 3 seconds, so leave some time
+# for the request to reach us and the response to get back
+RESPONSE_DEADLINE = 2.5
 
+# How long before AWS Lambda times out that we should stop work, leaving
+# time to log the request and return
+LAMBDA_DEADLINE_MARGIN = 0.5
+
+# Initialize `boto3` and the key outside of `lambda_handler` as they can be
+# reused in AWS Lambda "hot starts".
+_client = None
+_verify_key = None
+
+
+def get_client():
+    """Return the DynamoDB client shared by all requests, which records
+    the cost of each call for the request's metrics."""
+    global _client
+    if _client is None:
+        import boto3
+        from botocore.config import Config
+
+        # Keep idle connections open between requests so that they don't
+        # have to set up TLS again
+        _client = InstrumentedClient(
+            boto3.client(
+                "dynamodb",
+                region_name=os.environ["AWS_REGION"],
+                config=Config(tcp_keepalive=True),
+            )
+        )
+    return _client
+
+
+def get_verify_key():
+    """Return the `VerifyKey` for the public key in `FILMBOT_PUBLIC_KEY`."""
+    global _verify_key
+    if _verify_key is None:
+        _verify_key = VerifyKey(
+            bytes.fromhex(os.environ["FILMBOT_PUBLIC_KEY"])
+        )
+    return _verify_key
+
+
+@traced("verify_signature")
 def verify_signature(event):
     header = event["params"]["header"]
     auth_sig = header["x-signature-ed25519"]
     auth_ts = header["x-signature-timestamp"]
     message = auth_ts.encode() + event["rawBody"].encode()
-    verify_key = VerifyKey(bytes.fromhex(os.environ["FILMBOT_PUBLIC_KEY"]))
     try:
-        verify_key.verify(message, bytes.fromhex(auth_sig))
+        get_verify_key().verify(message, bytes.fromhex(auth_sig))
     except Exception as e:
         raise Exception(f"[UNAUTHORIZED] Invalid request signature: {e}")
 
 
-def lambda_handler(event, context):
-    print(f"in={json.dumps(event)}")
-    verify_signature(event)
-    response = handle_discord(event, client)
-    print(f"out={json.dumps(response)}")
+def reject_replays(event, Now=None):
+    """
+    Raise an exception if the request in `event`, whose signature has been
+    verified, was signed outside of `SIGNATURE_WINDOW` or is an interaction
+    that we have already been sent.
+    """
+    timestamp = event["params"]["header"]["x-signature-timestamp"]
+    now = time.time() if Now is None else Now
+    try:
+        age = now - int(timestamp)
+    except ValueError:
+        raise Exception(f"[UNAUTHORIZED] Invalid timestamp ({timestamp})")
+    if age > SIGNATURE_WINDOW:
+        raise Exception(f"[UNAUTHORIZED] Stale request ({age:.0f}s old)")
+    if age < -SIGNATURE_WINDOW:
+        raise Exception(
+            f"[UNAUTHORIZED] Request from the future ({-age:.0f}s ahead)"
+        )
+
+    interaction_id = event["body-json"].get("id")
+    if interaction_id is None:
+        return
+    if seen_interactions.get(interaction_id):
+        raise Exception(
+            f"[UNAUTHORIZED] Duplicate interaction ({interaction_id})"
+        )
+    seen_interactions.put(interaction_id, True)
+
+
+def request_deadline(context, Deferred=False):
+    """
+    Return the `time.monotonic()` time that we should respond by, from the
+    time that the Lambda `context` has left and, unless the request was
+    `Deferred` so that Discord isn't waiting on it, `RESPONSE_DEADLINE`.
+    """
+    now = time.monotonic()
+    deadlines = []
+    if context is not None:
+        remaining = context.get_remaining_time_in_millis() / 1000
+        deadlines.append(now + remaining - LAMBDA_DEADLINE_MARGIN)
+    if not Deferred:
+        deadlines.append(now + RESPONSE_DEADLINE)
+    return min(deadlines, default=None)
+
+
+def http_request(event):
+    """
+    Return the Lambda function URL / HTTP API `event` in the form that API
+    Gateway's mapping template gives us, without `body-json` as the body is
+    only parsed once we know that it came from Discord.
+    """
+    body = event.get("body") or ""
+    if event.get("isBase64Encoded"):
+        body = base64.b64decode(body).decode()
+    # The headers of these events are always lower case
+    return {"params": {"header": event.get("headers") or {}}, "rawBody": body}
+
+
+def http_response(response, StatusCode=200):
+    """Return `response` in the form a Lambda function URL sends back."""
+    return {
+        "statusCode": StatusCode,
+        "headers": {"Content-Type": "application/json"},
+        "body": json.dumps(response),
+    }
+
+
+def handle_request(event, Deadline=None, Verified=False):
+    if event.get(DEFERRED):
+        # We invoked ourselves with a command to run, see `deferral.py`
+        from discord_handler import handle_deferred
+
+        return handle_deferred(event, get_client(), Deadline=Deadline)
+
+    if not Verified:
+        verify_signature(event)
+        reject_replays(event)
+    if event["body-json"]["type"] == PING:
+        # Answer without touching DynamoDB or importing `discord_handler`
+        return {"type": PONG}
+
+    from discord_handler import handle_discord
+
+    return handle_discord(event, get_client(), Deadline=Deadline)
+
+
+def handle_event(event, context, Verified=False):
+    start = time.perf_counter()
+    deadline = request_deadline(context, Deferred=bool(event.get(DEFERRED)))
+    summary = request_summary(event)
+    command, guild = (summary["command"], summary["guild"])
+    try:
+        with span("lambda_handler", **summary):
+            with measure_request(Command=command, Guild=guild):
+                with profile_request(Command=command, Guild=guild):
+                    response = handle_request(
+                        event, Deadline=deadline, Verified=Verified
+                    )
+    except Exception as e:
+        log_request(event, None, Latency=time.perf_counter() - start, Error=e)
+        raise
+    log_request(event, response, Latency=time.perf_counter() - start)
     return response
+
+
+def http_handler(event, context):
+    start = time.perf_counter()
+    request = http_request(event)
+    try:
+        verify_signature(request)
+        request["body-json"] = json.loads(request["rawBody"])
+        reject_replays(request)
+    except Exception as e:
+        # Discord checks that we turn away requests with a bad signature
+        log_request(
+            request, None, Latency=time.perf_counter() - start, Error=e
+        )
+        return http_response({"error": "Unauthorized"}, StatusCode=401)
+    return http_response(handle_event(request, context, Verified=True))
+
+
+def warmup_handler(event, context):
+    from warmup import warm_up
+
+    with span("warmup_handler"):
+        with measure_request(Command="warmup", Guild=None):
+            summary = warm_up(
+                get_client(), Deadline=request_deadline(context, Deferred=True)
+            )
+    print(dumps(summary))
+    return summary
+
+
+def lambda_handler(event, context):
+    if event.get(WARMUP):
+        # Nothing for Discord, see `warmup.py`
+        return warmup_handler(event, context)
+    if event.get("version") == HTTP_EVENT_VERSION:
+        return http_handler(event, context)
+    return handle_event(event, context)
+
+
+def enrichment_handler(event, context):
+    from enrichment import handle_enrichment_event
+
+    with span("enrichment_handler"):
+        with measure_request(Command="enrichment", Guild=None):
+            return handle_enrichment_event(event, get_client())
@@ -0,0 +1,54 @@
+from bisect import bisect_left
+from threading import Lock
+
+# The upper bound in milliseconds of each bucket of a `LatencyHistogram`,
+# other than the last bucket which has no upper bound
+LATENCY_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+class LatencyHistogram:
+    """
+    A count of latencies in fixed buckets, which is cheap enough to record
+    every call and precise enough to choose timeouts from.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def record(self, seconds):
+        """Record a latency of the specified `seconds`."""
+        with self._lock:
+            self.counts[bisect_left(LATENCY_BUCKETS, seconds * 1000)] += 1
+
+    def percentile(self, p):
+        """
+        Return the upper bound in milliseconds of the bucket containing the
+        `p`th percentile latency, `float("inf")` if it is in the last bucket,
+        or `None` if nothing has been recorded.
+        """
+        total = self.count
+        if total == 0:
+            return None
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen * 100 >= total * p:
+                break
+        return (
+            LATENCY_BUCKETS[bucket]
+            if bucket < len(LATENCY_BUCKETS)
+            else float("inf")
+        )
+
+    def __str__(self):
+        if self.count == 0:
+            return "n=0"
+        return (
+            f"n={self.count} p50<={self.percentile(50)}ms "
+            f"p90<={self.percentile(90)}ms p99<={self.percentile(99)}ms"
+        )
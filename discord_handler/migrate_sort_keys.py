@@ -0,0 +1,210 @@
+# migrate_sort_keys.py
+#
+# Description
+# ===========
+#
+# This script rewrites the watched film ("FILM#WATCHED#*") records of a guild,
+# along with their "ATTENDED#*" records, from v1 sort keys to the compact v2
+# sort keys (see `watched_suffix` in `filmbot.py`).  The rewritten records
+# also gain any attributes that have since been added to `Film.toDict`.
+#
+# This is safe to run while FilmBot is serving requests:
+#   * films are migrated from the most recently watched backwards and as v2
+#     sort keys always sort after v1 sort keys, watched films are always
+#     returned in the correct order
+#   * each film is moved in a transaction that fails if its attendance
+#     changed since we read it, in which case it is retried in the next pass
+#
+# It can be stopped at any time and resumed from the last printed sort key
+# with `--resume` (or just rerun as it only ever reads v1 records).
+#
+# Usage
+# =====
+#
+# $ python migrate_sort_keys.py GUILD_ID [--batch-size N] [--resume SORT_KEY]
+
+import argparse
+import os
+import boto3
+from filmbot import (
+    TABLE_NAME,
+    FILM_PK,
+    FILM_SK,
+    FILM_UsersAttended,
+    WATCHED_V2_MARKER,
+    Attendance,
+    Film,
+    batch_write,
+)
+
+# The maximum number of passes over a guild's history before giving up on
+# films that keep changing underneath us
+MAX_PASSES = 5
+
+
+def get_legacy_watched_films(client, GuildID, Limit, ExclusiveStartKey=None):
+    """
+    Return a tuple where the first element is an array of maximum `Limit`
+    watched films with v1 sort keys for `GuildID` ordered by most recently
+    watched, and the second element is the `ExclusiveStartKey` to get the
+    next batch, or `None` if there are no more films.
+    """
+    query = {
+        "TableName": TABLE_NAME,
+        "ExpressionAttributeValues": {
+            ":GuildID": {"S": GuildID},
+            ":Lower": {"S": "FILM#WATCHED#"},
+            # All v2 sort keys have at least one character after the marker
+            ":Upper": {"S": f"FILM#WATCHED#{WATCHED_V2_MARKER}"},
+        },
+        "KeyConditionExpression": (
+            f"{FILM_PK} = :GuildID AND {FILM_SK} BETWEEN :Lower AND :Upper"
+        ),
+        "ScanIndexForward": False,
+        "Limit": Limit,
+    }
+    if ExclusiveStartKey:
+        query["ExclusiveStartKey"] = {
+            FILM_PK: {"S": GuildID},
+            FILM_SK: {"S": ExclusiveStartKey},
+        }
+
+    response = client.query(**query)
+    LastEvaluatedKey = response.get("LastEvaluatedKey", None)
+    if LastEvaluatedKey:
+        LastEvaluatedKey = LastEvaluatedKey[FILM_SK]["S"]
+    return (list(map(Film.fromDict, response["Items"])), LastEvaluatedKey)
+
+
+def migrate_film(client, GuildID, film):
+    """
+    Move the specified `film`, which was read from `GuildID` with a v1 sort
+    key, and its attendance records to v2 sort keys.  Return `True` if the
+    film was migrated and `False` if the film changed since it was read.
+    """
+    old_sk = film.LegacySK
+    assert old_sk is not None
+    old_suffix = old_sk.removeprefix("FILM#WATCHED#")
+    film.LegacySK = None
+
+    # Write the new attendance records first so that if we are interrupted
+    # there is nothing to clean up when we try again.  `record_attendance_vote`
+    # only writes v2 attendance records, so these never go missing.
+    users = film.UsersAttended or set()
+    requests = []
+    for user_id in users:
+        attendance = Attendance(
+            DiscordUserID=user_id,
+            FilmID=film.FilmID,
+            FilmName=film.FilmName,
+            DateWatched=film.DateWatched,
+        )
+        requests += [
+            {"PutRequest": {"Item": attendance.toDict(GuildID=GuildID)}},
+            {
+                "DeleteRequest": {
+                    "Key": {
+                        FILM_PK: {"S": GuildID},
+                        FILM_SK: {"S": f"ATTENDED#{user_id}#{old_suffix}"},
+                    }
+                }
+            },
+        ]
+    batch_write(client, requests)
+
+    # Attendance can only be added, so if the number of attendees is
+    # unchanged then the film is unchanged
+    if users:
+        condition = f"size({FILM_UsersAttended}) = :Count"
+        values = {":Count": {"N": str(len(users))}}
+    else:
+        condition = f"{FILM_UsersAttended} = :Null"
+        values = {":Null": {"NULL": True}}
+
+    try:
+        client.transact_write_items(
+            TransactItems=[
+                {
+                    "Delete": {
+                        "TableName": TABLE_NAME,
+                        "Key": {
+                            FILM_PK: {"S": GuildID},
+                            FILM_SK: {"S": old_sk},
+                        },
+                        "ExpressionAttributeValues": values,
+                        "ConditionExpression": (
+                            f"attribute_exists({FILM_SK}) AND {condition}"
+                        ),
+                    }
+                },
+                {
+                    "Put": {
+                        "TableName": TABLE_NAME,
+                        "Item": film.toDict(GuildID=GuildID),
+                        "ConditionExpression": f"attribute_not_exists({FILM_SK})",
+                    }
+                },
+            ]
+        )
+    except client.exceptions.TransactionCanceledException:
+        return False
+
+    return True
+
+
+def migrate_guild(client, GuildID, BatchSize=25, ExclusiveStartKey=None):
+    """
+    Migrate the next `BatchSize` watched films of `GuildID` with v1 sort keys,
+    starting after `ExclusiveStartKey` if specified, and return a tuple of the
+    number of films migrated, the number of films that changed while being
+    migrated and need another pass, and the sort key to resume from (or
+    `None` if this pass has finished).
+    """
+    films, nextKey = get_legacy_watched_films(
+        client, GuildID, Limit=BatchSize, ExclusiveStartKey=ExclusiveStartKey
+    )
+    migrated = 0
+    skipped = 0
+    for film in films:
+        if migrate_film(client, GuildID, film):
+            migrated += 1
+        else:
+            skipped += 1
+    return (migrated, skipped, nextKey)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Migrate a guild's watched films to v2 sort keys"
+    )
+    parser.add_argument("guild_id")
+    parser.add_argument("--batch-size", type=int, default=25)
+    parser.add_argument("--resume", default=None)
+    args = parser.parse_args()
+
+    client = boto3.client("dynamodb", region_name=os.environ["AWS_REGION"])
+    nextKey = args.resume
+    for _ in range(MAX_PASSES):
+        total_skipped = 0
+        while True:
+            migrated, skipped, nextKey = migrate_guild(
+                client,
+                args.guild_id,
+                BatchSize=args.batch_size,
+                ExclusiveStartKey=nextKey,
+            )
+            total_skipped += skipped
+            print(f"Migrated {migrated} films ({skipped} changed)")
+            if nextKey is None:
+                break
+            print(f"Resume with --resume '{nextKey}'")
+
+        if total_skipped == 0:
+            print("Finished")
+            return
+
+    print(f"Gave up after {MAX_PASSES} passes, please run again")
+
+
+if __name__ == "__main__":
+    main()
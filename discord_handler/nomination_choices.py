@@ -0,0 +1,138 @@
+from cache import LRUCache
+from filmbot import Film, normalize_title
+
+# Discord shows at most 25 autocomplete choices
+MAX_CHOICES = 25
+
+# `/vote` and `/watch` autocomplete requests are sent for every character
+# typed, so each guild's nominations are kept in memory between them.  They
+# are replaced whenever this container changes the nominations, but other
+# containers may change them too, so they are only trusted for a short time.
+NOMINATION_CACHE_SIZE = 256
+NOMINATION_CACHE_TTL = 30
+
+# The fraction of the trigrams of what has been typed that have to appear in
+# a film's title for it to match, which allows for the odd typo
+MIN_SIMILARITY = 0.5
+
+# Created outside of the handler so it can be reused in AWS Lambda "hot
+# starts"
+nomination_cache = LRUCache(
+    MaxSize=NOMINATION_CACHE_SIZE, TTL=NOMINATION_CACHE_TTL
+)
+
+
+def trigrams(key, Partial=False):
+    """
+    Return the set of trigrams of the normalized `key`, padded so that the
+    start and end of each word count.  If `Partial` then the last word may
+    not have been finished yet, so its end isn't padded.
+    """
+    padded = f"  {key.replace(' ', '  ')}" + ("" if Partial else " ")
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(query_key, query_trigrams, title_key, title_trigrams):
+    """
+    Return how closely a title matches a query between 0 and 1, where 1 means
+    that the title contains the query.
+    """
+    if query_key in title_key:
+        return 1.0
+    if not query_trigrams:
+        return 0.0
+    return len(query_trigrams & title_trigrams) / len(query_trigrams)
+
+
+class NominationChoices:
+    """
+    The autocomplete choices for a guild's nominations, computed once so that
+    they can be filtered as the user types without querying DynamoDB.
+    """
+
+    def __init__(self, nominations):
+        """
+        Create the choices for `nominations`, which is an array of films with
+        the most recently nominated first as returned by
+        `get_recent_nominations`.
+        """
+        self._by_recency = [
+            (
+                film,
+                {"name": film.FilmName, "value": film.FilmID},
+                normalize_title(film.FilmName),
+                trigrams(normalize_title(film.FilmName)),
+            )
+            for film in nominations
+        ]
+        self._by_votes = sorted(
+            self._by_recency, key=lambda c: Film.sortKey(c[0])
+        )
+
+    def __len__(self):
+        return len(self._by_votes)
+
+    @staticmethod
+    def _filter(choices, query):
+        """Return at most `MAX_CHOICES` of `choices` that match `query`, with
+        the closest matches first."""
+        key = normalize_title(query)
+        if not key:
+            return [c[1] for c in choices[:MAX_CHOICES]]
+
+        query_trigrams = trigrams(key, Partial=True)
+        scored = []
+        for position, (_, choice, title_key, title_trigrams) in enumerate(
+            choices
+        ):
+            score = similarity(key, query_trigrams, title_key, title_trigrams)
+            if score >= MIN_SIMILARITY:
+                scored.append((-score, position, choice))
+        scored.sort()
+        return [choice for (_, _, choice) in scored[:MAX_CHOICES]]
+
+    def vote_choices(self, query, UserID):
+        """
+        Return the choices for `/vote` matching `query`, with the newest
+        nominations first and without `UserID`'s own nomination as they
+        can't vote for it.
+        """
+        return self._filter(
+            [c for c in self._by_recency if c[0].DiscordUserID != UserID],
+            query,
+        )
+
+    def watch_choices(self, query):
+        """
+        Return the choices for `/watch` matching `query`, with the film most
+        likely to be watched first.
+        """
+        return self._filter(self._by_votes, query)
+
+
+def get_nomination_choices(filmbot):
+    """Return the `NominationChoices` for `filmbot`'s guild."""
+    choices = nomination_cache.get(filmbot.guildID)
+    if choices is None:
+        # Autocomplete can't tell the user that choices are missing, so read
+        # all of them even if we are out of time.  Once read they are cached
+        # for the next keystroke, even if Discord has stopped waiting.
+        nominations = filmbot.get_recent_nominations(Truncate=False)
+        choices = update_nomination_choices(filmbot.guildID, nominations)
+    return choices
+
+
+def update_nomination_choices(GuildID, nominations):
+    """
+    Replace the cached choices for `GuildID` with `nominations`, which have
+    just been read with `get_recent_nominations`, and return them.
+    """
+    choices = NominationChoices(nominations)
+    nomination_cache.put(GuildID, choices)
+    return choices
+
+
+def invalidate_nomination_choices(GuildID):
+    """Forget the cached choices for `GuildID` after its nominations or
+    votes have changed."""
+    nomination_cache.invalidate(GuildID)
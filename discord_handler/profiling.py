@@ -0,0 +1,142 @@
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from request_log import dumps
+
+# Invocations from the guilds in this comma separated list of guild IDs, or
+# from every guild if it is "*", are profiled.  Profiling is far too slow to
+# leave on for every request, so this lets us profile the real workload of a
+# guild that has a problem without slowing down anyone else.
+PROFILE_GUILDS = "FILMBOT_PROFILE_GUILDS"
+
+# What to profile: "cpu" for `cProfile`, "memory" for `tracemalloc`, or both
+# separated by a comma.  Defaults to "cpu".
+PROFILE_MODE = "FILMBOT_PROFILE_MODE"
+
+# If set, the full profiles are written to this directory (e.g. "/tmp") as
+# well as the summaries that are logged.  `flame_graph.py` turns the
+# `.pstats` files into flame graphs.
+PROFILE_DIR = "FILMBOT_PROFILE_DIR"
+
+
+class ProfileMode:
+    CPU = "cpu"
+    MEMORY = "memory"
+
+
+# The number of functions and allocation sites in each logged summary
+PROFILE_TOP = 20
+
+
+def profile_modes(Guild):
+    """Return the set of `ProfileMode`s to profile a request from `Guild`
+    with, which is empty unless the environment asks for it."""
+    guilds = os.environ.get(PROFILE_GUILDS)
+    if not guilds:
+        return set()
+    guilds = {g.strip() for g in guilds.split(",")}
+    if "*" not in guilds and Guild not in guilds:
+        return set()
+    modes = os.environ.get(PROFILE_MODE) or ProfileMode.CPU
+    return {m.strip() for m in modes.split(",")} & {
+        ProfileMode.CPU,
+        ProfileMode.MEMORY,
+    }
+
+
+def function_name(function):
+    """Return the `pstats` key of a function as "file:line(name)"."""
+    filename, line, name = function
+    if filename == "~":
+        # Built-in functions have no file
+        return name
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+
+def cpu_summary(stats, Top=PROFILE_TOP):
+    """Return the `Top` functions in the `pstats.Stats` by cumulative time,
+    with their call counts and own and cumulative times."""
+    functions = sorted(
+        stats.stats.items(), key=lambda item: item[1][3], reverse=True
+    )
+    return [
+        {
+            "function": function_name(function),
+            "calls": calls,
+            "tottime_ms": round(tottime * 1000, 3),
+            "cumtime_ms": round(cumtime * 1000, 3),
+        }
+        for (function, (_, calls, tottime, cumtime, _)) in functions[:Top]
+    ]
+
+
+def memory_summary(snapshot, Top=PROFILE_TOP):
+    """Return the `Top` lines in the `tracemalloc` snapshot by the size of
+    the memory they allocated that was still in use."""
+    return [
+        {
+            "line": f"{os.path.basename(s.traceback[0].filename)}:"
+            f"{s.traceback[0].lineno}",
+            "size_kb": round(s.size / 1024, 1),
+            "count": s.count,
+        }
+        for s in snapshot.statistics("lineno")[:Top]
+    ]
+
+
+def profile_path(Command, Guild, extension):
+    directory = os.environ.get(PROFILE_DIR)
+    if not directory:
+        return None
+    now = int(time.time() * 1000)
+    return os.path.join(directory, f"{Command}-{Guild}-{now}.{extension}")
+
+
+@contextmanager
+def profiling(modes, *, Command, Guild):
+    import cProfile
+    import pstats
+    import tracemalloc
+
+    profiler = None
+    if ProfileMode.CPU in modes:
+        profiler = cProfile.Profile()
+    if ProfileMode.MEMORY in modes:
+        tracemalloc.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        line = {"profile": Command, "guild": Guild}
+        if ProfileMode.MEMORY in modes:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            line["peak_kb"] = round(peak / 1024, 1)
+            line["allocations"] = memory_summary(snapshot)
+            path = profile_path(Command, Guild, "tracemalloc")
+            if path is not None:
+                snapshot.dump(path)
+                line["tracemalloc_file"] = path
+        if profiler is not None:
+            line["functions"] = cpu_summary(pstats.Stats(profiler))
+            path = profile_path(Command, Guild, "pstats")
+            if path is not None:
+                profiler.dump_stats(path)
+                line["pstats_file"] = path
+        print(dumps(line))
+
+
+def profile_request(*, Command, Guild):
+    """
+    Return a context manager that profiles the code within it and logs a
+    summary of the profile, if profiling is switched on for `Guild`.
+    Otherwise it does nothing.
+    """
+    modes = profile_modes(Guild)
+    if not modes:
+        return nullcontext()
+    return profiling(modes, Command=Command, Guild=Guild)
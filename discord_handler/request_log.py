@@ -0,0 +1,86 @@
+import json
+import os
+import random
+
+# `orjson` is much quicker than `json` for the events we log, but is optional
+# as it needs a wheel built for the Lambda's architecture
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The fraction of requests that have their full event and response logged,
+# unless this environment variable says otherwise.  Failed requests are
+# always logged in full.
+LOG_SAMPLE_RATE = "FILMBOT_LOG_SAMPLE_RATE"
+DEFAULT_SAMPLE_RATE = 0.01
+
+# Strings in logged payloads are cut down to this many characters, as the
+# raw body and message contents are the bulk of what we would log
+MAX_FIELD_SIZE = 256
+
+
+class Outcome:
+    OK = "ok"
+    ERROR = "error"
+
+
+def dumps(value):
+    """Return `value` serialized as a single line of JSON."""
+    if orjson is not None:
+        return orjson.dumps(value, default=str).decode()
+    return json.dumps(value, separators=(",", ":"), default=str)
+
+
+def truncate(value, MaxSize=MAX_FIELD_SIZE):
+    """Return a copy of `value` with any strings in it longer than `MaxSize`
+    cut down and marked with how much was cut."""
+    if isinstance(value, str):
+        if len(value) <= MaxSize:
+            return value
+        return f"{value[:MaxSize]}...(+{len(value) - MaxSize} chars)"
+    if isinstance(value, dict):
+        return {k: truncate(v, MaxSize) for (k, v) in value.items()}
+    if isinstance(value, list):
+        return [truncate(v, MaxSize) for v in value]
+    return value
+
+
+def sample_rate():
+    """Return the fraction of requests to log in full."""
+    try:
+        return float(os.environ.get(LOG_SAMPLE_RATE, DEFAULT_SAMPLE_RATE))
+    except ValueError:
+        return DEFAULT_SAMPLE_RATE
+
+
+def request_summary(event):
+    """Return what is logged for every request: its interaction type, the
+    command or button it is for and the guild it came from."""
+    body = event.get("body-json") or {}
+    data = body.get("data") or {}
+    return {
+        "type": body.get("type"),
+        "command": data.get("name") or data.get("custom_id"),
+        "guild": body.get("guild_id"),
+    }
+
+
+def log_request(event, response, *, Latency, Error=None, Sampled=None):
+    """
+    Log a line of JSON for the request in `event` that took `Latency`
+    seconds, with its full (truncated) `event` and `response` if it is
+    `Sampled` or raised `Error`.  Requests are sampled at `sample_rate()`
+    unless `Sampled` is specified.
+    """
+    line = request_summary(event)
+    line["latency_ms"] = round(Latency * 1000, 1)
+    line["outcome"] = Outcome.OK if Error is None else Outcome.ERROR
+    if Error is not None:
+        line["error"] = truncate(f"{type(Error).__name__}: {Error}")
+    if Sampled is None:
+        Sampled = random.random() < sample_rate()
+    if Sampled or Error is not None:
+        line["event"] = truncate(event)
+        line["response"] = truncate(response)
+    print(dumps(line))
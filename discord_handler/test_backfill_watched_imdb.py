@@ -0,0 +1,67 @@
+import unittest
+import boto3
+from moto import mock_dynamodb
+from backfill_watched_imdb import backfill_guild
+from filmbot import TABLE_NAME, FilmBot, Film
+from test_filmbot import set_db
+from UserError import UserError
+from datetime import datetime, timedelta
+
+AWS_REGION = "eu-west-2"
+
+
+class TestBackfillWatchedIMDb(unittest.TestCase):
+    mock_dynamodb = mock_dynamodb()
+
+    def setUp(self):
+        self.maxDiff = None
+
+        self.mock_dynamodb.start()
+        boto3.setup_default_session()
+        self.dynamodb_client = boto3.client("dynamodb", region_name=AWS_REGION)
+        set_db(self.dynamodb_client, {})
+
+    def tearDown(self):
+        self.mock_dynamodb.stop()
+
+    def test_backfill_guild(self):
+        guild = "TEST-GUILD"
+        filmbot = FilmBot(DynamoDBClient=self.dynamodb_client, GuildID=guild)
+        d = datetime(2001, 1, 1, 5, 0, 0)
+
+        # Films watched before the "WATCHEDIMDB#*" records were added
+        for i, imdb_id in enumerate(["0078748", "0090605", None, "0078748"]):
+            film = Film(
+                FilmID=f"film{i}",
+                FilmName=f"Film {i}",
+                IMDbID=imdb_id,
+                DiscordUserID="A",
+                CastVotes=0,
+                AttendanceVotes=0,
+                UsersAttended=set(["A"]),
+                DateNominated=d,
+                DateWatched=d + timedelta(days=i),
+            )
+            self.dynamodb_client.put_item(
+                TableName=TABLE_NAME, Item=film.toDict(GuildID=guild)
+            )
+        self.assertEqual(filmbot.get_watched_imdb_ids(), set())
+
+        self.assertEqual(backfill_guild(self.dynamodb_client, guild), 2)
+        self.assertEqual(
+            filmbot.get_watched_imdb_ids(), set(["0078748", "0090605"])
+        )
+
+        # The most recent watch is used
+        with self.assertRaises(UserError) as e:
+            filmbot.nominate_film(
+                DiscordUserID="A",
+                FilmName="Alien",
+                IMDbID="0078748",
+                DateTime=d,
+            )
+        self.assertTrue(str(e.exception).startswith("Film 3 was already"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+from bloom import BloomFilter
+
+
+class TestBloomFilter(unittest.TestCase):
+    def test_bloom_filter(self):
+        added = [f"{i:07}" for i in range(0, 2000, 2)]
+        bloom = BloomFilter.fromItems(added, Capacity=1000, ErrorRate=0.01)
+        self.assertEqual(len(bloom), 1000)
+        self.assertTrue(bloom.isFull())
+
+        # No false negatives, and about as many false positives as expected
+        self.assertTrue(all(i in bloom for i in added))
+        false_positives = sum(f"{i:07}" in bloom for i in range(1, 2000, 2))
+        self.assertLess(false_positives, 30)
+
+        # It's compact compared to the IDs themselves
+        self.assertLess(len(bloom.toBytes()), 1300)
+
+        copy = BloomFilter.fromBytes(bloom.toBytes())
+        self.assertEqual(copy, bloom)
+        self.assertEqual(len(copy), 1000)
+        self.assertTrue(all(i in copy for i in added))
+
+    def test_empty(self):
+        bloom = BloomFilter(Capacity=64)
+        self.assertNotIn("0078748", bloom)
+        self.assertFalse(bloom.isFull())
+        bloom.add("0078748")
+        self.assertIn("0078748", bloom)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+from cache import LRUCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_lru(self):
+        cache = LRUCache(MaxSize=2, TTL=10, Clock=FakeClock())
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+
+        # "b" is now the least recently used
+        cache.put("c", 3)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+
+        self.assertEqual(cache.hits, 3)
+        self.assertEqual(cache.misses, 2)
+        self.assertEqual(cache.hit_rate, 0.6)
+
+        cache.invalidate("a")
+        cache.invalidate("b")
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_ttl(self):
+        clock = FakeClock()
+        cache = LRUCache(MaxSize=10, TTL=10, NegativeTTL=2, Clock=clock)
+        cache.put("a", [1])
+        cache.put("empty", [])
+
+        clock.now = 1
+        self.assertEqual(cache.get("a"), [1])
+        self.assertEqual(cache.get("empty"), [])
+
+        # Empty values expire first
+        clock.now = 2
+        self.assertEqual(cache.get("a"), [1])
+        self.assertIsNone(cache.get("empty"))
+
+        clock.now = 10
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
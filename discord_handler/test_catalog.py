@@ -0,0 +1,86 @@
+import unittest
+import boto3
+from moto import mock_dynamodb
+from catalog import (
+    FilmMetadata,
+    catalog_cache,
+    get_catalog_entries,
+    put_catalog_entry,
+)
+from test_filmbot import set_db
+
+AWS_REGION = "eu-west-2"
+
+
+class CountingClient:
+    """Counts the `batch_get_item` calls made through a DynamoDB client."""
+
+    def __init__(self, client):
+        self._client = client
+        self.exceptions = client.exceptions
+        self.batch_gets = 0
+
+    def batch_get_item(self, **kwargs):
+        self.batch_gets += 1
+        return self._client.batch_get_item(**kwargs)
+
+    def put_item(self, **kwargs):
+        return self._client.put_item(**kwargs)
+
+
+class TestCatalog(unittest.TestCase):
+    mock_dynamodb = mock_dynamodb()
+
+    def setUp(self):
+        self.maxDiff = None
+
+        self.mock_dynamodb.start()
+        boto3.setup_default_session()
+        self.dynamodb_client = boto3.client("dynamodb", region_name=AWS_REGION)
+        set_db(self.dynamodb_client, {})
+        self.client = CountingClient(self.dynamodb_client)
+        catalog_cache.clear()
+
+    def tearDown(self):
+        catalog_cache.clear()
+        self.mock_dynamodb.stop()
+
+    def test_catalog(self):
+        alien = FilmMetadata(Runtime=117, ReleaseYear=1979, IMDbTitle="Alien")
+        unknown = FilmMetadata(Runtime=None, ReleaseYear=None, IMDbTitle="?")
+        self.assertEqual(get_catalog_entries(self.client, ["0078748"]), {})
+
+        # Entries are only written once
+        self.assertTrue(put_catalog_entry(self.client, "0078748", alien))
+        self.assertTrue(put_catalog_entry(self.client, "0000001", unknown))
+        self.assertFalse(put_catalog_entry(self.client, "0078748", unknown))
+
+        self.client.batch_gets = 0
+        self.assertEqual(
+            get_catalog_entries(
+                self.client, ["0078748", "0000001", "0000002", "0078748", None]
+            ),
+            {"0078748": alien, "0000001": unknown},
+        )
+        self.assertEqual(self.client.batch_gets, 1)
+
+        # Now they come from memory
+        self.assertEqual(
+            get_catalog_entries(self.client, ["0000001", "0000002"]),
+            {"0000001": unknown},
+        )
+        self.assertEqual(self.client.batch_gets, 1)
+
+    def test_batches(self):
+        metadata = FilmMetadata(Runtime=90, ReleaseYear=2000, IMDbTitle="X")
+        imdb_ids = [f"{i:07}" for i in range(150)]
+        for imdb_id in imdb_ids[::2]:
+            put_catalog_entry(self.client, imdb_id, metadata)
+
+        entries = get_catalog_entries(self.client, imdb_ids)
+        self.assertEqual(entries, {i: metadata for i in imdb_ids[::2]})
+        self.assertEqual(self.client.batch_gets, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+import lambda_function
+from benchmark_cold_start import import_time
+from test_lambda_function import SignedEventTestCase
+
+# Modules that must only be imported by the requests that need them
+LAZY_MODULES = ["boto3", "botocore", "imdb"]
+
+
+class TestColdStart(unittest.TestCase):
+    # How long the imports take depends on the machine, so that is checked
+    # by `benchmark_cold_start.py` instead
+    def test_lambda_function_imports(self):
+        _, imported = import_time("lambda_function")
+        for module in LAZY_MODULES + ["discord_handler"]:
+            self.assertNotIn(module, imported)
+
+    def test_discord_handler_imports(self):
+        _, imported = import_time("discord_handler")
+        for module in LAZY_MODULES:
+            self.assertNotIn(module, imported)
+
+
+class TestPing(SignedEventTestCase):
+    def test_ping(self):
+        self.assertEqual(
+            lambda_function.lambda_handler(self.event({"type": 1}), None),
+            {"type": 1},
+        )
+
+    def test_verify_key_is_reused(self):
+        lambda_function.lambda_handler(self.event({"type": 1}), None)
+        verify_key = lambda_function._verify_key
+        lambda_function.lambda_handler(self.event({"type": 1}), None)
+        self.assertIs(lambda_function._verify_key, verify_key)
+
+    def test_bad_signature(self):
+        with self.assertRaisesRegex(Exception, "UNAUTHORIZED"):
+            lambda_function.lambda_handler(
+                self.event({"type": 1}, Signature="00" * 64), None
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
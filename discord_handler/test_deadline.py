@@ -0,0 +1,235 @@
+import time
+import unittest
+from datetime import datetime, timedelta
+import boto3
+from moto import mock_dynamodb
+import deferral
+from deferral import LocalDeferrer
+from discord_handler import (
+    TRUNCATED_NOTE,
+    DiscordFlag,
+    DiscordResponse,
+    handle_discord,
+    interaction_age,
+)
+from filmbot import ATTENDANCE_RETRIES, FilmBot
+from guild_ranking import ranking_cache
+from lambda_function import (
+    LAMBDA_DEADLINE_MARGIN,
+    RESPONSE_DEADLINE,
+    request_deadline,
+)
+from nomination_choices import get_nomination_choices, nomination_cache
+from test_deferral import FakeWebhookClient, command_event
+from test_discord_handler import set_db
+from UserError import UserError
+
+AWS_REGION = "eu-west-2"
+
+GUILD = "123"
+
+
+class PagedClient:
+    """Returns one item per page from every query, so that a few items
+    take several pages to read."""
+
+    def __init__(self, client):
+        self._client = client
+        self.queries = 0
+
+    def query(self, **kwargs):
+        self.queries += 1
+        return self._client.query(**{"Limit": 1, **kwargs})
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class ContendedClient:
+    """Fails every transaction as if another request got there first."""
+
+    def __init__(self, client):
+        self._client = client
+        self.transactions = 0
+
+    def transact_write_items(self, **kwargs):
+        self.transactions += 1
+        raise self._client.exceptions.TransactionCanceledException(
+            {"Error": {"Code": "TransactionCanceledException"}},
+            "TransactWriteItems",
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class FakeContext:
+    def __init__(self, remaining):
+        self.remaining = remaining
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining
+
+
+class TestDeadline(unittest.TestCase):
+    mock_dynamodb = mock_dynamodb()
+
+    def setUp(self):
+        self.mock_dynamodb.start()
+        boto3.setup_default_session()
+        self.dynamodb_client = boto3.client("dynamodb", region_name=AWS_REGION)
+        set_db(self.dynamodb_client, {})
+        nomination_cache.clear()
+        ranking_cache.clear()
+
+        filmbot = FilmBot(DynamoDBClient=self.dynamodb_client, GuildID=GUILD)
+        for user in ["A", "B", "C"]:
+            filmbot.nominate_film(
+                DiscordUserID=user,
+                FilmName=f"Film{user}",
+                IMDbID=None,
+                DateTime=datetime.now(),
+            )
+        self.client = PagedClient(self.dynamodb_client)
+
+    def tearDown(self):
+        deferral._deferrer = None
+        deferral._webhook_client = None
+        self.mock_dynamodb.stop()
+
+    def filmbot(self, Deadline):
+        return FilmBot(
+            DynamoDBClient=self.client, GuildID=GUILD, Deadline=Deadline
+        )
+
+    def test_truncated_reads(self):
+        filmbot = self.filmbot(Deadline=None)
+        self.assertEqual(len(filmbot.get_nominations()), 3)
+        self.assertEqual(len(filmbot.get_users_by_nomination()), 3)
+        self.assertFalse(filmbot.truncated)
+
+        filmbot = self.filmbot(Deadline=time.monotonic() - 1)
+        self.assertLess(len(filmbot.get_nominations()), 3)
+        self.assertTrue(filmbot.truncated)
+
+        # Reads that we write from are always complete
+        filmbot = self.filmbot(Deadline=time.monotonic() - 1)
+        self.assertEqual(len(filmbot.get_users()), 3)
+        self.assertFalse(filmbot.truncated)
+
+    def test_choices_are_never_truncated(self):
+        filmbot = self.filmbot(Deadline=time.monotonic() - 1)
+        choices = get_nomination_choices(filmbot)
+        self.assertEqual(len(choices.watch_choices("")), 3)
+        self.assertFalse(filmbot.truncated)
+        self.assertIs(nomination_cache.get(GUILD), choices)
+
+    def test_truncated_response(self):
+        response = handle_discord(
+            command_event("peek"), self.client, Deadline=time.monotonic() - 1
+        )
+        self.assertTrue(response["data"]["content"].endswith(TRUNCATED_NOTE))
+
+        response = handle_discord(command_event("peek"), self.client)
+        self.assertNotIn(TRUNCATED_NOTE, response["data"]["content"])
+
+    def test_attendance_retries_stop(self):
+        client = ContendedClient(self.dynamodb_client)
+        now = datetime.now()
+        filmbot = FilmBot(DynamoDBClient=self.dynamodb_client, GuildID=GUILD)
+        filmbot.start_watching_film(
+            FilmID=filmbot.get_nominations()[0].FilmID,
+            PresentUserIDs=["A"],
+            DateTime=now,
+        )
+
+        for deadline, attempts in [
+            (None, ATTENDANCE_RETRIES),
+            (time.monotonic() - 1, 1),
+        ]:
+            client.transactions = 0
+            filmbot = FilmBot(
+                DynamoDBClient=client, GuildID=GUILD, Deadline=deadline
+            )
+            with self.assertRaises(UserError):
+                filmbot.record_attendance_vote(
+                    DiscordUserID="B", DateTime=now + timedelta(minutes=1)
+                )
+            self.assertEqual(client.transactions, attempts)
+
+    def test_deferred_when_short_of_time(self):
+        deferrer = LocalDeferrer(self.dynamodb_client)
+        webhook = FakeWebhookClient()
+        deferral._deferrer = deferrer
+        deferral._webhook_client = webhook
+
+        response = handle_discord(
+            command_event("peek"),
+            self.client,
+            Deadline=time.monotonic() + 0.1,
+        )
+        self.assertEqual(
+            response,
+            {
+                "type": DiscordResponse.DEFERRED_CHANNEL_MESSAGE_WITH_SOURCE,
+                "data": {"flags": DiscordFlag.EPHEMERAL_FLAG},
+            },
+        )
+        deferrer.wait()
+        ((request, *_, data),) = webhook.requests
+        self.assertEqual(request, "edit")
+        self.assertIn("FilmA", data["content"])
+
+        # Public commands are acknowledged publicly
+        response = handle_discord(
+            command_event("vote", [{"value": "film"}]),
+            self.client,
+            Deadline=time.monotonic() + 0.1,
+        )
+        self.assertEqual(
+            response,
+            {"type": DiscordResponse.DEFERRED_CHANNEL_MESSAGE_WITH_SOURCE},
+        )
+        deferrer.wait()
+
+        response = handle_discord(
+            command_event("peek"),
+            self.client,
+            Deadline=time.monotonic() + 60,
+        )
+        self.assertEqual(
+            response["type"], DiscordResponse.CHANNEL_MESSAGE_WITH_SOURCE
+        )
+
+    def test_request_deadline(self):
+        now = time.monotonic()
+        self.assertIsNone(request_deadline(None, Deferred=True))
+        self.assertAlmostEqual(
+            request_deadline(None), now + RESPONSE_DEADLINE, delta=0.1
+        )
+        self.assertAlmostEqual(
+            request_deadline(FakeContext(1000)),
+            now + 1 - LAMBDA_DEADLINE_MARGIN,
+            delta=0.1,
+        )
+        self.assertAlmostEqual(
+            request_deadline(FakeContext(60000), Deferred=True),
+            now + 60 - LAMBDA_DEADLINE_MARGIN,
+            delta=0.1,
+        )
+
+    def test_interaction_age(self):
+        def event(timestamp):
+            return {"params": {"header": {"x-signature-timestamp": timestamp}}}
+
+        # Discord's timestamps are in whole seconds, so we give it the rest
+        # of the second
+        self.assertEqual(interaction_age(event("100"), Now=100.5), 0)
+        self.assertEqual(interaction_age(event("100"), Now=103.5), 2.5)
+        # Deferred requests and tests don't have one
+        self.assertEqual(interaction_age({}, Now=103.5), 0)
+        self.assertEqual(interaction_age(event("soon"), Now=103.5), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
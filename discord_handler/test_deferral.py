@@ -0,0 +1,268 @@
+import json
+import unittest
+import urllib.request
+import boto3
+from moto import mock_dynamodb
+import deferral
+import lambda_function
+from deferral import (
+    DEFERRED,
+    DiscordWebhookClient,
+    LambdaDeferrer,
+    LocalDeferrer,
+)
+from discord_handler import (
+    DEFERRED_FAILURE_MESSAGE,
+    DiscordFlag,
+    DiscordRequest,
+    DiscordResponse,
+    handle_discord,
+)
+from guild_ranking import ranking_cache
+from nomination_choices import nomination_cache
+from test_discord_handler import set_db
+
+AWS_REGION = "eu-west-2"
+
+
+class FakeWebhookClient:
+    """Records the requests that would be made to Discord."""
+
+    def __init__(self):
+        self.requests = []
+
+    def edit_original_response(self, ApplicationID, Token, data):
+        self.requests.append(("edit", ApplicationID, Token, data))
+
+    def delete_original_response(self, ApplicationID, Token):
+        self.requests.append(("delete", ApplicationID, Token))
+
+    def create_followup_message(self, ApplicationID, Token, data):
+        self.requests.append(("followup", ApplicationID, Token, data))
+
+
+class FailingDeferrer:
+    def send(self, event):
+        raise Exception("Lambda is down")
+
+
+class FakeLambdaClient:
+    def __init__(self):
+        self.invocations = []
+
+    def invoke(self, **kwargs):
+        self.invocations.append(kwargs)
+
+
+def command_event(name, options=None):
+    data = {"name": name}
+    if options is not None:
+        data["options"] = options
+    return {
+        "body-json": {
+            "type": DiscordRequest.APPLICATION_COMMAND,
+            "application_id": "app",
+            "token": "token",
+            "data": data,
+            "guild_id": "123",
+            "member": {"user": {"id": "abc"}},
+        }
+    }
+
+
+class TestDeferral(unittest.TestCase):
+    mock_dynamodb = mock_dynamodb()
+
+    def setUp(self):
+        self.maxDiff = None
+
+        self.mock_dynamodb.start()
+        boto3.setup_default_session()
+        self.dynamodb_client = boto3.client("dynamodb", region_name=AWS_REGION)
+        set_db(self.dynamodb_client, {})
+        nomination_cache.clear()
+        ranking_cache.clear()
+
+        self.deferrer = LocalDeferrer(self.dynamodb_client)
+        self.webhook = FakeWebhookClient()
+        deferral._deferrer = self.deferrer
+        deferral._webhook_client = self.webhook
+
+    def tearDown(self):
+        deferral._deferrer = None
+        deferral._webhook_client = None
+        self.mock_dynamodb.stop()
+
+    def test_ephemeral_command(self):
+        self.assertEqual(
+            handle_discord(command_event("history"), self.dynamodb_client),
+            {
+                "type": DiscordResponse.DEFERRED_CHANNEL_MESSAGE_WITH_SOURCE,
+                "data": {"flags": DiscordFlag.EPHEMERAL_FLAG},
+            },
+        )
+        self.deferrer.wait()
+        self.assertEqual(
+            self.webhook.requests,
+            [
+                (
+                    "edit",
+                    "app",
+                    "token",
+                    {"content": "No films have yet been watched."},
+                )
+            ],
+        )
+
+    def test_public_command_with_user_error(self):
+        self.assertEqual(
+            handle_discord(
+                command_event("watch", [{"value": "film"}]),
+                self.dynamodb_client,
+            ),
+            {"type": DiscordResponse.DEFERRED_CHANNEL_MESSAGE_WITH_SOURCE},
+        )
+        self.deferrer.wait()
+        self.assertEqual(
+            self.webhook.requests,
+            [
+                ("delete", "app", "token"),
+                (
+                    "followup",
+                    "app",
+                    "token",
+                    {
+                        "content": (
+                            "There is no nominated film with that ID (film)"
+                        ),
+                        "flags": DiscordFlag.EPHEMERAL_FLAG,
+                    },
+                ),
+            ],
+        )
+
+    def test_unexpected_failure(self):
+        # Missing its options
+        handle_discord(command_event("watch"), self.dynamodb_client)
+        self.deferrer.wait()
+        self.assertEqual(
+            self.webhook.requests[-1],
+            (
+                "followup",
+                "app",
+                "token",
+                {
+                    "content": DEFERRED_FAILURE_MESSAGE,
+                    "flags": DiscordFlag.EPHEMERAL_FLAG,
+                },
+            ),
+        )
+
+    def test_quick_commands_are_not_deferred(self):
+        self.assertEqual(
+            handle_discord(command_event("peek"), self.dynamodb_client)[
+                "type"
+            ],
+            DiscordResponse.CHANNEL_MESSAGE_WITH_SOURCE,
+        )
+        self.deferrer.wait()
+        self.assertEqual(self.webhook.requests, [])
+
+    def test_without_a_worker(self):
+        for deferrer in [None, FailingDeferrer()]:
+            deferral._deferrer = deferrer
+            self.assertEqual(
+                handle_discord(command_event("history"), self.dynamodb_client),
+                {
+                    "type": DiscordResponse.CHANNEL_MESSAGE_WITH_SOURCE,
+                    "data": {
+                        "content": "No films have yet been watched.",
+                        "flags": DiscordFlag.EPHEMERAL_FLAG,
+                    },
+                },
+            )
+        self.assertEqual(self.webhook.requests, [])
+
+    def test_lambda_deferrer(self):
+        client = FakeLambdaClient()
+        LambdaDeferrer(client, FunctionName="filmbot").send(
+            command_event("history")
+        )
+        (invocation,) = client.invocations
+        self.assertEqual(invocation["FunctionName"], "filmbot")
+        self.assertEqual(invocation["InvocationType"], "Event")
+        self.assertEqual(
+            json.loads(invocation["Payload"]),
+            {**command_event("history"), DEFERRED: True},
+        )
+
+    def test_lambda_function_runs_deferred_events(self):
+        client, lambda_function._client = (
+            lambda_function._client,
+            self.dynamodb_client,
+        )
+        try:
+            # There is no signature to verify
+            response = lambda_function.lambda_handler(
+                {**command_event("history"), DEFERRED: True}, None
+            )
+        finally:
+            lambda_function._client = client
+        self.assertEqual(
+            response["data"]["content"], "No films have yet been watched."
+        )
+        self.assertEqual(self.webhook.requests[0][0], "edit")
+
+    def test_webhook_client(self):
+        requests = []
+
+        class Response:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                return False
+
+            def read(self):
+                return b""
+
+        def urlopen(request, timeout):
+            requests.append(request)
+            return Response()
+
+        real_urlopen, urllib.request.urlopen = (
+            urllib.request.urlopen,
+            urlopen,
+        )
+        try:
+            webhook = DiscordWebhookClient(BaseURL="https://discord.test")
+            webhook.edit_original_response("app", "token", {"content": "x"})
+            webhook.delete_original_response("app", "token")
+            webhook.create_followup_message("app", "token", {"content": "y"})
+        finally:
+            urllib.request.urlopen = real_urlopen
+
+        self.assertEqual(
+            [(r.get_method(), r.full_url, r.data) for r in requests],
+            [
+                (
+                    "PATCH",
+                    "https://discord.test/webhooks/app/token/messages/@original",
+                    b'{"content": "x"}',
+                ),
+                (
+                    "DELETE",
+                    "https://discord.test/webhooks/app/token/messages/@original",
+                    None,
+                ),
+                (
+                    "POST",
+                    "https://discord.test/webhooks/app/token",
+                    b'{"content": "y"}',
+                ),
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
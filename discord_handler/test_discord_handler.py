@@ -10,7 +10,15 @@ from discord_handler import (
     DiscordMessageComponent,
     MessageComponentID,
 )
-from filmbot import TABLE_NAME, key_map
+from filmbot import (
+    TABLE_NAME,
+    NOMINATOR_HISTORY_INDEX,
+    TITLE_HISTORY_INDEX,
+    key_map,
+)
+import enrichment
+from guild_ranking import ranking_cache
+from nomination_choices import nomination_cache
 
 AWS_REGION = "eu-west-2"
 
@@ -42,6 +50,26 @@ def set_db(client, data):
         AttributeDefinitions=[
             {"AttributeName": "PK", "AttributeType": "S"},
             {"AttributeName": "SK", "AttributeType": "S"},
+            {"AttributeName": "NominatorHistory", "AttributeType": "S"},
+            {"AttributeName": "TitleHistory", "AttributeType": "S"},
+        ],
+        GlobalSecondaryIndexes=[
+            {
+                "IndexName": NOMINATOR_HISTORY_INDEX,
+                "KeySchema": [
+                    {"AttributeName": "PK", "KeyType": "HASH"},
+                    {"AttributeName": "NominatorHistory", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "ALL"},
+            },
+            {
+                "IndexName": TITLE_HISTORY_INDEX,
+                "KeySchema": [
+                    {"AttributeName": "PK", "KeyType": "HASH"},
+                    {"AttributeName": "TitleHistory", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "ALL"},
+            },
         ],
         BillingMode="PAY_PER_REQUEST",
     )
@@ -67,6 +95,14 @@ def set_db(client, data):
     client.transact_write_items(TransactItems=items)
 
 
+class FakeEnrichmentQueue:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, IMDbID):
+        self.sent.append(IMDbID)
+
+
 class TestDiscordHandler(unittest.TestCase):
     mock_dynamodb = mock_dynamodb()
 
@@ -84,6 +120,10 @@ class TestDiscordHandler(unittest.TestCase):
         self.dynamodb_client = boto3.client("dynamodb", region_name=AWS_REGION)
 
         set_db(self.dynamodb_client, {})
+        nomination_cache.clear()
+        ranking_cache.clear()
+        self.enrichment_queue = FakeEnrichmentQueue()
+        enrichment._enrichment_queue = self.enrichment_queue
 
         # Check all tables have been created
         self.assertEqual(
@@ -96,6 +136,7 @@ class TestDiscordHandler(unittest.TestCase):
         """
         Unmock `dynamodb2`.
         """
+        enrichment._enrichment_queue = None
         self.mock_dynamodb.stop()
         pass
 
@@ -266,6 +307,8 @@ class TestDiscordHandler(unittest.TestCase):
                 },
             },
         )
+        # Only films with an IMDb ID are enriched
+        self.assertEqual(self.enrichment_queue.sent, ["012345"])
 
         # /peek
         self.assertEqual(
@@ -553,6 +596,89 @@ class TestDiscordHandler(unittest.TestCase):
         )
         self.assertRegex(actual["data"]["content"], "My Film Name")
         self.assertRegex(actual["data"]["content"], "<@abc>")
+        # Only <@def> was present so only they see the film in bold
+        self.assertNotRegex(actual["data"]["content"], r"\*\*My Film Name")
+
+        # /history with filters
+        def search_history(options):
+            return handle_discord(
+                {
+                    "body-json": {
+                        "type": DiscordRequest.APPLICATION_COMMAND,
+                        "data": {
+                            "name": "history",
+                            "options": options,
+                        },
+                        "guild_id": "123",
+                        "member": {
+                            "user": {
+                                "id": "abc",
+                            },
+                        },
+                    }
+                },
+                self.dynamodb_client,
+            )
+
+        actual = handle_discord(
+            {
+                "body-json": {
+                    "type": DiscordRequest.APPLICATION_COMMAND,
+                    "data": {
+                        "name": "history",
+                    },
+                    "guild_id": "123",
+                    "member": {
+                        "user": {
+                            "id": "def",
+                        },
+                    },
+                }
+            },
+            self.dynamodb_client,
+        )
+        self.assertRegex(actual["data"]["content"], r"\*\*My Film Name\*\*")
+
+        actual = search_history(
+            [
+                {"name": "nominator", "value": "abc"},
+                {"name": "title", "value": "my FILM"},
+            ]
+        )
+        self.assertRegex(
+            actual["data"]["content"],
+            "^Here are the matching films that have been watched:\n.*My Film Name",
+        )
+        self.assertEqual(
+            search_history([{"name": "nominator", "value": "def"}]),
+            {
+                "type": DiscordResponse.CHANNEL_MESSAGE_WITH_SOURCE,
+                "data": {
+                    "content": "No watched films match your search.",
+                    "flags": DiscordFlag.EPHEMERAL_FLAG,
+                },
+            },
+        )
+        self.assertEqual(
+            search_history([{"name": "to", "value": "2000-01-01"}]),
+            {
+                "type": DiscordResponse.CHANNEL_MESSAGE_WITH_SOURCE,
+                "data": {
+                    "content": "No watched films match your search.",
+                    "flags": DiscordFlag.EPHEMERAL_FLAG,
+                },
+            },
+        )
+        self.assertEqual(
+            search_history([{"name": "from", "value": "yesterday"}]),
+            {
+                "type": DiscordResponse.CHANNEL_MESSAGE_WITH_SOURCE,
+                "data": {
+                    "content": "'yesterday' is not a valid date, use YYYY-MM-DD",
+                    "flags": DiscordFlag.EPHEMERAL_FLAG,
+                },
+            },
+        )
 
         # 5. Check shame button
         self.assertEqual(
@@ -637,6 +763,22 @@ class TestDiscordHandler(unittest.TestCase):
             },
         )
 
+        # /history of attended films
+        actual = search_history([{"name": "attended", "value": True}])
+        self.assertRegex(
+            actual["data"]["content"],
+            "^Here are the films that you have attended:\n- <t:[0-9]+:d> My Film Name\n$",
+        )
+        self.assertEqual(
+            search_history(
+                [
+                    {"name": "attended", "value": True},
+                    {"name": "title", "value": "My"},
+                ]
+            )["data"]["content"],
+            "The `attended` option cannot be combined with other options",
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,119 @@
+import json
+import unittest
+import boto3
+from moto import mock_dynamodb, mock_sqs
+import enrichment
+import film_search
+from catalog import FilmMetadata, catalog_cache, get_catalog_entries
+from enrichment import (
+    LocalEnrichmentQueue,
+    SQSEnrichmentQueue,
+    enrich_film,
+    handle_enrichment_event,
+    parse_runtime,
+)
+from test_filmbot import set_db
+
+AWS_REGION = "eu-west-2"
+
+
+class FakeIMDb:
+    def __init__(self, movies):
+        self.movies = movies
+        self.lookups = []
+
+    def get_movie(self, movieID, info):
+        self.lookups.append(movieID)
+        return self.movies[movieID]
+
+
+class TestEnrichment(unittest.TestCase):
+    mock_dynamodb = mock_dynamodb()
+    mock_sqs = mock_sqs()
+
+    def setUp(self):
+        self.maxDiff = None
+
+        self.mock_dynamodb.start()
+        self.mock_sqs.start()
+        boto3.setup_default_session()
+        self.dynamodb_client = boto3.client("dynamodb", region_name=AWS_REGION)
+        set_db(self.dynamodb_client, {})
+
+        self.imdb = FakeIMDb(
+            {
+                "0078748": {
+                    "title": "Alien",
+                    "year": 1979,
+                    "runtimes": ["117", "USA:116"],
+                },
+                "0000001": {"title": "Unknown"},
+            }
+        )
+        film_search._imdb = self.imdb
+        catalog_cache.clear()
+
+    def tearDown(self):
+        film_search._imdb = None
+        enrichment._enrichment_queue = None
+        catalog_cache.clear()
+        self.mock_sqs.stop()
+        self.mock_dynamodb.stop()
+
+    def catalog(self, IMDbID):
+        return get_catalog_entries(self.dynamodb_client, [IMDbID]).get(IMDbID)
+
+    def test_parse_runtime(self):
+        self.assertEqual(parse_runtime(["117", "USA:116"]), 117)
+        self.assertEqual(parse_runtime(["USA:116"]), 116)
+        self.assertEqual(parse_runtime(["unknown"]), None)
+        self.assertEqual(parse_runtime(None), None)
+
+    def test_enrich_film(self):
+        alien = FilmMetadata(Runtime=117, ReleaseYear=1979, IMDbTitle="Alien")
+        self.assertTrue(enrich_film(self.dynamodb_client, "0078748"))
+        self.assertEqual(self.catalog("0078748"), alien)
+
+        # IMDb is only asked once per film
+        self.assertFalse(enrich_film(self.dynamodb_client, "0078748"))
+        self.assertEqual(self.imdb.lookups, ["0078748"])
+
+        # Metadata IMDb doesn't have is left out
+        enrich_film(self.dynamodb_client, "0000001")
+        self.assertEqual(
+            self.catalog("0000001"),
+            FilmMetadata(Runtime=None, ReleaseYear=None, IMDbTitle="Unknown"),
+        )
+
+    def test_local_queue(self):
+        queue = LocalEnrichmentQueue(self.dynamodb_client)
+        queue.send("0078748")
+        queue.wait()
+        self.assertEqual(self.catalog("0078748").Runtime, 117)
+
+    def test_sqs_queue(self):
+        sqs = boto3.client("sqs", region_name=AWS_REGION)
+        queue_url = sqs.create_queue(QueueName="enrichment")["QueueUrl"]
+
+        SQSEnrichmentQueue(sqs, QueueUrl=queue_url).send("0078748")
+        messages = sqs.receive_message(QueueUrl=queue_url)["Messages"]
+        self.assertEqual(
+            json.loads(messages[0]["Body"]), {"IMDbID": "0078748"}
+        )
+
+        # Only the messages that fail are retried
+        event = {
+            "Records": [
+                {"messageId": "1", "body": messages[0]["Body"]},
+                {"messageId": "2", "body": json.dumps({"IMDbID": "9"})},
+            ]
+        }
+        self.assertEqual(
+            handle_enrichment_event(event, self.dynamodb_client),
+            {"batchItemFailures": [{"itemIdentifier": "2"}]},
+        )
+        self.assertEqual(self.catalog("0078748").Runtime, 117)
+
+
+if __name__ == "__main__":
+    unittest.main()
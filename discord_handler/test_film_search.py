@@ -0,0 +1,401 @@
+import os
+import sys
+import threading
+import time
+import tempfile
+import unittest
+import boto3
+from moto import mock_dynamodb
+import film_search
+from title_index import TitleIndex, write_title_index
+from film_search import (
+    search_films,
+    search_cache,
+    recent_searches,
+    search_key,
+    search_to_item,
+    put_table_search_async,
+    wait_for_table_writes,
+    warm_search_cache,
+    race_providers,
+    SearchProvider,
+    SearchResult,
+    SearchSource,
+    SEARCH_SUPERSET_SIZE,
+)
+from filmbot import TABLE_NAME
+from test_filmbot import set_db
+
+AWS_REGION = "eu-west-2"
+
+# How long a test waits for something that should happen straight away, only
+# to stop it from hanging if it doesn't
+TEST_TIMEOUT = 10
+
+
+class FakeMovie(dict):
+    def __init__(self, movieID, **kwargs):
+        super().__init__(**kwargs)
+        self.movieID = movieID
+
+
+class FakeIMDb:
+    def __init__(self, movies):
+        self.movies = movies
+        self.searches = []
+        # Cleared to hold searches until it is set again
+        self.answer = threading.Event()
+        self.answer.set()
+
+    def search_movie(self, title, results):
+        self.answer.wait(TEST_TIMEOUT)
+        self.searches.append(title)
+        return [m for m in self.movies if title in m["title"].lower()][
+            :results
+        ]
+
+
+class FakeProvider(SearchProvider):
+    """Answers with `results`, or if it is `slow` then only once `answer` is
+    set, so that tests don't depend on how long anything takes."""
+
+    def __init__(self, name, *, budget, results, slow=False):
+        self.name = name
+        self.budget = budget
+        self.results = results
+        self.searches = 0
+        self.answer = threading.Event()
+        if not slow:
+            self.answer.set()
+        self.answered = False
+
+    def search(self, query, Limit):
+        self.searches += 1
+        self.answer.wait(TEST_TIMEOUT)
+        self.answered = True
+        if isinstance(self.results, Exception):
+            raise self.results
+        return self.results
+
+
+class TestFilmSearch(unittest.TestCase):
+    mock_dynamodb = mock_dynamodb()
+
+    def setUp(self):
+        self.maxDiff = None
+
+        self.mock_dynamodb.start()
+        boto3.setup_default_session()
+        self.dynamodb_client = boto3.client("dynamodb", region_name=AWS_REGION)
+        set_db(self.dynamodb_client, {})
+
+        self.imdb = FakeIMDb(
+            [
+                FakeMovie("01", title="Alien", year=1979, kind="movie"),
+                FakeMovie("02", title="Alien Nation", kind="tv series"),
+                FakeMovie("03", title="Aliens", year=1986, kind="movie"),
+                FakeMovie("04", title="Alien 3", kind="movie"),
+            ]
+        )
+        film_search._imdb = self.imdb
+        search_cache.clear()
+
+    def tearDown(self):
+        film_search._imdb = None
+        film_search._title_index = None
+        search_cache.clear()
+        recent_searches.clear()
+        self.mock_dynamodb.stop()
+
+    def test_search_films(self):
+        expected = [
+            SearchResult(IMDbID="01", Title="Alien", Year=1979),
+            SearchResult(IMDbID="03", Title="Aliens", Year=1986),
+        ]
+        self.assertEqual(
+            search_films("alien", Limit=2), (expected, SearchSource.IMDB)
+        )
+
+        # Differences in case and whitespace share a cache entry
+        self.assertEqual(
+            search_films("  ALIEN ", Limit=2), (expected, SearchSource.CACHE)
+        )
+        self.assertEqual(self.imdb.searches, ["alien"])
+
+        self.assertEqual(
+            search_films("alien", Limit=3),
+            (
+                expected
+                + [SearchResult(IMDbID="04", Title="Alien 3", Year=None)],
+                SearchSource.IMDB,
+            ),
+        )
+
+        # Empty results are cached too
+        self.assertEqual(
+            search_films("predator", Limit=2), ([], SearchSource.IMDB)
+        )
+        self.assertEqual(
+            search_films("predator", Limit=2), ([], SearchSource.CACHE)
+        )
+
+        # Don't bother searching for nothing
+        self.assertEqual(search_films(" ", Limit=2), ([], SearchSource.CACHE))
+        self.assertEqual(self.imdb.searches, ["alien", "alien", "predator"])
+
+    def test_search_films_with_title_index(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "titles.idx")
+            write_title_index(path, [("Alien", 1979, 10, "01")])
+            film_search._title_index = TitleIndex(path)
+
+            # The title index is used instead of IMDb and isn't cached
+            self.assertEqual(
+                search_films("ALIEN", Limit=2),
+                (
+                    [SearchResult(IMDbID="01", Title="Alien", Year=1979)],
+                    SearchSource.INDEX,
+                ),
+            )
+            self.assertEqual(self.imdb.searches, [])
+            self.assertEqual(len(search_cache), 0)
+            film_search._title_index.close()
+
+    def test_search_films_with_table(self):
+        alien = [
+            SearchResult(IMDbID="01", Title="Alien", Year=1979),
+            SearchResult(IMDbID="03", Title="Aliens", Year=1986),
+        ]
+        self.assertEqual(
+            search_films(
+                "Alien", Limit=2, DynamoDBClient=self.dynamodb_client
+            ),
+            (alien, SearchSource.IMDB),
+        )
+        wait_for_table_writes()
+        item = self.dynamodb_client.get_item(
+            TableName=TABLE_NAME, Key=search_key("alien", 2)
+        )["Item"]
+        self.assertGreater(int(item["ExpiresAt"]["N"]), time.time())
+
+        # A new Lambda container finds the search in the table
+        search_cache.clear()
+        self.assertEqual(
+            search_films(
+                "alien", Limit=2, DynamoDBClient=self.dynamodb_client
+            ),
+            (alien, SearchSource.TABLE),
+        )
+        self.assertEqual(
+            search_films(
+                "alien", Limit=2, DynamoDBClient=self.dynamodb_client
+            ),
+            (alien, SearchSource.CACHE),
+        )
+        self.assertEqual(self.imdb.searches, ["alien"])
+
+        # Expired searches are ignored until DynamoDB deletes them
+        search_cache.clear()
+        self.dynamodb_client.put_item(
+            TableName=TABLE_NAME,
+            Item=search_to_item("alien", 2, [], time.time() - 24 * 60 * 60),
+        )
+        self.assertEqual(
+            search_films(
+                "alien", Limit=2, DynamoDBClient=self.dynamodb_client
+            ),
+            (alien, SearchSource.IMDB),
+        )
+        wait_for_table_writes()
+
+    def test_concurrent_table_writes(self):
+        class CountingClient:
+            def __init__(self):
+                self.puts = 0
+                self.lock = threading.Lock()
+
+            def put_item(self, **kwargs):
+                with self.lock:
+                    self.puts += 1
+
+        # Searches on several threads start writes, and clear out the
+        # finished ones, at the same time
+        client = CountingClient()
+        start = threading.Barrier(8)
+
+        def search(thread):
+            start.wait()
+            for i in range(500):
+                put_table_search_async(client, f"{thread} {i}", 1, [])
+
+        threads = [
+            threading.Thread(target=search, args=(t,)) for t in range(8)
+        ]
+        # Switch threads as often as possible to make the race likely
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        wait_for_table_writes()
+        self.assertEqual(client.puts, 8 * 500)
+        self.assertEqual(film_search._pending_table_writes, [])
+
+    def test_warm_search_cache(self):
+        self.assertEqual(
+            warm_search_cache(
+                self.dynamodb_client,
+                ["Alien", "alien ", "", "Aliens", "predator"],
+                Limit=2,
+            ),
+            3,
+        )
+        self.assertEqual(self.imdb.searches, ["alien", "aliens", "predator"])
+        for query in ["alien", "aliens", "predator"]:
+            self.assertIn(
+                "Item",
+                self.dynamodb_client.get_item(
+                    TableName=TABLE_NAME, Key=search_key(query, 2)
+                ),
+            )
+
+        # Already cached searches are skipped
+        self.assertEqual(
+            warm_search_cache(
+                self.dynamodb_client, ["alien", "alien 3"], Limit=2
+            ),
+            1,
+        )
+        self.assertEqual(
+            self.imdb.searches, ["alien", "aliens", "predator", "alien 3"]
+        )
+
+    def test_refine_search(self):
+        self.imdb.movies += [
+            FakeMovie("05", title="Ali", year=2001, kind="movie"),
+            FakeMovie("06", title="Muhammad Ali", year=1990, kind="movie"),
+        ]
+        alien = SearchResult(IMDbID="01", Title="Alien", Year=1979)
+        aliens = SearchResult(IMDbID="03", Title="Aliens", Year=1986)
+        alien3 = SearchResult(IMDbID="04", Title="Alien 3", Year=None)
+        ali = SearchResult(IMDbID="05", Title="Ali", Year=2001)
+        muhammad = SearchResult(IMDbID="06", Title="Muhammad Ali", Year=1990)
+
+        def search(query, user="user1"):
+            return search_films(query, Limit=2, UserID=user)
+
+        self.assertEqual(search("ali"), ([alien, aliens], SearchSource.IMDB))
+
+        # Typing more is answered from the last search
+        self.assertEqual(
+            search("alie"), ([alien, aliens], SearchSource.REFINED)
+        )
+        self.assertEqual(search("alien 3"), ([alien3], SearchSource.REFINED))
+        self.assertEqual(search("ali m"), ([muhammad], SearchSource.REFINED))
+        self.assertEqual(self.imdb.searches, ["ali"])
+
+        # Titles starting with the query are ranked first
+        self.assertEqual(
+            search_films("ali", Limit=5, UserID="user1"),
+            ([alien, aliens, alien3, ali, muhammad], SearchSource.REFINED),
+        )
+
+        # Other users and unrelated searches go back to IMDb (or its cache)
+        self.assertEqual(search("al", user="user2")[1], SearchSource.IMDB)
+        self.assertEqual(search("al")[1], SearchSource.CACHE)
+        self.assertEqual(search("predator"), ([], SearchSource.IMDB))
+        self.assertEqual(search("predators"), ([], SearchSource.IMDB))
+
+    def test_refine_truncated_search(self):
+        self.imdb.movies = [
+            FakeMovie(f"{n:02}", title=f"Film {n}", year=2000, kind="movie")
+            for n in range(SEARCH_SUPERSET_SIZE + 1)
+        ]
+
+        # There are more results than we kept, so only refine while we
+        # still have enough of them
+        self.assertEqual(
+            search_films("film", Limit=2, UserID="user1")[1],
+            SearchSource.IMDB,
+        )
+        self.assertEqual(
+            search_films("film 1", Limit=2, UserID="user1")[1],
+            SearchSource.REFINED,
+        )
+        self.assertEqual(
+            search_films("film 20", Limit=2, UserID="user1")[1],
+            SearchSource.IMDB,
+        )
+
+    def test_race_providers(self):
+        alien = [SearchResult(IMDbID="01", Title="Alien", Year=1979)]
+        aliens = [SearchResult(IMDbID="03", Title="Aliens", Year=1986)]
+
+        def race(first, second, timeout=None):
+            deadline = None if timeout is None else time.monotonic() + timeout
+            try:
+                return race_providers([first, second], "alien", 1, deadline)
+            finally:
+                first.answer.set()
+                second.answer.set()
+
+        # The first provider answers within its budget
+        first = FakeProvider("table", budget=TEST_TIMEOUT, results=alien)
+        second = FakeProvider("imdb", budget=TEST_TIMEOUT, results=aliens)
+        self.assertEqual(race(first, second), (alien, "table"))
+        self.assertEqual(second.searches, 0)
+
+        # The first provider can't answer, or fails, so we ask the second
+        # straight away rather than when it is over budget
+        for results in [None, Exception("Boom")]:
+            first = FakeProvider("table", budget=TEST_TIMEOUT, results=results)
+            second = FakeProvider("imdb", budget=TEST_TIMEOUT, results=aliens)
+            self.assertEqual(
+                race(first, second, timeout=TEST_TIMEOUT / 2), (aliens, "imdb")
+            )
+
+        # The first provider is over budget so we ask the second as well, and
+        # don't wait for the first
+        first = FakeProvider("table", budget=0.05, results=alien, slow=True)
+        second = FakeProvider("imdb", budget=TEST_TIMEOUT, results=aliens)
+        self.assertEqual(race(first, second), (aliens, "imdb"))
+        self.assertFalse(first.answered)
+
+        # Nobody answers by the deadline
+        first = FakeProvider("table", budget=0.05, results=alien, slow=True)
+        second = FakeProvider(
+            "imdb", budget=TEST_TIMEOUT, results=aliens, slow=True
+        )
+        self.assertEqual(race(first, second, timeout=0.1), (None, None))
+        self.assertFalse(first.answered or second.answered)
+
+    def test_search_films_deadline(self):
+        alien = [SearchResult(IMDbID="01", Title="Alien", Year=1979)]
+        latencies = film_search.provider_latencies["imdb"]
+        count = latencies.count
+
+        self.imdb.answer.clear()
+        self.assertEqual(
+            search_films("alien", Limit=1, Deadline=time.monotonic() + 0.05),
+            ([], SearchSource.TIMEOUT),
+        )
+
+        # The search carries on and fills the cache for next time, after
+        # which its latency is recorded
+        self.imdb.answer.set()
+        deadline = time.monotonic() + TEST_TIMEOUT
+        while latencies.count == count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(latencies.count, count + 1)
+        self.assertEqual(
+            search_films("alien", Limit=1, Deadline=time.monotonic() + 0.05),
+            (alien, SearchSource.CACHE),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
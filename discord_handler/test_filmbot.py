@@ -6,16 +6,27 @@ from moto import mock_dynamodb
 from filmbot import (
     FilmBot,
     TABLE_NAME,
+    FILM_NominatorHistory,
+    FILM_TitleHistory,
+    catalog_key,
+    NOMINATOR_HISTORY_INDEX,
+    TITLE_HISTORY_INDEX,
     AttendanceStatus,
     VotingStatus,
     Film,
     User,
+    Attendance,
+    MemberBitmap,
     unkey_map,
+    watched_suffix,
+    new_film_id,
     key_map,
 )
 from datetime import datetime, timedelta
+from threading import Barrier, Thread
 from uuid import uuid1
 from UserError import UserError
+from catalog import catalog_cache
 import copy
 
 AWS_REGION = "eu-west-2"
@@ -66,6 +77,26 @@ def set_db(client, data):
         AttributeDefinitions=[
             {"AttributeName": "PK", "AttributeType": "S"},
             {"AttributeName": "SK", "AttributeType": "S"},
+            {"AttributeName": "NominatorHistory", "AttributeType": "S"},
+            {"AttributeName": "TitleHistory", "AttributeType": "S"},
+        ],
+        GlobalSecondaryIndexes=[
+            {
+                "IndexName": NOMINATOR_HISTORY_INDEX,
+                "KeySchema": [
+                    {"AttributeName": "PK", "KeyType": "HASH"},
+                    {"AttributeName": "NominatorHistory", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "ALL"},
+            },
+            {
+                "IndexName": TITLE_HISTORY_INDEX,
+                "KeySchema": [
+                    {"AttributeName": "PK", "KeyType": "HASH"},
+                    {"AttributeName": "TitleHistory", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "ALL"},
+            },
         ],
         BillingMode="PAY_PER_REQUEST",
     )
@@ -115,6 +146,7 @@ class TestFilmBot(unittest.TestCase):
         self.maxDiff = None
 
         self.mock_dynamodb.start()
+        catalog_cache.clear()
         boto3.setup_default_session()
         self.dynamodb = boto3.resource("dynamodb", region_name=AWS_REGION)
         self.dynamodb_client = boto3.client("dynamodb", region_name=AWS_REGION)
@@ -134,7 +166,7 @@ class TestFilmBot(unittest.TestCase):
         Unmock `dynamodb2`.
         """
         self.mock_dynamodb.stop()
-        pass
+        catalog_cache.clear()
 
     def test_get_users(self):
         guild1 = "guild1"
@@ -698,6 +730,464 @@ class TestFilmBot(unittest.TestCase):
 
         assert count == factorial(len(input_films))
 
+    def test_member_bitmap(self):
+        a = MemberBitmap.fromIndexes([0, 3, 9])
+        b = MemberBitmap.fromIndexes([3, 4])
+        self.assertIn(9, a)
+        self.assertNotIn(4, a)
+        self.assertNotIn(1000, a)
+        self.assertEqual(list(a), [0, 3, 9])
+        self.assertEqual(len(a), 3)
+        self.assertEqual(a | b, MemberBitmap.fromIndexes([0, 3, 4, 9]))
+        self.assertEqual(a & b, MemberBitmap.fromIndexes([3]))
+        self.assertEqual(a - b, MemberBitmap.fromIndexes([0, 9]))
+        self.assertEqual(a.toBytes(), bytes([MemberBitmap.RAW, 0b1001, 0b10]))
+        self.assertEqual(MemberBitmap.fromBytes(a.toBytes()), a)
+        self.assertEqual(MemberBitmap().toBytes(), bytes([MemberBitmap.RAW]))
+        self.assertEqual(MemberBitmap.fromBytes(bytes([0])), MemberBitmap())
+
+        # A few members with high indexes are run-length encoded rather
+        # than taking a bit for every member before them
+        sparse = MemberBitmap.fromIndexes([5000, 5001, 5002, 9000])
+        self.assertEqual(
+            sparse.toBytes(),
+            bytes([MemberBitmap.RUN_LENGTH, 0x88, 0x27, 3, 0x9D, 0x1F, 1]),
+        )
+        self.assertEqual(MemberBitmap.fromBytes(sparse.toBytes()), sparse)
+        dense = MemberBitmap.fromIndexes(range(0, 200, 2))
+        self.assertEqual(MemberBitmap.fromBytes(dense.toBytes()), dense)
+        self.assertEqual(len(dense.toBytes()), 1 + 200 // 8)
+
+        user = User(
+            DiscordUserID="A",
+            NominatedFilmID=None,
+            VoteID=None,
+            AttendanceVoteID=None,
+            MemberIndex=3,
+        )
+        film = Film(
+            FilmID="film1",
+            FilmName="FilmName1",
+            IMDbID=None,
+            DiscordUserID="UserA",
+            CastVotes=0,
+            AttendanceVotes=0,
+            UsersAttended=None,
+            DateNominated=datetime(2001, 1, 1),
+            DateWatched=datetime(2001, 1, 2),
+            AttendedBitmap=b,
+        )
+        self.assertTrue(film.attendedBy(user))
+        user.MemberIndex = None
+        self.assertFalse(film.attendedBy(user))
+
+        # Films watched before bitmaps were added check the Discord ID
+        film.AttendedBitmap = None
+        film.UsersAttended = set(["A"])
+        self.assertTrue(film.attendedBy(user))
+
+    def test_record_legacy_attendance_vote(self):
+        guild = "TEST-GUILD"
+        filmbot = FilmBot(DynamoDBClient=self.dynamodb_client, GuildID=guild)
+        d = datetime(2001, 1, 1, 5, 0, 0, 123)
+        suffix = watched_suffix(d, "film1")
+        expected = {
+            guild: [
+                {
+                    "SK": "DISCORDUSER#B",
+                    "NominatedFilmID": None,
+                    "VoteID": None,
+                    "AttendanceVoteID": None,
+                },
+                {
+                    "SK": f"FILM#WATCHED#{suffix}",
+                    "FilmName": "FilmName1",
+                    "IMDbID": None,
+                    "DiscordUserID": "A",
+                    "CastVotes": 0,
+                    "AttendanceVotes": 0,
+                    "UsersAttended": set(["A"]),
+                    "DateNominated": d.isoformat(),
+                },
+            ]
+        }
+        set_db(self.dynamodb_client, expected)
+
+        # Films watched before bitmaps were added keep using a set of
+        # Discord IDs, so no member index is needed
+        self.assertEqual(
+            filmbot.record_attendance_vote(DiscordUserID="B", DateTime=d),
+            AttendanceStatus.REGISTERED,
+        )
+        expected[guild][0]["AttendanceVoteID"] = "film1"
+        expected[guild][1]["UsersAttended"].add("B")
+        expected[guild].insert(
+            0, {"SK": f"ATTENDED#B#{suffix}", "FilmName": "FilmName1"}
+        )
+        self.assertEqual(grab_db(self.dynamodb_client), expected)
+
+    def test_attendance_cutoff(self):
+        guild = "TEST-GUILD"
+        filmbot = FilmBot(DynamoDBClient=self.dynamodb_client, GuildID=guild)
+        d = datetime(2001, 1, 1, 5, 0, 0, 123)
+        film = Film(
+            FilmID="film1",
+            FilmName="FilmName1",
+            IMDbID="0078748",
+            DiscordUserID="A",
+            CastVotes=0,
+            AttendanceVotes=0,
+            UsersAttended=None,
+            DateNominated=d,
+            DateWatched=d,
+        )
+
+        # Without a runtime we allow 4 hours, otherwise the runtime and an
+        # hour, but always less than the time between films
+        self.assertEqual(film.attendanceCutoff(), d + timedelta(hours=4))
+        film.Runtime = 150
+        self.assertEqual(
+            film.attendanceCutoff(), d + timedelta(hours=3, minutes=30)
+        )
+        film.Runtime = 24 * 60
+        self.assertEqual(film.attendanceCutoff(), d + timedelta(hours=23))
+
+        film.Runtime = 90
+        film.AttendedBitmap = MemberBitmap()
+        self.assertEqual(Film.fromDict(film.toDict(GuildID=guild)), film)
+        set_db(
+            self.dynamodb_client,
+            {
+                guild: [
+                    {
+                        "SK": "DISCORDUSER#B",
+                        "NominatedFilmID": None,
+                        "VoteID": None,
+                        "AttendanceVoteID": None,
+                    },
+                ]
+            },
+        )
+        self.dynamodb_client.put_item(
+            TableName=TABLE_NAME, Item=film.toDict(GuildID=guild)
+        )
+        self.assertRaises(
+            UserError,
+            lambda: filmbot.record_attendance_vote(
+                DiscordUserID="B", DateTime=d + timedelta(hours=3)
+            ),
+        )
+        self.assertEqual(
+            filmbot.record_attendance_vote(
+                DiscordUserID="B", DateTime=d + timedelta(hours=2)
+            ),
+            AttendanceStatus.REGISTERED,
+        )
+
+    def test_concurrent_attendance_votes(self):
+        guild = "TEST-GUILD"
+        filmbot = FilmBot(DynamoDBClient=self.dynamodb_client, GuildID=guild)
+        d = datetime(2001, 1, 1, 5, 0, 0, 123)
+        users = [f"User{i}" for i in range(8)]
+        film_ids = [
+            filmbot.nominate_film(
+                DiscordUserID=user, FilmName=user, IMDbID=None, DateTime=d
+            )
+            for user in users
+        ]
+        filmbot.start_watching_film(
+            FilmID=film_ids[0], PresentUserIDs=users[:1], DateTime=d
+        )
+
+        # Every user votes at once, and none of their votes are lost
+        barrier = Barrier(len(users) - 1)
+        statuses = []
+
+        def vote(user):
+            filmbot = FilmBot(
+                DynamoDBClient=self.dynamodb_client, GuildID=guild
+            )
+            barrier.wait()
+            statuses.append(
+                filmbot.record_attendance_vote(
+                    DiscordUserID=user, DateTime=d + timedelta(minutes=1)
+                )
+            )
+
+        threads = [Thread(target=vote, args=(user,)) for user in users[1:]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(
+            statuses, [AttendanceStatus.REGISTERED] * (len(users) - 1)
+        )
+        watched = filmbot.get_watched_films()[0]
+        self.assertEqual(len(watched.AttendedBitmap), len(users))
+        for user in users:
+            self.assertTrue(watched.attendedBy(filmbot.get_user(user)))
+
+    def test_catalog_runtime(self):
+        guild = "TEST-GUILD"
+        filmbot = FilmBot(DynamoDBClient=self.dynamodb_client, GuildID=guild)
+        d = datetime(2001, 1, 1, 5, 0, 0, 123)
+        self.dynamodb_client.put_item(
+            TableName=TABLE_NAME,
+            Item={
+                **catalog_key("0078748"),
+                "Runtime": {"N": "117"},
+                "IMDbTitle": {"S": "Alien"},
+            },
+        )
+
+        # The runtime is copied from the catalog when we start watching
+        for (user, imdb_id, runtime) in [
+            ("A", "0078748", 117),
+            ("B", "0090605", None),
+            ("C", None, None),
+        ]:
+            film_id = filmbot.nominate_film(
+                DiscordUserID=user,
+                FilmName="Alien",
+                IMDbID=imdb_id,
+                DateTime=d,
+            )
+            self.assertIsNone(filmbot.get_nominated_film(film_id).Runtime)
+            film = filmbot.start_watching_film(
+                FilmID=film_id, PresentUserIDs=[user], DateTime=d
+            )
+            self.assertEqual(film.Runtime, runtime)
+            self.assertEqual(filmbot.get_watched_films()[0].Runtime, runtime)
+            d += timedelta(days=1)
+
+        # Using the catalog's cache rather than reading it again
+        self.dynamodb_client.delete_item(
+            TableName=TABLE_NAME, Key=catalog_key("0078748")
+        )
+        filmbot = FilmBot(DynamoDBClient=self.dynamodb_client, GuildID="2")
+        film_id = filmbot.nominate_film(
+            DiscordUserID="A", FilmName="Alien", IMDbID="0078748", DateTime=d
+        )
+        film = filmbot.start_watching_film(
+            FilmID=film_id, PresentUserIDs=["A"], DateTime=d
+        )
+        self.assertEqual(film.Runtime, 117)
+
+    def test_search_watched_films(self):
+        guild = "TEST-GUILD"
+        filmbot = FilmBot(DynamoDBClient=self.dynamodb_client, GuildID=guild)
+
+        # Get that it works with 0 films
+        self.assertEqual(filmbot.search_watched_films(Limit=10), ([], None))
+
+        d = datetime(2001, 1, 1, 5, 0, 0, 123)
+
+        def watched(FilmID, FilmName, DiscordUserID, DateWatched):
+            return Film(
+                FilmID=FilmID,
+                FilmName=FilmName,
+                IMDbID=None,
+                DiscordUserID=DiscordUserID,
+                CastVotes=0,
+                AttendanceVotes=0,
+                UsersAttended=set(["A"]),
+                DateNominated=d,
+                DateWatched=DateWatched,
+            )
+
+        alien = watched("film1", "Alien", "UserA", d)
+        aliens = watched("film2", "ALIENS", "UserB", d + timedelta(days=7))
+        heat = watched("film3", "Heat", "UserA", d + timedelta(days=14))
+        alien3 = watched("film4", "Alien  3", "UserA", d + timedelta(days=21))
+        nominated = {
+            "SK": "FILM#NOMINATED#film5",
+            "FilmName": "Alien Resurrection",
+            "IMDbID": None,
+            "DiscordUserID": "UserA",
+            "CastVotes": 0,
+            "AttendanceVotes": 0,
+            "UsersAttended": None,
+            "DateNominated": d.isoformat(),
+        }
+
+        def record(film):
+            r = unkey_map(film.toDict(GuildID=guild))
+            del r["PK"]
+            return r
+
+        set_db(
+            self.dynamodb_client,
+            {
+                guild: list(map(record, [alien, aliens, heat, alien3]))
+                + [nominated]
+            },
+        )
+
+        # No filters returns everything watched
+        self.assertEqual(
+            filmbot.search_watched_films(Limit=10),
+            ([alien3, heat, aliens, alien], None),
+        )
+
+        # Filter by nominator
+        self.assertEqual(
+            filmbot.search_watched_films(Limit=10, DiscordUserID="UserA"),
+            ([alien3, heat, alien], None),
+        )
+        self.assertEqual(
+            filmbot.search_watched_films(Limit=10, DiscordUserID="User"),
+            ([], None),
+        )
+
+        # Filter by title prefix, ignoring case and whitespace, in title
+        # order
+        self.assertEqual(
+            filmbot.search_watched_films(Limit=10, TitlePrefix="alien"),
+            ([alien3, alien, aliens], None),
+        )
+        self.assertEqual(
+            filmbot.search_watched_films(Limit=10, TitlePrefix="Alien 3"),
+            ([alien3], None),
+        )
+
+        # Filter by date range
+        self.assertEqual(
+            filmbot.search_watched_films(
+                Limit=10,
+                After=d + timedelta(days=7),
+                Before=d + timedelta(days=21),
+            ),
+            ([heat, aliens], None),
+        )
+
+        # Combine filters
+        self.assertEqual(
+            filmbot.search_watched_films(
+                Limit=10, DiscordUserID="UserA", TitlePrefix="ali"
+            ),
+            ([alien3, alien], None),
+        )
+        self.assertEqual(
+            filmbot.search_watched_films(
+                Limit=10, DiscordUserID="UserA", After=d + timedelta(days=1)
+            ),
+            ([alien3, heat], None),
+        )
+        self.assertEqual(
+            filmbot.search_watched_films(
+                Limit=10, TitlePrefix="alien", Before=d + timedelta(days=7)
+            ),
+            ([alien], None),
+        )
+
+        # Check paging through each index
+        for kwargs, expected in [
+            ({}, [alien3, heat, aliens, alien]),
+            ({"DiscordUserID": "UserA"}, [alien3, heat, alien]),
+            ({"TitlePrefix": "alien"}, [alien3, alien, aliens]),
+            # Films that are filtered out don't leave a page empty
+            (
+                {"DiscordUserID": "UserA", "TitlePrefix": "ali"},
+                [alien3, alien],
+            ),
+            (
+                {"TitlePrefix": "alien", "After": d + timedelta(days=7)},
+                [alien3, aliens],
+            ),
+        ]:
+            films = []
+            nextKey = None
+            while True:
+                page, nextKey = filmbot.search_watched_films(
+                    Limit=1, ExclusiveStartKey=nextKey, **kwargs
+                )
+                self.assertEqual(len(page), 1)
+                films += page
+                if nextKey is None:
+                    break
+            self.assertEqual(films, expected)
+
+        # Films with v1 sort keys are left out of searches by date, even if
+        # they were watched within the dates
+        legacy = watched("film6", "Alien", "UserA", datetime(2023, 1, 1))
+        item = legacy.toDict(GuildID=guild)
+        watched_v1 = datetime(2023, 1, 1).isoformat()
+        item["SK"] = {"S": f"FILM#WATCHED#{watched_v1}#film6"}
+        del item[FILM_NominatorHistory], item[FILM_TitleHistory]
+        self.dynamodb_client.put_item(TableName=TABLE_NAME, Item=item)
+        self.assertEqual(
+            filmbot.search_watched_films(Limit=10),
+            ([alien3, heat, aliens, alien, legacy], None),
+        )
+        for kwargs in [
+            {"Before": datetime(2000, 1, 1)},
+            {"Before": datetime(2024, 1, 1), "After": datetime(2022, 1, 1)},
+            {"After": datetime(2022, 1, 1)},
+        ]:
+            self.assertEqual(
+                filmbot.search_watched_films(Limit=10, **kwargs), ([], None)
+            )
+
+    def test_get_attendance_after(self):
+        guild = "TEST-GUILD"
+        filmbot = FilmBot(DynamoDBClient=self.dynamodb_client, GuildID=guild)
+
+        # Get that it works with 0 films
+        self.assertEqual(
+            filmbot.get_attendance_after(DiscordUserID="1", Limit=10),
+            ([], None),
+        )
+
+        d = datetime(2001, 1, 1, 5, 0, 0, 123)
+        attendance = [
+            Attendance(
+                DiscordUserID="1",
+                FilmID="film1",
+                FilmName="FilmName1",
+                DateWatched=d,
+            ),
+            Attendance(
+                DiscordUserID="1",
+                FilmID="film2",
+                FilmName="FilmName2",
+                DateWatched=d + timedelta(days=1),
+            ),
+            # Check that users sharing a prefix aren't mixed up
+            Attendance(
+                DiscordUserID="12",
+                FilmID="film2",
+                FilmName="FilmName2",
+                DateWatched=d + timedelta(days=1),
+            ),
+        ]
+
+        def record(a):
+            r = unkey_map(a.toDict(GuildID=guild))
+            del r["PK"]
+            return r
+
+        set_db(self.dynamodb_client, {guild: list(map(record, attendance))})
+
+        self.assertEqual(
+            filmbot.get_attendance_after(DiscordUserID="1", Limit=10),
+            ([attendance[1], attendance[0]], None),
+        )
+        self.assertEqual(
+            filmbot.get_attendance_after(DiscordUserID="12", Limit=10),
+            ([attendance[2]], None),
+        )
+        self.assertEqual(
+            filmbot.get_attendance_after(DiscordUserID="1", Limit=1),
+            ([attendance[1]], attendance[1].SK),
+        )
+        self.assertEqual(
+            filmbot.get_attendance_after(
+                DiscordUserID="1", Limit=1, ExclusiveStartKey=attendance[1].SK
+            ),
+            ([attendance[0]], None),
+        )
+
     def test_get_all_films(self):
         guild = "TEST-GUILD"
         filmbot = FilmBot(DynamoDBClient=self.dynamodb_client, GuildID=guild)
@@ -994,6 +1484,54 @@ class TestFilmBot(unittest.TestCase):
             },
         )
 
+    def test_get_recent_nominations(self):
+        guild1 = "GUILD1"
+        filmbot = FilmBot(DynamoDBClient=self.dynamodb_client, GuildID=guild1)
+        time1 = datetime(2001, 1, 2, 3, 4, 5, 123000)
+
+        # IDs sort by time even within the same second
+        self.assertLess(
+            new_film_id(time1), new_film_id(time1 + timedelta(milliseconds=1))
+        )
+        self.assertEqual(len(new_film_id(time1)), 26)
+        self.assertNotEqual(new_film_id(time1), new_film_id(time1))
+
+        # Nominate out of order so that we can't get lucky
+        times = [time1 + timedelta(days=d) for d in [3, 0, 5, 1]]
+        film_ids = {}
+        for n, time in enumerate(times):
+            user_id = f"user{n}"
+            film_ids[time] = filmbot.nominate_film(
+                DiscordUserID=user_id,
+                FilmName=f"Film {n}",
+                IMDbID=None,
+                DateTime=time,
+            )
+            self.assertEqual(
+                filmbot.get_nominated_film(film_ids[time]).DiscordUserID,
+                user_id,
+            )
+
+        self.assertEqual(
+            [f.FilmID for f in filmbot.get_recent_nominations()],
+            [film_ids[t] for t in sorted(times, reverse=True)],
+        )
+
+        # Films nominated with uuid1 IDs are still in the correct order
+        time_legacy = time1 + timedelta(days=2)
+        film_ids[time_legacy] = str(uuid1())
+        filmbot.nominate_film(
+            DiscordUserID="legacy",
+            FilmName="Legacy Film",
+            IMDbID=None,
+            NewFilmID=film_ids[time_legacy],
+            DateTime=time_legacy,
+        )
+        self.assertEqual(
+            [f.FilmID for f in filmbot.get_recent_nominations()],
+            [film_ids[t] for t in sorted(film_ids, reverse=True)],
+        )
+
     def test_workflow(self):
         """
         Test voting, watching, and attendance
@@ -1230,6 +1768,12 @@ class TestFilmBot(unittest.TestCase):
             )
         self.assertEqual(grab_db(self.dynamodb_client), expected)
 
+        def attended(user_id):
+            return {
+                "SK": f"ATTENDED#{user_id}#{watched_suffix(good_time, film_id1)}",
+                "FilmName": "My Film 1",
+            }
+
         # Check we can watch a film with multiple users initially present
         with snapshot(self.dynamodb_client) as exp:
             self.assertEqual(
@@ -1245,20 +1789,25 @@ class TestFilmBot(unittest.TestCase):
                     DiscordUserID=user_id1,
                     CastVotes=1,
                     AttendanceVotes=0,
-                    UsersAttended=set([user_id1, user_id2, user_id3]),
+                    UsersAttended=None,
                     DateNominated=d,
                     DateWatched=good_time,
+                    AttendedBitmap=MemberBitmap.fromIndexes([0, 1, 2]),
                 ),
             )
 
-            # Update our users
+            # Update our users, who are given member indexes in the order
+            # they are present
             exp[guild1][USER_1]["NominatedFilmID"] = None
             exp[guild1][USER_1]["VoteID"] = None
             exp[guild1][USER_1]["AttendanceVoteID"] = film_id1
+            exp[guild1][USER_1]["MemberIndex"] = 0
             exp[guild1][USER_2]["VoteID"] = None
             exp[guild1][USER_2]["AttendanceVoteID"] = film_id1
+            exp[guild1][USER_2]["MemberIndex"] = 1
             exp[guild1][USER_3]["VoteID"] = None
             exp[guild1][USER_3]["AttendanceVoteID"] = film_id1
+            exp[guild1][USER_3]["MemberIndex"] = 2
 
             # Update our nomination votes for user2 (user1 nominated the watched
             # film and user3 has no nomination)
@@ -1267,10 +1816,33 @@ class TestFilmBot(unittest.TestCase):
             # Move the film to the `WATCHED` section
             watched_film = exp[guild1].pop(FILM_1)
             watched_film["SK"] = (
-                f"FILM#WATCHED#{good_time.isoformat()}#{film_id1}"
+                f"FILM#WATCHED#{watched_suffix(good_time, film_id1)}"
+            )
+            watched_film["AttendedBitmap"] = MemberBitmap.fromIndexes(
+                [0, 1, 2]
+            ).toBytes()
+            watched_film["NominatorHistory"] = (
+                f"{user_id1}#{watched_suffix(good_time, film_id1)}"
+            )
+            watched_film["TitleHistory"] = (
+                f"my film 1#{watched_suffix(good_time, film_id1)}"
             )
-            watched_film["UsersAttended"] = set([user_id1, user_id2, user_id3])
             exp[guild1].append(watched_film)
+            exp[guild1].append({"SK": "MEMBERS", "NextMemberIndex": 3})
+            exp[guild1].append(
+                {
+                    "SK": f"WATCHEDIMDB#{imdb1}",
+                    "FilmName": "My Film 1",
+                    "DateWatched": good_time.isoformat(),
+                }
+            )
+
+            # Record attendance against each user (these sort first)
+            exp[guild1][0:0] = [
+                attended(user_id1),
+                attended(user_id2),
+                attended(user_id3),
+            ]
             self.assertEqual(grab_db(self.dynamodb_client), exp)
 
         # Check we can watch a film with just one user
@@ -1285,9 +1857,10 @@ class TestFilmBot(unittest.TestCase):
                 DiscordUserID=user_id1,
                 CastVotes=1,
                 AttendanceVotes=0,
-                UsersAttended=set([user_id1]),
+                UsersAttended=None,
                 DateNominated=d,
                 DateWatched=good_time,
+                AttendedBitmap=MemberBitmap.fromIndexes([0]),
             ),
         )
 
@@ -1295,24 +1868,61 @@ class TestFilmBot(unittest.TestCase):
         expected[guild1][USER_1]["NominatedFilmID"] = None
         expected[guild1][USER_1]["VoteID"] = None
         expected[guild1][USER_1]["AttendanceVoteID"] = film_id1
+        expected[guild1][USER_1]["MemberIndex"] = 0
         expected[guild1][USER_2]["VoteID"] = None
         expected[guild1][USER_2]["AttendanceVoteID"] = None
         expected[guild1][USER_3]["VoteID"] = None
 
         # Move the film to the `WATCHED` section
         watched_film = expected[guild1].pop(FILM_1)
-        watched_film["SK"] = f"FILM#WATCHED#{good_time.isoformat()}#{film_id1}"
-        watched_film["UsersAttended"] = set([user_id1])
+        watched_film["SK"] = (
+            f"FILM#WATCHED#{watched_suffix(good_time, film_id1)}"
+        )
+        watched_film["AttendedBitmap"] = MemberBitmap.fromIndexes(
+            [0]
+        ).toBytes()
+        watched_film["NominatorHistory"] = (
+            f"{user_id1}#{watched_suffix(good_time, film_id1)}"
+        )
+        watched_film["TitleHistory"] = (
+            f"my film 1#{watched_suffix(good_time, film_id1)}"
+        )
         expected[guild1].append(watched_film)
+        expected[guild1].append({"SK": "MEMBERS", "NextMemberIndex": 1})
+        expected[guild1].append(
+            {
+                "SK": f"WATCHEDIMDB#{imdb1}",
+                "FilmName": "My Film 1",
+                "DateWatched": good_time.isoformat(),
+            }
+        )
+        expected[guild1].insert(0, attended(user_id1))
+        self.assertEqual(grab_db(self.dynamodb_client), expected)
+        self.assertEqual(filmbot.get_watched_imdb_ids(), set([imdb1]))
+
+        # Films that have been watched can't be nominated again
+        with self.assertRaises(UserError) as e:
+            filmbot.nominate_film(
+                DiscordUserID=user_id1,
+                FilmName="My Film 1 Again",
+                IMDbID=imdb1,
+                DateTime=good_time,
+            )
+        self.assertEqual(
+            str(e.exception),
+            "My Film 1 was already watched on "
+            f"<t:{int(good_time.timestamp())}:d>",
+        )
         self.assertEqual(grab_db(self.dynamodb_client), expected)
 
         # Fixup the indices
-        USER_1 = 0
-        USER_2 = 1
-        USER_3 = 2
-        FILM_2 = 3
-        FILM_3 = 4
-        FILM_1 = 7
+        USER_1 = 1
+        USER_2 = 2
+        USER_3 = 3
+        FILM_2 = 4
+        FILM_3 = 5
+        FILM_1 = 8
+        MEMBERS = 9
         self.assertEqual(grab_db(self.dynamodb_client), expected)
 
         # Check we can't record attendance before the film is watched
@@ -1351,8 +1961,14 @@ class TestFilmBot(unittest.TestCase):
             AttendanceStatus.REGISTERED,
         )
         expected[guild1][USER_2]["AttendanceVoteID"] = film_id1
-        expected[guild1][FILM_1]["UsersAttended"].add(user_id2)
+        expected[guild1][USER_2]["MemberIndex"] = 1
+        expected[guild1][FILM_1]["AttendedIndexes"] = set([1])
         expected[guild1][FILM_2]["AttendanceVotes"] += 1
+        expected[guild1][MEMBERS]["NextMemberIndex"] = 2
+        expected[guild1].insert(1, attended(user_id2))
+        USER_3 += 1
+        FILM_1 += 1
+        MEMBERS += 1
         self.assertEqual(grab_db(self.dynamodb_client), expected)
 
         # Check we can record attendance for a user with no nominated film
@@ -1363,9 +1979,34 @@ class TestFilmBot(unittest.TestCase):
             AttendanceStatus.REGISTERED,
         )
         expected[guild1][USER_3]["AttendanceVoteID"] = film_id1
-        expected[guild1][FILM_1]["UsersAttended"].add(user_id3)
+        expected[guild1][USER_3]["MemberIndex"] = 2
+        expected[guild1][FILM_1]["AttendedIndexes"] = set([1, 2])
+        expected[guild1][MEMBERS]["NextMemberIndex"] = 3
+        expected[guild1].insert(2, attended(user_id3))
         self.assertEqual(grab_db(self.dynamodb_client), expected)
 
+        # Check the attendance bitmap matches each user's member index
+        watched = filmbot.get_watched_films()[0]
+        for user_id in [user_id1, user_id2, user_id3]:
+            self.assertTrue(watched.attendedBy(filmbot.get_user(user_id)))
+
+        # Check we can read back each user's attendance
+        for user_id in [user_id1, user_id2, user_id3]:
+            self.assertEqual(
+                filmbot.get_attendance_after(DiscordUserID=user_id, Limit=10),
+                (
+                    [
+                        Attendance(
+                            DiscordUserID=user_id,
+                            FilmID=film_id1,
+                            FilmName="My Film 1",
+                            DateWatched=good_time,
+                        )
+                    ],
+                    None,
+                ),
+            )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,227 @@
+import threading
+import unittest
+import boto3
+from datetime import datetime
+from moto import mock_dynamodb
+import guild_ranking
+from bloom import BloomFilter
+from cache import LRUCache
+from catalog import FilmMetadata, catalog_cache, put_catalog_entry
+from filmbot import TABLE_NAME, FilmBot
+from guild_ranking import (
+    RANKING_CACHE_NEGATIVE_TTL,
+    RANKING_CACHE_SIZE,
+    RANKING_CACHE_TTL,
+    GuildRanking,
+    get_guild_ranking,
+    prefetch_guild_ranking,
+    ranking_cache,
+    read_guild_ranking,
+    record_watched_film,
+    split_film_name,
+    watched_filter,
+)
+from title_index import SearchResult
+from test_filmbot import set_db
+
+AWS_REGION = "eu-west-2"
+
+
+class SlowClient:
+    """Holds every `get_item` until `answer` is set."""
+
+    def __init__(self, client):
+        self._client = client
+        self.answer = threading.Event()
+
+    def get_item(self, **kwargs):
+        self.answer.wait(10)
+        return self._client.get_item(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class TestGuildRanking(unittest.TestCase):
+    mock_dynamodb = mock_dynamodb()
+
+    def setUp(self):
+        self.maxDiff = None
+
+        self.mock_dynamodb.start()
+        boto3.setup_default_session()
+        self.dynamodb_client = boto3.client("dynamodb", region_name=AWS_REGION)
+        set_db(self.dynamodb_client, {})
+        ranking_cache.clear()
+        catalog_cache.clear()
+
+    def tearDown(self):
+        ranking_cache.clear()
+        catalog_cache.clear()
+        self.mock_dynamodb.stop()
+
+    def watch(self, filmbot, DiscordUserID, FilmName, IMDbID, Day):
+        film_id = filmbot.nominate_film(
+            DiscordUserID=DiscordUserID,
+            FilmName=FilmName,
+            IMDbID=IMDbID,
+            DateTime=datetime(2022, 5, Day, 12),
+        )
+        return filmbot.start_watching_film(
+            FilmID=film_id,
+            PresentUserIDs=[DiscordUserID],
+            DateTime=datetime(2022, 5, Day, 20),
+        )
+
+    def test_split_film_name(self):
+        self.assertEqual(split_film_name("Alien (1979)"), ("Alien", 1979))
+        self.assertEqual(split_film_name("Alien"), ("Alien", None))
+        self.assertEqual(
+            split_film_name("Blade Runner (2049)"), ("Blade Runner", 2049)
+        )
+
+    def test_rerank(self):
+        results = [
+            SearchResult(IMDbID="01", Title="The Thing", Year=2011),
+            SearchResult(IMDbID="02", Title="The Thing", Year=1982),
+            SearchResult(IMDbID="04", Title="The Thing Below", Year=1985),
+            SearchResult(IMDbID="03", Title="Things", Year=2020),
+        ]
+
+        # Nothing watched keeps the order we were given
+        self.assertEqual(GuildRanking().rerank(results), results)
+
+        ranking = GuildRanking(
+            FilmCount=2,
+            Tokens={"alien": 1, "thing": 1},
+            Decades={"1980": 2},
+            Watched=watched_filter(["02"]),
+        )
+        self.assertEqual(
+            [r.IMDbID for r in ranking.rerank(results)],
+            ["04", "01", "03", "02"],
+        )
+        self.assertTrue(ranking.hasWatched(results[1]))
+        self.assertFalse(ranking.hasWatched(results[0]))
+
+    def test_get_guild_ranking(self):
+        now = [0]
+        cache = LRUCache(
+            MaxSize=RANKING_CACHE_SIZE,
+            TTL=RANKING_CACHE_TTL,
+            NegativeTTL=RANKING_CACHE_NEGATIVE_TTL,
+            Clock=lambda: now[0],
+        )
+        original, guild_ranking.ranking_cache = (
+            guild_ranking.ranking_cache,
+            cache,
+        )
+        try:
+            self.assertFalse(GuildRanking())
+            self.assertEqual(
+                get_guild_ranking(self.dynamodb_client, "123"), GuildRanking()
+            )
+
+            # A guild without a ranking is looked up again soon, in case
+            # another container has built it
+            ranking = GuildRanking(
+                FilmCount=1, Watched=watched_filter(["0078748"])
+            )
+            self.dynamodb_client.put_item(
+                TableName=TABLE_NAME, Item=ranking.toDict(GuildID="123")
+            )
+            self.assertEqual(
+                get_guild_ranking(self.dynamodb_client, "123"), GuildRanking()
+            )
+            now[0] += RANKING_CACHE_NEGATIVE_TTL
+            self.assertEqual(
+                get_guild_ranking(self.dynamodb_client, "123"), ranking
+            )
+            now[0] += RANKING_CACHE_TTL - 1
+            self.assertEqual(cache.get("123"), ranking)
+        finally:
+            guild_ranking.ranking_cache = original
+
+    def test_prefetch_guild_ranking(self):
+        client = SlowClient(self.dynamodb_client)
+        future = prefetch_guild_ranking(client, "123")
+        self.assertFalse(future.done())
+        client.answer.set()
+        self.assertEqual(future.result(timeout=10), GuildRanking())
+
+        # Rankings in memory don't need to be read
+        client.answer.clear()
+        self.assertEqual(
+            prefetch_guild_ranking(client, "123").result(timeout=0),
+            GuildRanking(),
+        )
+
+    def test_legacy_ranking(self):
+        ranking = GuildRanking(
+            FilmCount=1, Watched=watched_filter(["0078748"])
+        )
+        item = ranking.toDict(GuildID="123")
+        self.assertEqual(GuildRanking.fromDict(item), ranking)
+
+        # Rankings that listed every watched IMDb ID are still understood
+        del item["WatchedFilter"]
+        item["WatchedIMDbIDs"] = {"SS": ["0078748"]}
+        self.assertEqual(GuildRanking.fromDict(item), ranking)
+
+    def test_record_watched_film(self):
+        filmbot = FilmBot(DynamoDBClient=self.dynamodb_client, GuildID="123")
+        self.assertEqual(
+            get_guild_ranking(self.dynamodb_client, "123"), GuildRanking()
+        )
+
+        # Films in the catalog are ranked by their IMDb title and year
+        put_catalog_entry(
+            self.dynamodb_client,
+            "0078748",
+            FilmMetadata(Runtime=117, ReleaseYear=1979, IMDbTitle="Alien"),
+        )
+
+        # The first film watched builds the ranking from the whole history
+        self.watch(filmbot, "UserA", "The First Alien", "0078748", 1)
+        film = self.watch(filmbot, "UserB", "Aliens (1986)", "0090605", 2)
+        self.assertIsNone(read_guild_ranking(self.dynamodb_client, "123"))
+        expected = GuildRanking(
+            FilmCount=2,
+            Tokens={"alien": 1, "aliens": 1},
+            Decades={"1970": 1, "1980": 1},
+            Watched=watched_filter(["0078748", "0090605"]),
+        )
+        self.assertEqual(record_watched_film(filmbot, film), expected)
+        self.assertEqual(
+            read_guild_ranking(self.dynamodb_client, "123"), expected
+        )
+
+        # After that each film is added to it
+        film = self.watch(filmbot, "UserA", "My Home Movie", None, 3)
+        expected.FilmCount += 1
+        expected.Tokens.update(["my", "home", "movie"])
+        self.assertEqual(record_watched_film(filmbot, film), expected)
+        self.assertEqual(
+            read_guild_ranking(self.dynamodb_client, "123"), expected
+        )
+        self.assertEqual(
+            get_guild_ranking(self.dynamodb_client, "123"), expected
+        )
+
+        # A full filter is rebuilt from the guild's watched IMDb IDs
+        expected.Watched = BloomFilter.fromItems(
+            ["0078748", "0090605"], Capacity=2
+        )
+        self.dynamodb_client.put_item(
+            TableName=TABLE_NAME, Item=expected.toDict(GuildID="123")
+        )
+        film = self.watch(filmbot, "UserB", "Alien 3", "0103644", 4)
+        ranking = record_watched_film(filmbot, film)
+        self.assertEqual(
+            ranking.Watched,
+            watched_filter(["0078748", "0090605", "0103644"]),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
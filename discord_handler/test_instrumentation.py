@@ -0,0 +1,183 @@
+import datetime as dt
+import io
+import json
+import unittest
+from contextlib import redirect_stdout
+import boto3
+from moto import mock_dynamodb
+import instrumentation
+from filmbot import FilmBot
+from instrumentation import (
+    EMF_METRICS,
+    EMFSink,
+    InMemorySink,
+    InstrumentedClient,
+    RequestMetrics,
+    consumed_capacity,
+    measure_request,
+)
+from test_filmbot import set_db
+
+AWS_REGION = "eu-west-2"
+
+
+class RecordingClient:
+    """Records the arguments of each `get_item` call."""
+
+    def __init__(self):
+        self.calls = []
+
+    def get_item(self, **kwargs):
+        self.calls.append(kwargs)
+        return {}
+
+
+class TestInstrumentation(unittest.TestCase):
+    mock_dynamodb = mock_dynamodb()
+
+    def setUp(self):
+        self.maxDiff = None
+
+        self.mock_dynamodb.start()
+        boto3.setup_default_session()
+        self.dynamodb_client = boto3.client("dynamodb", region_name=AWS_REGION)
+        set_db(self.dynamodb_client, {})
+        self.client = InstrumentedClient(self.dynamodb_client)
+        self.sink = InMemorySink()
+        instrumentation._metrics_sink = self.sink
+
+    def tearDown(self):
+        instrumentation._metrics_sink = None
+        self.mock_dynamodb.stop()
+
+    def test_consumed_capacity(self):
+        self.assertEqual(consumed_capacity("get_item", {}), (0.0, 0.0))
+        self.assertEqual(
+            consumed_capacity(
+                "get_item", {"ConsumedCapacity": {"CapacityUnits": 0.5}}
+            ),
+            (0.5, 0.0),
+        )
+        self.assertEqual(
+            consumed_capacity(
+                "transact_write_items",
+                {
+                    "ConsumedCapacity": [
+                        {"CapacityUnits": 2.0},
+                        {"CapacityUnits": 4.0},
+                    ]
+                },
+            ),
+            (0.0, 6.0),
+        )
+        self.assertEqual(
+            consumed_capacity(
+                "update_item",
+                {
+                    "ConsumedCapacity": {
+                        "CapacityUnits": 3.0,
+                        "ReadCapacityUnits": 1.0,
+                        "WriteCapacityUnits": 2.0,
+                    }
+                },
+            ),
+            (1.0, 2.0),
+        )
+
+    def test_not_measured_outside_a_request(self):
+        client = RecordingClient()
+        InstrumentedClient(client).get_item(TableName="T", Key={})
+        with measure_request(Command="peek", Guild="guild"):
+            InstrumentedClient(client).get_item(TableName="T", Key={})
+        self.assertEqual(
+            client.calls,
+            [
+                {"TableName": "T", "Key": {}},
+                {
+                    "TableName": "T",
+                    "Key": {},
+                    "ReturnConsumedCapacity": "TOTAL",
+                },
+            ],
+        )
+        self.assertEqual(len(self.sink.requests), 1)
+        self.assertEqual(self.sink.requests[0].total("Calls"), 1)
+
+    def test_request(self):
+        filmbot = FilmBot(DynamoDBClient=self.client, GuildID="guild")
+        with measure_request(Command="nominate", Guild="guild") as metrics:
+            filmbot.nominate_film(
+                DiscordUserID="user",
+                FilmName="Alien",
+                IMDbID=None,
+                DateTime=dt.datetime(2023, 1, 1),
+            )
+            filmbot.get_nominations()
+            filmbot.get_user("user")
+            with self.assertRaises(
+                self.client.exceptions.ConditionalCheckFailedException
+            ):
+                self.client.put_item(
+                    TableName="FilmBotTable",
+                    Item={
+                        "PK": {"S": "guild"},
+                        "SK": {"S": "DISCORDUSER#user"},
+                    },
+                    ConditionExpression="attribute_not_exists(PK)",
+                )
+
+        self.assertEqual(self.sink.requests, [metrics])
+        self.assertEqual(metrics.Command, "nominate")
+        self.assertEqual(metrics.Guild, "guild")
+        self.assertGreater(metrics.Latency, 0)
+
+        operations = metrics.Operations
+        self.assertEqual(operations["query"].Pages, operations["query"].Calls)
+        self.assertGreater(operations["query"].ReadCapacityUnits, 0)
+        self.assertEqual(operations["get_item"].ReadCapacityUnits, 0.5)
+        self.assertEqual(operations["put_item"].Errors, 1)
+        self.assertEqual(operations["put_item"].WriteCapacityUnits, 0)
+        self.assertGreater(metrics.total("Calls"), 3)
+        self.assertEqual(metrics.total("Errors"), 1)
+        self.assertEqual(metrics.total("Retries"), 0)
+
+    def test_emf(self):
+        metrics = RequestMetrics(Command="watch", Guild="guild")
+        metrics.Latency = 0.25
+        metrics.record(
+            "get_item",
+            {"ConsumedCapacity": {"CapacityUnits": 0.5}},
+            Latency=0.01,
+        )
+        metrics.record(
+            "query",
+            {
+                "ConsumedCapacity": {"CapacityUnits": 1.0},
+                "ResponseMetadata": {"RetryAttempts": 2},
+            },
+            Latency=0.02,
+        )
+
+        out = io.StringIO()
+        with redirect_stdout(out):
+            EMFSink().emit(metrics)
+        record = json.loads(out.getvalue())
+
+        directive = record["_aws"]["CloudWatchMetrics"][0]
+        self.assertEqual(directive["Dimensions"], [["Command"]])
+        for name, _ in EMF_METRICS:
+            self.assertIn(name, record)
+        self.assertEqual(record["Command"], "watch")
+        self.assertEqual(record["Guild"], "guild")
+        self.assertEqual(record["Latency"], 250.0)
+        self.assertEqual(record["DynamoDBLatency"], 30.0)
+        self.assertEqual(record["DynamoDBCalls"], 2)
+        self.assertEqual(record["DynamoDBPages"], 1)
+        self.assertEqual(record["DynamoDBRetries"], 2)
+        self.assertEqual(record["ReadCapacityUnits"], 1.5)
+        self.assertEqual(record["WriteCapacityUnits"], 0)
+        self.assertEqual(record["Operations"]["query"]["Retries"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+import base64
+import json
+import os
+import time
+import unittest
+from nacl.signing import SigningKey
+import lambda_function
+
+
+class SignedEventTestCase(unittest.TestCase):
+    """Signs the events that it creates with a key that `lambda_function`
+    is set up to verify them with."""
+
+    def setUp(self):
+        self.signing_key = SigningKey.generate()
+        self.public_key = os.environ.get("FILMBOT_PUBLIC_KEY")
+        os.environ["FILMBOT_PUBLIC_KEY"] = (
+            self.signing_key.verify_key.encode().hex()
+        )
+        lambda_function._verify_key = None
+        lambda_function.seen_interactions.clear()
+
+        def get_client():
+            raise AssertionError("PING should not use DynamoDB")
+
+        self.get_client = lambda_function.get_client
+        lambda_function.get_client = get_client
+
+    def tearDown(self):
+        lambda_function.get_client = self.get_client
+        lambda_function._verify_key = None
+        if self.public_key is None:
+            del os.environ["FILMBOT_PUBLIC_KEY"]
+        else:
+            os.environ["FILMBOT_PUBLIC_KEY"] = self.public_key
+
+    def event(self, body, Signature=None, Timestamp=None):
+        raw_body = json.dumps(body)
+        timestamp = str(int(time.time() if Timestamp is None else Timestamp))
+        if Signature is None:
+            Signature = self.signing_key.sign(
+                (timestamp + raw_body).encode()
+            ).signature.hex()
+        return {
+            "params": {
+                "header": {
+                    "x-signature-ed25519": Signature,
+                    "x-signature-timestamp": timestamp,
+                }
+            },
+            "rawBody": raw_body,
+            "body-json": body,
+        }
+
+    def function_url_event(
+        self, body, Signature=None, Timestamp=None, Base64=False
+    ):
+        event = self.event(body, Signature=Signature, Timestamp=Timestamp)
+        raw_body = event["rawBody"]
+        if Base64:
+            raw_body = base64.b64encode(raw_body.encode()).decode()
+        return {
+            "version": lambda_function.HTTP_EVENT_VERSION,
+            "headers": {
+                **event["params"]["header"],
+                "content-type": "application/json",
+            },
+            "body": raw_body,
+            "isBase64Encoded": Base64,
+        }
+
+
+class TestFunctionURL(SignedEventTestCase):
+    def test_function_url_ping(self):
+        for base64_encoded in [False, True]:
+            response = lambda_function.lambda_handler(
+                self.function_url_event({"type": 1}, Base64=base64_encoded),
+                None,
+            )
+            self.assertEqual(response["statusCode"], 200)
+            self.assertEqual(
+                response["headers"]["Content-Type"], "application/json"
+            )
+            self.assertEqual(json.loads(response["body"]), {"type": 1})
+
+    def test_function_url_bad_signature(self):
+        event = self.function_url_event({"type": 1}, Signature="00" * 64)
+        # The body isn't parsed until its signature has been verified
+        event["body"] = "not json"
+        self.assertEqual(
+            lambda_function.lambda_handler(event, None)["statusCode"], 401
+        )
+        del event["headers"]["x-signature-ed25519"]
+        self.assertEqual(
+            lambda_function.lambda_handler(event, None)["statusCode"], 401
+        )
+
+
+class TestReplays(SignedEventTestCase):
+    def test_stale_request(self):
+        for age, error in [
+            (-2 * lambda_function.SIGNATURE_WINDOW, "from the future"),
+            (3600, "Stale request"),
+        ]:
+            with self.assertRaisesRegex(Exception, error):
+                lambda_function.lambda_handler(
+                    self.event({"type": 1}, Timestamp=time.time() - age),
+                    None,
+                )
+            event = self.function_url_event(
+                {"type": 1}, Timestamp=time.time() - age
+            )
+            self.assertEqual(
+                lambda_function.lambda_handler(event, None)["statusCode"], 401
+            )
+
+    def test_reject_replays(self):
+        event = self.event({"type": 1}, Timestamp=1000)
+        window = lambda_function.SIGNATURE_WINDOW
+        for now in [1000 - window, 1000, 1000 + window]:
+            lambda_function.reject_replays(event, Now=now)
+        with self.assertRaisesRegex(
+            Exception, rf"Stale request \({window + 1}s old\)"
+        ):
+            lambda_function.reject_replays(event, Now=1000 + window + 1)
+        with self.assertRaisesRegex(
+            Exception, rf"Request from the future \({window + 1}s ahead\)"
+        ):
+            lambda_function.reject_replays(event, Now=1000 - window - 1)
+
+    def test_duplicate_interaction(self):
+        body = {"type": 1, "id": "interaction"}
+        lambda_function.lambda_handler(self.event(body), None)
+        with self.assertRaisesRegex(Exception, "Duplicate"):
+            lambda_function.lambda_handler(self.event(body), None)
+        event = self.function_url_event(body)
+        self.assertEqual(
+            lambda_function.lambda_handler(event, None)["statusCode"], 401
+        )
+        # Other interactions aren't affected
+        body["id"] = "other"
+        self.assertEqual(
+            lambda_function.lambda_handler(self.event(body), None),
+            {"type": 1},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,25 @@
+import unittest
+from metrics import LatencyHistogram
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_percentile(self):
+        histogram = LatencyHistogram()
+        self.assertIsNone(histogram.percentile(50))
+        self.assertEqual(str(histogram), "n=0")
+
+        for ms in [0.5, 3, 3, 4, 40, 60, 90, 150, 900, 7000]:
+            histogram.record(ms / 1000)
+
+        self.assertEqual(histogram.count, 10)
+        self.assertEqual(histogram.percentile(10), 1)
+        self.assertEqual(histogram.percentile(50), 50)
+        self.assertEqual(histogram.percentile(90), 1000)
+        self.assertEqual(histogram.percentile(100), float("inf"))
+        self.assertEqual(
+            str(histogram), "n=10 p50<=50ms p90<=1000ms p99<=infms"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
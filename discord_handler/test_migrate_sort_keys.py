@@ -0,0 +1,292 @@
+import unittest
+import boto3
+from moto import mock_dynamodb
+from filmbot import FilmBot, Film, Attendance, unkey_map, watched_suffix
+from migrate_sort_keys import (
+    get_legacy_watched_films,
+    migrate_film,
+    migrate_guild,
+)
+from test_filmbot import grab_db, set_db
+from datetime import datetime, timedelta
+from uuid import uuid1
+
+AWS_REGION = "eu-west-2"
+
+
+class TestMigrateSortKeys(unittest.TestCase):
+    mock_dynamodb = mock_dynamodb()
+
+    def setUp(self):
+        """
+        Mock `dynamodb2` and create the tables we expect.
+        """
+
+        # Set unlimited length for assertEqual diff lengths
+        self.maxDiff = None
+
+        self.mock_dynamodb.start()
+        boto3.setup_default_session()
+        self.dynamodb_client = boto3.client("dynamodb", region_name=AWS_REGION)
+        set_db(self.dynamodb_client, {})
+
+    def tearDown(self):
+        """
+        Unmock `dynamodb2`.
+        """
+        self.mock_dynamodb.stop()
+
+    def test_watched_suffix(self):
+        d = datetime(2001, 1, 1, 5, 0, 0)
+        film_id = str(uuid1())
+        suffix = watched_suffix(d, film_id)
+
+        # Check that the suffix is fixed width whether or not we have
+        # microseconds and that UUIDs are compacted
+        self.assertEqual(
+            len(suffix),
+            len(watched_suffix(d + timedelta(microseconds=1), film_id)),
+        )
+        self.assertLess(len(suffix), len(d.isoformat()) + 1 + len(film_id))
+
+        # Check that suffixes sort in the same order as the times
+        times = [
+            datetime(1970, 1, 1),
+            d,
+            d + timedelta(microseconds=1),
+            d + timedelta(seconds=1),
+            datetime(2999, 12, 31, 23, 59, 59, 999999),
+        ]
+        suffixes = [watched_suffix(t, film_id) for t in times]
+        self.assertEqual(sorted(suffixes), suffixes)
+
+        # Check that v2 suffixes always sort after v1 suffixes
+        self.assertLess(f"{times[-1].isoformat()}#{film_id}", suffixes[0])
+
+    def test_migrate_guild(self):
+        guild = "guild"
+        other_guild = "other"
+        user_id1 = "User1"
+        user_id2 = "User2"
+        film_id1 = str(uuid1())
+        film_id2 = "Film2"
+        film_id3 = str(uuid1())
+        d = datetime(2001, 1, 1, 5, 0, 0)
+        d2 = d + timedelta(days=7, microseconds=123)
+        d3 = d + timedelta(days=14)
+
+        def legacy_film(FilmID, FilmName, DateWatched, UsersAttended):
+            return {
+                "SK": f"FILM#WATCHED#{DateWatched.isoformat()}#{FilmID}",
+                "FilmName": FilmName,
+                "IMDbID": None,
+                "DiscordUserID": user_id1,
+                "CastVotes": 1,
+                "AttendanceVotes": 2,
+                "UsersAttended": UsersAttended,
+                "DateNominated": d.isoformat(),
+            }
+
+        def legacy_attended(DiscordUserID, FilmID, FilmName, DateWatched):
+            return {
+                "SK": f"ATTENDED#{DiscordUserID}#{DateWatched.isoformat()}#{FilmID}",
+                "FilmName": FilmName,
+            }
+
+        nominated = {
+            "SK": f"FILM#NOMINATED#{film_id3}",
+            "FilmName": "Film 3",
+            "IMDbID": None,
+            "DiscordUserID": user_id2,
+            "CastVotes": 0,
+            "AttendanceVotes": 0,
+            "UsersAttended": None,
+            "DateNominated": d.isoformat(),
+        }
+        users = [
+            {
+                "SK": f"DISCORDUSER#{user_id1}",
+                "NominatedFilmID": None,
+                "VoteID": None,
+                "AttendanceVoteID": None,
+            },
+            {
+                "SK": f"DISCORDUSER#{user_id2}",
+                "NominatedFilmID": film_id3,
+                "VoteID": None,
+                "AttendanceVoteID": None,
+            },
+        ]
+        other = [legacy_film(film_id1, "Film 1", d, set([user_id1]))]
+        set_db(
+            self.dynamodb_client,
+            {
+                guild: users
+                + [
+                    legacy_film(
+                        film_id1, "Film 1", d, set([user_id1, user_id2])
+                    ),
+                    legacy_attended(user_id1, film_id1, "Film 1", d),
+                    legacy_attended(user_id2, film_id1, "Film 1", d),
+                    legacy_film(film_id2, "Film 2", d2, None),
+                    nominated,
+                ],
+                other_guild: other,
+            },
+        )
+
+        filmbot = FilmBot(DynamoDBClient=self.dynamodb_client, GuildID=guild)
+        watched = filmbot.get_watched_films()
+        all_films = filmbot.get_all_films()
+
+        # Migrate one film at a time and check that the films are returned
+        # in the right order in between each batch
+        migrated, skipped, nextKey = migrate_guild(
+            self.dynamodb_client, guild, BatchSize=1
+        )
+        self.assertEqual((migrated, skipped), (1, 0))
+        self.assertIsNotNone(nextKey)
+        self.assertEqual(filmbot.get_watched_films(), watched)
+
+        migrated, skipped, nextKey = migrate_guild(
+            self.dynamodb_client, guild, BatchSize=1, ExclusiveStartKey=nextKey
+        )
+        self.assertEqual((migrated, skipped), (1, 0))
+        self.assertEqual(filmbot.get_watched_films(), watched)
+        self.assertEqual(filmbot.get_all_films(), all_films)
+
+        # Check that there is nothing left to do
+        self.assertEqual(
+            migrate_guild(
+                self.dynamodb_client, guild, ExclusiveStartKey=nextKey
+            ),
+            (0, 0, None),
+        )
+        self.assertEqual(
+            migrate_guild(self.dynamodb_client, guild), (0, 0, None)
+        )
+
+        film1 = Film(
+            FilmID=film_id1,
+            FilmName="Film 1",
+            IMDbID=None,
+            DiscordUserID=user_id1,
+            CastVotes=1,
+            AttendanceVotes=2,
+            UsersAttended=set([user_id1, user_id2]),
+            DateNominated=d,
+            DateWatched=d,
+        )
+        film2 = Film(
+            FilmID=film_id2,
+            FilmName="Film 2",
+            IMDbID=None,
+            DiscordUserID=user_id1,
+            CastVotes=1,
+            AttendanceVotes=2,
+            UsersAttended=None,
+            DateNominated=d,
+            DateWatched=d2,
+        )
+
+        def unkey(o):
+            r = unkey_map(o.toDict(GuildID=guild))
+            del r["PK"]
+            return r
+
+        self.assertEqual(
+            grab_db(self.dynamodb_client),
+            {
+                guild: sorted(
+                    [
+                        unkey(
+                            Attendance(
+                                DiscordUserID=user_id1,
+                                FilmID=film_id1,
+                                FilmName="Film 1",
+                                DateWatched=d,
+                            )
+                        ),
+                        unkey(
+                            Attendance(
+                                DiscordUserID=user_id2,
+                                FilmID=film_id1,
+                                FilmName="Film 1",
+                                DateWatched=d,
+                            )
+                        ),
+                        nominated,
+                        *users,
+                        unkey(film1),
+                        unkey(film2),
+                    ],
+                    key=lambda r: r["SK"],
+                ),
+                other_guild: other,
+            },
+        )
+
+        # Check the new attendance records can be read
+        self.assertEqual(
+            filmbot.get_attendance_after(DiscordUserID=user_id2, Limit=10),
+            (
+                [
+                    Attendance(
+                        DiscordUserID=user_id2,
+                        FilmID=film_id1,
+                        FilmName="Film 1",
+                        DateWatched=d,
+                    )
+                ],
+                None,
+            ),
+        )
+
+        # Check that new films are watched after migrated ones
+        film3 = filmbot.start_watching_film(
+            FilmID=film_id3, DateTime=d3, PresentUserIDs=[user_id2]
+        )
+        self.assertEqual(filmbot.get_watched_films(), [film3, film2, film1])
+
+    def test_migrate_changed_film(self):
+        guild = "guild"
+        d = datetime(2001, 1, 1, 5, 0, 0)
+        legacy = {
+            "SK": f"FILM#WATCHED#{d.isoformat()}#film1",
+            "FilmName": "Film 1",
+            "IMDbID": None,
+            "DiscordUserID": "User1",
+            "CastVotes": 0,
+            "AttendanceVotes": 0,
+            "UsersAttended": set(["User1"]),
+            "DateNominated": d.isoformat(),
+        }
+        set_db(self.dynamodb_client, {guild: [legacy]})
+
+        films, nextKey = get_legacy_watched_films(
+            self.dynamodb_client, guild, Limit=10
+        )
+        self.assertEqual(nextKey, None)
+        self.assertEqual(len(films), 1)
+
+        # Record an attendance between reading and migrating
+        self.dynamodb_client.update_item(
+            TableName="FilmBotTable",
+            Key={"PK": {"S": guild}, "SK": {"S": legacy["SK"]}},
+            ExpressionAttributeValues={":User": {"SS": ["User2"]}},
+            UpdateExpression="ADD UsersAttended :User",
+        )
+        self.assertFalse(migrate_film(self.dynamodb_client, guild, films[0]))
+
+        # The film is left where it was and will be picked up next time
+        legacy["UsersAttended"].add("User2")
+        db = grab_db(self.dynamodb_client)
+        self.assertIn(legacy, db[guild])
+        self.assertEqual(
+            migrate_guild(self.dynamodb_client, guild), (1, 0, None)
+        )
+        self.assertNotIn(legacy, grab_db(self.dynamodb_client)[guild])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+import datetime as dt
+from filmbot import Film
+from nomination_choices import NominationChoices, MAX_CHOICES
+
+
+def nomination(FilmID, FilmName, DiscordUserID, Day, CastVotes=0):
+    return Film(
+        FilmID=FilmID,
+        FilmName=FilmName,
+        IMDbID=None,
+        DiscordUserID=DiscordUserID,
+        CastVotes=CastVotes,
+        AttendanceVotes=0,
+        UsersAttended=None,
+        DateNominated=dt.datetime(2022, 5, Day),
+        DateWatched=None,
+    )
+
+
+class TestNominationChoices(unittest.TestCase):
+    def setUp(self):
+        # Newest first
+        self.choices = NominationChoices(
+            [
+                nomination("2", "Alien", "UserB", 3, CastVotes=2),
+                nomination("3", "Aliens", "UserC", 2, CastVotes=1),
+                nomination("1", "The Thing", "UserA", 1, CastVotes=3),
+            ]
+        )
+
+    def test_unfiltered(self):
+        self.assertEqual(
+            self.choices.watch_choices(""),
+            [
+                {"name": "The Thing", "value": "1"},
+                {"name": "Alien", "value": "2"},
+                {"name": "Aliens", "value": "3"},
+            ],
+        )
+        # Newest first without our own nomination
+        self.assertEqual(
+            self.choices.vote_choices("  ", UserID="UserB"),
+            [
+                {"name": "Aliens", "value": "3"},
+                {"name": "The Thing", "value": "1"},
+            ],
+        )
+
+    def test_filtered(self):
+        self.assertEqual(
+            [c["value"] for c in self.choices.watch_choices("ALI")],
+            ["2", "3"],
+        )
+        self.assertEqual(
+            [c["value"] for c in self.choices.watch_choices("thing")],
+            ["1"],
+        )
+        # Typos still match
+        self.assertEqual(
+            [c["value"] for c in self.choices.watch_choices("thw thing")],
+            ["1"],
+        )
+        self.assertEqual(
+            [c["value"] for c in self.choices.watch_choices("allien")],
+            ["2", "3"],
+        )
+        self.assertEqual(self.choices.watch_choices("predator"), [])
+        self.assertEqual(
+            [
+                c["value"]
+                for c in self.choices.vote_choices("alien", UserID="UserB")
+            ],
+            ["3"],
+        )
+
+    def test_max_choices(self):
+        choices = NominationChoices(
+            [
+                nomination(str(i), f"Film {i}", f"User{i}", 1)
+                for i in range(MAX_CHOICES + 5)
+            ]
+        )
+        self.assertEqual(len(choices.watch_choices("")), MAX_CHOICES)
+        self.assertEqual(len(choices.watch_choices("film")), MAX_CHOICES)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from flame_graph import MAX_DEPTH, folded_stacks
+from profiling import (
+    PROFILE_DIR,
+    PROFILE_GUILDS,
+    PROFILE_MODE,
+    ProfileMode,
+    profile_modes,
+    profile_request,
+)
+
+ENVIRONMENT = [PROFILE_GUILDS, PROFILE_MODE, PROFILE_DIR]
+
+
+def fib(n):
+    return n if n < 2 else fib(n - 1) + fib(n - 2)
+
+
+def leaf():
+    return sum(range(20000))
+
+
+def branch():
+    return leaf() + leaf()
+
+
+def root():
+    return branch() + leaf()
+
+
+def profiled(Guild="guild"):
+    """Run `root` within `profile_request` and return what it logged."""
+    out = io.StringIO()
+    with redirect_stdout(out):
+        with profile_request(Command="peek", Guild=Guild):
+            root()
+            fib(15)
+            blocks = [bytearray(1024) for _ in range(100)]
+    return [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.environment = {k: os.environ.pop(k, None) for k in ENVIRONMENT}
+
+    def tearDown(self):
+        for k, v in self.environment.items():
+            os.environ.pop(k, None)
+            if v is not None:
+                os.environ[k] = v
+
+    def test_profile_modes(self):
+        self.assertEqual(profile_modes("guild"), set())
+        os.environ[PROFILE_GUILDS] = "other, guild"
+        self.assertEqual(profile_modes("guild"), {ProfileMode.CPU})
+        self.assertEqual(profile_modes("third"), set())
+        os.environ[PROFILE_GUILDS] = "*"
+        os.environ[PROFILE_MODE] = "cpu,memory,bogus"
+        self.assertEqual(
+            profile_modes("third"), {ProfileMode.CPU, ProfileMode.MEMORY}
+        )
+
+    def test_not_profiled(self):
+        os.environ[PROFILE_GUILDS] = "other"
+        self.assertEqual(profiled(), [])
+
+    def test_cpu(self):
+        os.environ[PROFILE_GUILDS] = "guild"
+        (line,) = profiled()
+        self.assertEqual(line["profile"], "peek")
+        self.assertEqual(line["guild"], "guild")
+        self.assertNotIn("allocations", line)
+        self.assertNotIn("pstats_file", line)
+        functions = {
+            f["function"].split("(")[-1]: f for f in line["functions"]
+        }
+        self.assertEqual(functions["leaf)"]["calls"], 3)
+        self.assertGreaterEqual(
+            functions["root)"]["cumtime_ms"],
+            functions["branch)"]["cumtime_ms"],
+        )
+
+    def test_memory(self):
+        os.environ[PROFILE_GUILDS] = "guild"
+        os.environ[PROFILE_MODE] = "memory"
+        (line,) = profiled()
+        self.assertNotIn("functions", line)
+        self.assertGreater(line["peak_kb"], 100)
+        self.assertIn(
+            "test_profiling.py",
+            " ".join(a["line"] for a in line["allocations"]),
+        )
+
+    def test_files_and_flame_graph(self):
+        with tempfile.TemporaryDirectory() as directory:
+            os.environ[PROFILE_GUILDS] = "guild"
+            os.environ[PROFILE_MODE] = "cpu,memory"
+            os.environ[PROFILE_DIR] = directory
+            (line,) = profiled()
+            self.assertTrue(os.path.exists(line["tracemalloc_file"]))
+            stacks = folded_stacks(pstats.Stats(line["pstats_file"]))
+
+        def stack_time(*names):
+            return sum(
+                microseconds
+                for (stack, microseconds) in stacks.items()
+                if [f.split("(")[-1] for f in stack.split(";")[-len(names) :]]
+                == [f"{name})" for name in names]
+            )
+
+        # `leaf` is called twice through `branch` and once directly
+        through_branch = stack_time("root", "branch", "leaf")
+        direct = stack_time("root", "leaf")
+        self.assertGreater(through_branch, 0)
+        self.assertGreater(direct, 0)
+        self.assertGreater(through_branch, direct)
+        # Recursion doesn't make the stacks any deeper
+        self.assertFalse(any("fib);" in stack for stack in stacks), stacks)
+        self.assertGreater(stack_time("fib"), 0)
+
+    def test_flame_graph_of_realistic_profile(self):
+        import boto3
+
+        # Creating a client calls into hundreds of functions from many
+        # places, which has more paths through it than we could follow
+        profiler = cProfile.Profile()
+        profiler.enable()
+        boto3.session.Session().client("dynamodb", region_name="eu-west-2")
+        profiler.disable()
+        stats = pstats.Stats(profiler)
+        self.assertGreater(len(stats.stats), 500)
+
+        stacks = folded_stacks(stats)
+        # What is left out is too little to see
+        self.assertGreater(
+            sum(stacks.values()), stats.total_tt * 1_000_000 * 0.8
+        )
+        self.assertLessEqual(
+            max(len(stack.split(";")) for stack in stacks), MAX_DEPTH
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
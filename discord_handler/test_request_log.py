@@ -0,0 +1,126 @@
+import io
+import json
+import os
+import unittest
+from contextlib import redirect_stdout
+import request_log
+from request_log import (
+    LOG_SAMPLE_RATE,
+    DEFAULT_SAMPLE_RATE,
+    dumps,
+    log_request,
+    sample_rate,
+    truncate,
+)
+
+HISTORY_EVENT = {
+    "params": {"header": {"x-signature-ed25519": "ab" * 64}},
+    "rawBody": "x" * 1000,
+    "body-json": {
+        "type": 2,
+        "guild_id": "guild",
+        "data": {"name": "history", "options": []},
+    },
+}
+
+BUTTON_EVENT = {
+    "body-json": {
+        "type": 3,
+        "guild_id": "guild",
+        "data": {"component_type": 2, "custom_id": "shame"},
+    },
+}
+
+
+def logged(event, response, **kwargs):
+    out = io.StringIO()
+    with redirect_stdout(out):
+        log_request(event, response, **kwargs)
+    lines = out.getvalue().splitlines()
+    assert len(lines) == 1
+    return json.loads(lines[0])
+
+
+class TestRequestLog(unittest.TestCase):
+    def setUp(self):
+        self.sample_rate = os.environ.pop(LOG_SAMPLE_RATE, None)
+
+    def tearDown(self):
+        os.environ.pop(LOG_SAMPLE_RATE, None)
+        if self.sample_rate is not None:
+            os.environ[LOG_SAMPLE_RATE] = self.sample_rate
+
+    def test_truncate(self):
+        self.assertEqual(truncate("abc", MaxSize=3), "abc")
+        self.assertEqual(truncate("abcdef", MaxSize=3), "abc...(+3 chars)")
+        self.assertEqual(
+            truncate({"a": ["abcdef", 1, None], "b": "ab"}, MaxSize=3),
+            {"a": ["abc...(+3 chars)", 1, None], "b": "ab"},
+        )
+
+    def test_dumps_without_orjson(self):
+        codec, request_log.orjson = (request_log.orjson, None)
+        try:
+            self.assertEqual(dumps({"a": [1, "b"]}), '{"a":[1,"b"]}')
+        finally:
+            request_log.orjson = codec
+
+    def test_sample_rate(self):
+        self.assertEqual(sample_rate(), DEFAULT_SAMPLE_RATE)
+        os.environ[LOG_SAMPLE_RATE] = "0.5"
+        self.assertEqual(sample_rate(), 0.5)
+        os.environ[LOG_SAMPLE_RATE] = "lots"
+        self.assertEqual(sample_rate(), DEFAULT_SAMPLE_RATE)
+
+    def test_summary_only(self):
+        self.assertEqual(
+            logged(HISTORY_EVENT, {"type": 4}, Latency=0.01234, Sampled=False),
+            {
+                "type": 2,
+                "command": "history",
+                "guild": "guild",
+                "latency_ms": 12.3,
+                "outcome": "ok",
+            },
+        )
+
+    def test_button_summary(self):
+        line = logged(BUTTON_EVENT, {"type": 4}, Latency=0, Sampled=False)
+        self.assertEqual(line["command"], "shame")
+
+    def test_sampled(self):
+        line = logged(
+            HISTORY_EVENT,
+            {"type": 4, "data": {"content": "y" * 2000}},
+            Latency=0,
+            Sampled=True,
+        )
+        self.assertEqual(line["outcome"], "ok")
+        self.assertEqual(
+            line["event"]["rawBody"], truncate(HISTORY_EVENT["rawBody"])
+        )
+        self.assertEqual(
+            line["response"]["data"]["content"], truncate("y" * 2000)
+        )
+
+    def test_sample_rate_zero(self):
+        os.environ[LOG_SAMPLE_RATE] = "0"
+        line = logged(HISTORY_EVENT, {"type": 4}, Latency=0)
+        self.assertNotIn("event", line)
+
+    def test_error_is_logged_in_full(self):
+        line = logged(
+            HISTORY_EVENT,
+            None,
+            Latency=0,
+            Error=KeyError("guild_id"),
+            Sampled=False,
+        )
+        self.assertEqual(line["outcome"], "error")
+        self.assertEqual(line["error"], "KeyError: 'guild_id'")
+        self.assertEqual(line["event"]["body-json"]["data"]["name"], "history")
+        self.assertIsNone(line["response"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+import os
+import gzip
+import tempfile
+import unittest
+from build_title_index import build_title_index
+from title_index import (
+    MAX_CANDIDATES,
+    SearchResult,
+    TitleIndex,
+    write_title_index,
+)
+
+BASICS = [
+    "tconst\ttitleType\tprimaryTitle\toriginalTitle\tisAdult\tstartYear\tendYear\truntimeMinutes\tgenres",
+    "tt0078748\tmovie\tAlien\tAlien\t0\t1979\t\\N\t117\tHorror,Sci-Fi",
+    "tt0090605\tmovie\tAliens\tAliens\t0\t1986\t\\N\t137\tAction",
+    "tt0103644\tmovie\tAlien 3\tAlien³\t0\t1992\t\\N\t114\tAction",
+    "tt0094631\ttvSeries\tAlien Nation\tAlien Nation\t0\t1989\t1990\t60\tDrama",
+    "tt0133093\tmovie\tThe Matrix\tThe Matrix\t0\t1999\t\\N\t136\tAction",
+    "tt0234215\tmovie\tThe Matrix Reloaded\tThe Matrix Reloaded\t0\t2003\t\\N\t138\tAction",
+    "tt9999999\tmovie\tAlien Adult\tAlien Adult\t1\t2000\t\\N\t90\tAdult",
+    "tt8888888\tmovie\tAlien: Unreleased\tAlien: Unreleased\t0\t\\N\t\\N\t\\N\t\\N",
+]
+
+RATINGS = [
+    "tconst\taverageRating\tnumVotes",
+    "tt0078748\t8.5\t900000",
+    "tt0090605\t8.4\t750000",
+    "tt0103644\t6.4\t300000",
+    "tt0133093\t8.7\t2000000",
+    "tt0234215\t7.2\t600000",
+]
+
+
+class TestTitleIndex(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        basics = os.path.join(self.directory.name, "title.basics.tsv")
+        with open(basics, "w", encoding="utf-8") as f:
+            f.write("\n".join(BASICS) + "\n")
+        ratings = os.path.join(self.directory.name, "title.ratings.tsv.gz")
+        with gzip.open(ratings, "wt", encoding="utf-8") as f:
+            f.write("\n".join(RATINGS) + "\n")
+
+        self.path = os.path.join(self.directory.name, "titles.idx")
+        self.assertEqual(
+            build_title_index(
+                basics, self.path, RatingsPath=ratings, Processes=2
+            ),
+            6,
+        )
+        self.index = TitleIndex(self.path)
+
+    def tearDown(self):
+        self.index.close()
+        self.directory.cleanup()
+
+    def test_prefix_search(self):
+        alien = SearchResult(IMDbID="0078748", Title="Alien", Year=1979)
+        aliens = SearchResult(IMDbID="0090605", Title="Aliens", Year=1986)
+        alien3 = SearchResult(IMDbID="0103644", Title="Alien 3", Year=1992)
+        unreleased = SearchResult(
+            IMDbID="8888888", Title="Alien: Unreleased", Year=None
+        )
+
+        self.assertEqual(len(self.index), 6)
+
+        # Ranked by votes, without TV shows or adult films
+        self.assertEqual(
+            self.index.search("ali", Limit=10),
+            [alien, aliens, alien3, unreleased],
+        )
+        self.assertEqual(self.index.search("  ALI", Limit=2), [alien, aliens])
+
+        # Exact matches always come first
+        self.assertEqual(self.index.search("aliens", Limit=10), [aliens])
+        self.assertEqual(self.index.search("alien 3", Limit=10), [alien3])
+
+        self.assertEqual(self.index.search("predator", Limit=10), [])
+        self.assertEqual(self.index.search("", Limit=10), [])
+
+        # Before and after every key
+        self.assertEqual(self.index.search("0", Limit=10), [])
+        self.assertEqual(self.index.search("zzz", Limit=10), [])
+
+    def test_token_search(self):
+        matrix = SearchResult(IMDbID="0133093", Title="The Matrix", Year=1999)
+        reloaded = SearchResult(
+            IMDbID="0234215", Title="The Matrix Reloaded", Year=2003
+        )
+
+        self.assertEqual(
+            self.index.search("matr", Limit=10), [matrix, reloaded]
+        )
+        self.assertEqual(self.index.search("matrix rel", Limit=10), [reloaded])
+        self.assertEqual(self.index.search("relo", Limit=10), [reloaded])
+        self.assertEqual(self.index.search("alien rel", Limit=10), [])
+
+        # Title prefix matches are ranked before word matches
+        self.assertEqual(
+            self.index.search("the matrix", Limit=10), [matrix, reloaded]
+        )
+
+    def test_ranks_every_match(self):
+        # The most popular films sort after more than `MAX_CANDIDATES` others
+        path = os.path.join(self.directory.name, "many.idx")
+        count = MAX_CANDIDATES + 500
+        write_title_index(
+            path,
+            [(f"Film {i:05d}", 2000, i, f"{i:07d}") for i in range(count)],
+        )
+        index = TitleIndex(path)
+        self.assertEqual(
+            [r.IMDbID for r in index.search("fi", Limit=2)],
+            [f"{count - 1:07d}", f"{count - 2:07d}"],
+        )
+        self.assertEqual(
+            [r.IMDbID for r in index.search("0", Limit=2)],
+            [f"{count - 1:07d}", f"{count - 2:07d}"],
+        )
+        index.close()
+
+        # As are films matching a word other than the first
+        write_title_index(
+            path,
+            [(f"{i:05d} Nights", 2000, i, f"{i:07d}") for i in range(count)],
+        )
+        index = TitleIndex(path)
+        self.assertEqual(
+            [r.IMDbID for r in index.search("nigh", Limit=2)],
+            [f"{count - 1:07d}", f"{count - 2:07d}"],
+        )
+        self.assertEqual(
+            [r.IMDbID for r in index.search("00017 nig", Limit=2)],
+            ["0000017"],
+        )
+        index.close()
+
+    def test_write_title_index(self):
+        path = os.path.join(self.directory.name, "empty.idx")
+        write_title_index(path, [])
+        index = TitleIndex(path)
+        self.assertEqual(index.search("alien", Limit=10), [])
+        index.close()
+
+        with self.assertRaises(ValueError):
+            TitleIndex(os.path.join(self.directory.name, "title.basics.tsv"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import datetime as dt
+import json
+import os
+import tempfile
+import unittest
+import boto3
+from moto import mock_dynamodb
+from filmbot import FilmBot
+from instrumentation import InstrumentedClient
+from tracing import (
+    NO_OP_SPAN,
+    InMemoryExporter,
+    JSONFileExporter,
+    StatusCode,
+    set_exporter,
+    span,
+    traced,
+)
+from test_filmbot import set_db
+
+AWS_REGION = "eu-west-2"
+
+
+class TestTracing(unittest.TestCase):
+    mock_dynamodb = mock_dynamodb()
+
+    def setUp(self):
+        self.maxDiff = None
+
+        self.mock_dynamodb.start()
+        boto3.setup_default_session()
+        self.dynamodb_client = boto3.client("dynamodb", region_name=AWS_REGION)
+        set_db(self.dynamodb_client, {})
+        self.exporter = InMemoryExporter()
+        set_exporter(self.exporter)
+
+    def tearDown(self):
+        set_exporter(None)
+        self.mock_dynamodb.stop()
+
+    def test_switched_off(self):
+        set_exporter(None)
+
+        @traced("double")
+        def double(x):
+            return 2 * x
+
+        self.assertIs(span("anything", a=1), NO_OP_SPAN)
+        with span("anything") as s:
+            s.set_attribute("a", 1)
+        self.assertEqual(double(2), 4)
+        self.assertEqual(self.exporter.spans, [])
+
+    def test_nested_spans(self):
+        @traced("inner")
+        def inner():
+            raise ValueError("bad")
+
+        with span("outer", command="peek") as outer:
+            outer.set_attribute("guild", "guild")
+            with self.assertRaises(ValueError):
+                inner()
+        with span("next"):
+            pass
+
+        i, o, n = self.exporter.spans
+        self.assertEqual((i.name, o.name, n.name), ("inner", "outer", "next"))
+        self.assertEqual(i.traceId, o.traceId)
+        self.assertEqual(i.parentSpanId, o.spanId)
+        self.assertIsNone(o.parentSpanId)
+        self.assertNotEqual(n.traceId, o.traceId)
+        self.assertEqual(i.status, StatusCode.ERROR)
+        self.assertEqual(i.statusMessage, "ValueError: bad")
+        self.assertEqual(o.status, StatusCode.UNSET)
+        self.assertEqual(o.attributes, {"command": "peek", "guild": "guild"})
+        self.assertLessEqual(o.startTimeUnixNano, i.startTimeUnixNano)
+        self.assertLessEqual(i.endTimeUnixNano, o.endTimeUnixNano)
+
+    def test_filmbot_and_dynamodb_spans(self):
+        filmbot = FilmBot(
+            DynamoDBClient=InstrumentedClient(self.dynamodb_client),
+            GuildID="guild",
+        )
+        filmbot.nominate_film(
+            DiscordUserID="user",
+            FilmName="Alien",
+            IMDbID=None,
+            DateTime=dt.datetime(2023, 1, 1),
+        )
+
+        spans = {s.spanId: s for s in self.exporter.spans}
+        (nominate,) = [
+            s for s in spans.values() if s.name == "FilmBot.nominate_film"
+        ]
+        children = [
+            s for s in spans.values() if s.parentSpanId == nominate.spanId
+        ]
+        self.assertIn(
+            "DynamoDB.transact_write_items", [s.name for s in children]
+        )
+        for s in children:
+            if s.name.startswith("DynamoDB."):
+                self.assertEqual(s.attributes["db.system"], "dynamodb")
+
+    def test_json_file_exporter(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "trace.jsonl")
+            set_exporter(JSONFileExporter(path))
+            with span("outer"):
+                with span("inner", IMDbID="0078748"):
+                    pass
+
+            with open(path) as f:
+                inner, outer = [json.loads(line) for line in f]
+
+        self.assertEqual(inner["name"], "inner")
+        self.assertEqual(inner["attributes"], {"IMDbID": "0078748"})
+        self.assertEqual(inner["parentSpanId"], outer["spanId"])
+        self.assertEqual(inner["traceId"], outer["traceId"])
+        self.assertEqual(len(outer["traceId"]), 32)
+        self.assertEqual(len(outer["spanId"]), 16)
+        self.assertEqual(outer["status"], {"code": StatusCode.UNSET})
+        self.assertGreater(outer["endTimeUnixNano"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+import io
+import time
+import unittest
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+import boto3
+from moto import mock_dynamodb
+import lambda_function
+from discord_handler import handle_discord
+from filmbot import FilmBot
+from guild_ranking import ranking_cache
+from nomination_choices import nomination_cache
+from test_deferral import command_event
+from test_discord_handler import set_db
+from warmup import (
+    SCREENING_EXPIRY,
+    WARMUP,
+    get_screening_guilds,
+    record_screening,
+    screening_slot,
+    upcoming_slots,
+    warm_up,
+)
+
+AWS_REGION = "eu-west-2"
+
+# A Friday
+SCREENING = datetime(2023, 6, 2, 20, 30)
+
+
+class TestWarmup(unittest.TestCase):
+    mock_dynamodb = mock_dynamodb()
+
+    def setUp(self):
+        self.mock_dynamodb.start()
+        boto3.setup_default_session()
+        self.dynamodb_client = boto3.client("dynamodb", region_name=AWS_REGION)
+        set_db(self.dynamodb_client, {})
+        nomination_cache.clear()
+        ranking_cache.clear()
+
+    def tearDown(self):
+        self.mock_dynamodb.stop()
+
+    def test_slots(self):
+        self.assertEqual(screening_slot(SCREENING), "4#20")
+        self.assertEqual(
+            upcoming_slots(SCREENING - timedelta(minutes=45)),
+            {"4#19", "4#20", "4#21"},
+        )
+        # Sunday night wraps around to Monday
+        self.assertEqual(
+            upcoming_slots(datetime(2023, 6, 4, 23, 30)),
+            {"6#23", "0#00", "0#01"},
+        )
+
+    def test_screening_guilds(self):
+        record_screening(self.dynamodb_client, "weekly", SCREENING)
+        record_screening(
+            self.dynamodb_client, "weekly", SCREENING + timedelta(days=6)
+        )
+        record_screening(
+            self.dynamodb_client, "afternoons", SCREENING - timedelta(hours=6)
+        )
+        record_screening(
+            self.dynamodb_client,
+            "stopped",
+            SCREENING - SCREENING_EXPIRY - timedelta(weeks=1),
+        )
+        # Used to meet at the same time as "weekly", but now meets a day later
+        record_screening(
+            self.dynamodb_client,
+            "moved",
+            SCREENING - SCREENING_EXPIRY - timedelta(weeks=1),
+        )
+        record_screening(
+            self.dynamodb_client, "moved", SCREENING + timedelta(days=1)
+        )
+
+        next_week = SCREENING + timedelta(weeks=1, hours=-1)
+        self.assertEqual(
+            get_screening_guilds(self.dynamodb_client, next_week), ["weekly"]
+        )
+        # Either of the slots it has watched in
+        self.assertEqual(
+            get_screening_guilds(
+                self.dynamodb_client, next_week + timedelta(days=6)
+            ),
+            ["weekly"],
+        )
+        self.assertEqual(
+            get_screening_guilds(
+                self.dynamodb_client, next_week - timedelta(hours=6)
+            ),
+            ["afternoons"],
+        )
+        self.assertEqual(
+            get_screening_guilds(
+                self.dynamodb_client, next_week + timedelta(days=1)
+            ),
+            ["moved"],
+        )
+
+    def test_watch_records_screening(self):
+        filmbot = FilmBot(DynamoDBClient=self.dynamodb_client, GuildID="123")
+        filmbot.nominate_film(
+            DiscordUserID="abc",
+            FilmName="Film",
+            IMDbID=None,
+            DateTime=datetime.now() - timedelta(days=1),
+        )
+        (film,) = filmbot.get_nominations()
+        with redirect_stdout(io.StringIO()):
+            handle_discord(
+                command_event("watch", [{"value": film.FilmID}]),
+                self.dynamodb_client,
+            )
+        self.assertEqual(
+            get_screening_guilds(self.dynamodb_client, datetime.now()),
+            ["123"],
+        )
+
+    def test_warm_up(self):
+        filmbot = FilmBot(DynamoDBClient=self.dynamodb_client, GuildID="123")
+        filmbot.nominate_film(
+            DiscordUserID="abc",
+            FilmName="Film",
+            IMDbID=None,
+            DateTime=SCREENING,
+        )
+        record_screening(self.dynamodb_client, "123", SCREENING)
+        now = SCREENING + timedelta(weeks=1, hours=-1)
+
+        self.assertEqual(
+            warm_up(
+                self.dynamodb_client, Now=now, Deadline=time.monotonic() - 1
+            ),
+            {"warmup": True, "guilds": [], "skipped": 1},
+        )
+        self.assertIsNone(ranking_cache.get("123"))
+
+        self.assertEqual(
+            warm_up(self.dynamodb_client, Now=now),
+            {"warmup": True, "guilds": ["123"], "skipped": 0},
+        )
+        self.assertIsNotNone(ranking_cache.get("123"))
+        self.assertEqual(len(nomination_cache.get("123")), 1)
+
+    def test_lambda_handler(self):
+        client, lambda_function._client = (
+            lambda_function._client,
+            self.dynamodb_client,
+        )
+        try:
+            with redirect_stdout(io.StringIO()):
+                response = lambda_function.lambda_handler({WARMUP: True}, None)
+        finally:
+            lambda_function._client = client
+        self.assertEqual(
+            response, {"warmup": True, "guilds": [], "skipped": 0}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
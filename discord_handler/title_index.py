@@ -0,0 +1,272 @@
+import heapq
+import mmap
+import struct
+from collections import namedtuple
+from filmbot import normalize_title
+
+# A title index file is laid out as:
+#   - `MAGIC`
+#   - the number of films and tokens as `COUNTS`
+#   - an `OFFSET` to each film record and its votes, ordered by the film's
+#     key
+#   - a `TOKEN` for each word of each film's key other than the first,
+#     ordered by the word
+#   - the film records
+#
+# Each film record is a line of UTF-8 encoded fields separated by "\x1f":
+#   `Key`, `Title`, `Year`, `Votes`, `IMDbID`
+# where `Key` is the normalized title and `Year` is empty if it isn't known.
+# A `TOKEN` is the file offset of a word within a key and the position of
+# its film in the `OFFSET` table.
+#
+# Keys and words are compared by viewing only as many bytes as the prefix we
+# are looking for in the memory map.  As "\x1f" and " " sort before any
+# character in a normalized title, a key or word that is shorter than the
+# prefix still compares correctly, and the films or words that start with a
+# prefix are a range that we find with two binary searches.  Keeping the
+# votes in the `OFFSET` table lets us rank every film in that range without
+# reading their records.
+MAGIC = b"FBTIDX02"
+COUNTS = struct.Struct("<II")
+OFFSET = struct.Struct("<II")
+TOKEN = struct.Struct("<II")
+FIELD_SEPARATOR = b"\x1f"
+
+SearchResult = namedtuple("SearchResult", ["IMDbID", "Title", "Year"])
+
+# The maximum number of films matching the last word of a search, most
+# popular first, whose other words we check, which bounds the time taken by
+# searches for words that rarely appear in the same title
+MAX_CANDIDATES = 2000
+
+
+def index_key(title):
+    """Return the key the specified `title` is indexed by."""
+    return normalize_title(title).replace("\x1f", "")
+
+
+def write_title_index(path, films):
+    """
+    Write a title index to the specified `path` containing the specified
+    `films`, which is an iterable of `(Title, Year, Votes, IMDbID)` tuples
+    where `Year` may be `None` and `Votes` is used to rank matches.
+    """
+    records = sorted(
+        (index_key(title).encode(), title, year, votes, imdb_id)
+        for (title, year, votes, imdb_id) in films
+    )
+    records = [r for r in records if r[0]]
+
+    lines = [
+        FIELD_SEPARATOR.join(
+            [
+                key,
+                title.encode(),
+                b"" if year is None else str(year).encode(),
+                str(votes).encode(),
+                imdb_id.encode(),
+            ]
+        )
+        + b"\n"
+        for (key, title, year, votes, imdb_id) in records
+    ]
+
+    tokens = []
+    for index, (key, *_) in enumerate(records):
+        start = 0
+        for word in key.split(b" "):
+            if start != 0:
+                tokens.append((word, index, start))
+            start += len(word) + 1
+    tokens.sort()
+
+    data_start = (
+        len(MAGIC)
+        + COUNTS.size
+        + OFFSET.size * len(lines)
+        + TOKEN.size * len(tokens)
+    )
+    offsets = []
+    position = data_start
+    for line in lines:
+        offsets.append(position)
+        position += len(line)
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(COUNTS.pack(len(lines), len(tokens)))
+        for offset, (_, _, _, votes, _) in zip(offsets, records):
+            f.write(OFFSET.pack(offset, votes))
+        for word, index, start in tokens:
+            f.write(TOKEN.pack(offsets[index] + start, index))
+        for line in lines:
+            f.write(line)
+
+
+class TitleIndex:
+    """
+    A read-only, memory-mapped index of film titles written by
+    `write_title_index`, which finds films by the prefix of their title or
+    of any word in their title.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[: len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"'{path}' is not a title index")
+        self._view = memoryview(self._mmap)
+
+        self._film_count, self._token_count = COUNTS.unpack_from(
+            self._view, len(MAGIC)
+        )
+        self._offsets_start = len(MAGIC) + COUNTS.size
+        self._tokens_start = (
+            self._offsets_start + OFFSET.size * self._film_count
+        )
+
+    def close(self):
+        self._view.release()
+        self._mmap.close()
+
+    def __len__(self):
+        return self._film_count
+
+    def _film_offset(self, index):
+        return OFFSET.unpack_from(
+            self._view, self._offsets_start + OFFSET.size * index
+        )[0]
+
+    def _film_votes(self, index):
+        return OFFSET.unpack_from(
+            self._view, self._offsets_start + OFFSET.size * index
+        )[1]
+
+    def _token(self, index):
+        return TOKEN.unpack_from(
+            self._view, self._tokens_start + TOKEN.size * index
+        )
+
+    def _film(self, index):
+        """Return a tuple of the key and `SearchResult` of a film."""
+        start = self._film_offset(index)
+        end = self._mmap.find(b"\n", start)
+        key, title, year, _, imdb_id = (
+            self._view[start:end].tobytes().split(FIELD_SEPARATOR)
+        )
+        return (
+            key,
+            SearchResult(
+                IMDbID=imdb_id.decode(),
+                Title=title.decode(),
+                Year=int(year) if year else None,
+            ),
+        )
+
+    def _bound(self, count, offset_of, prefix, Upper=False):
+        """
+        Return the first of `count` sorted entries whose string, which starts
+        at `offset_of(i)`, is not less than `prefix`, or is greater than any
+        string starting with `prefix` if `Upper`.
+        """
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = offset_of(mid)
+            # `memoryview`s can only be compared for equality, so only this
+            # many bytes are copied
+            string = self._view[start : start + len(prefix)].tobytes()
+            if string < prefix or (Upper and string == prefix):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _most_votes(self, first, last, Limit):
+        """
+        Return the indexes of at most `Limit` of the films from `first` up to
+        `last` with the most votes, in that order.
+        """
+        start = self._offsets_start + OFFSET.size * first
+        offsets = self._view[start : start + OFFSET.size * (last - first)]
+        films = zip(range(first, last), OFFSET.iter_unpack(offsets))
+        return [
+            index
+            for (index, _) in heapq.nlargest(
+                Limit, films, key=lambda film: film[1][1]
+            )
+        ]
+
+    def _prefix_matches(self, prefix):
+        """Return the range of the films whose key starts with `prefix`."""
+        return range(
+            self._bound(self._film_count, self._film_offset, prefix),
+            self._bound(
+                self._film_count, self._film_offset, prefix, Upper=True
+            ),
+        )
+
+    def _token_matches(self, prefix):
+        """
+        Return the indexes of the films with a word other than the first that
+        starts with `prefix`.
+        """
+
+        def token_offset(index):
+            return self._token(index)[0]
+
+        first = self._bound(self._token_count, token_offset, prefix)
+        last = self._bound(self._token_count, token_offset, prefix, Upper=True)
+        start = self._tokens_start + TOKEN.size * first
+        tokens = self._view[start : start + TOKEN.size * (last - first)]
+        return {film for (_, film) in TOKEN.iter_unpack(tokens)}
+
+    def search(self, query, *, Limit):
+        """
+        Return an array of at most `Limit` `SearchResult`s for the films
+        whose title starts with `query`, followed by those with words that
+        match the words in `query`, each ranked by popularity.
+        """
+        key = index_key(query).encode()
+        if not key:
+            return []
+
+        # Exact matches first, which sort before any longer key, then by the
+        # most votes
+        prefix_matches = self._prefix_matches(key)
+        exact = self._bound(
+            self._film_count,
+            self._film_offset,
+            key + FIELD_SEPARATOR,
+            Upper=True,
+        )
+        films = self._most_votes(
+            prefix_matches.start, exact, Limit
+        ) + self._most_votes(exact, prefix_matches.stop, Limit)
+        results = [self._film(film)[1] for film in films[:Limit]]
+        if len(results) >= Limit:
+            return results
+
+        # Otherwise find films containing all of the words in `query`, where
+        # the last word may not have been finished yet
+        words = key.split(b" ")
+        # Only the most popular candidates are kept as we go, and without
+        # other words to check we only need as many as we have room for
+        candidates = heapq.nsmallest(
+            MAX_CANDIDATES if len(words) > 1 else Limit - len(results),
+            (
+                film
+                for film in self._token_matches(words[-1])
+                if film not in prefix_matches
+            ),
+            key=lambda film: (-self._film_votes(film), film),
+        )
+        for film in candidates:
+            film_key, result = self._film(film)
+            film_words = film_key.split(b" ")
+            if all(word in film_words for word in words[:-1]):
+                results.append(result)
+                if len(results) >= Limit:
+                    break
+        return results
@@ -0,0 +1,169 @@
+import functools
+import os
+import random
+import time
+import types
+from contextvars import ContextVar
+from threading import Lock
+from request_log import dumps
+
+# Spans are only recorded when there is an exporter to send them to, which
+# is a `JSONFileExporter` writing to the path in this environment variable
+# if it is set, or whatever was passed to `set_exporter`.  Otherwise `span`
+# returns a shared span that does nothing, so tracing costs a global lookup.
+TRACE_FILE = "FILMBOT_TRACE_FILE"
+
+
+class StatusCode:
+    UNSET = "UNSET"
+    OK = "OK"
+    ERROR = "ERROR"
+
+
+# The span that new spans are children of
+_current_span = ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    A timed operation within a trace, with the same IDs, timestamps and
+    status as an OpenTelemetry span so that exported spans can be loaded
+    into OpenTelemetry tools.
+    """
+
+    def __init__(self, name, exporter, attributes):
+        parent = _current_span.get()
+        self.name = name
+        self.traceId = (
+            f"{random.getrandbits(128):032x}"
+            if parent is None
+            else parent.traceId
+        )
+        self.spanId = f"{random.getrandbits(64):016x}"
+        self.parentSpanId = None if parent is None else parent.spanId
+        self.attributes = attributes
+        self.status = StatusCode.UNSET
+        self.statusMessage = None
+        self.startTimeUnixNano = None
+        self.endTimeUnixNano = None
+        self._exporter = exporter
+        self._token = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.startTimeUnixNano = time.time_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.endTimeUnixNano = time.time_ns()
+        _current_span.reset(self._token)
+        if exc is not None:
+            self.status = StatusCode.ERROR
+            self.statusMessage = f"{exc_type.__name__}: {exc}"
+        self._exporter.export(self)
+        return False
+
+    def toDict(self):
+        span = {
+            "traceId": self.traceId,
+            "spanId": self.spanId,
+            "parentSpanId": self.parentSpanId,
+            "name": self.name,
+            "startTimeUnixNano": self.startTimeUnixNano,
+            "endTimeUnixNano": self.endTimeUnixNano,
+            "attributes": self.attributes,
+            "status": {"code": self.status},
+        }
+        if self.statusMessage is not None:
+            span["status"]["message"] = self.statusMessage
+        return span
+
+
+class NoOpSpan:
+    """What `span` returns when tracing is switched off."""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NO_OP_SPAN = NoOpSpan()
+
+
+class JSONFileExporter:
+    """Appends each span to the file at `path` as a line of JSON, for
+    looking at traces offline."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = Lock()
+
+    def export(self, span):
+        line = dumps(span.toDict()) + "\n"
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line)
+
+
+class InMemoryExporter:
+    """Keeps each span in `spans` in the order they end, for tests."""
+
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+
+_exporter = (
+    JSONFileExporter(os.environ[TRACE_FILE])
+    if os.environ.get(TRACE_FILE)
+    else None
+)
+
+
+def set_exporter(exporter):
+    """Send spans to `exporter`, or switch tracing off if it is `None`."""
+    global _exporter
+    _exporter = exporter
+
+
+def span(name, **attributes):
+    """Return a context manager that times the code within it as a child of
+    the current span."""
+    if _exporter is None:
+        return NO_OP_SPAN
+    return Span(name, _exporter, attributes)
+
+
+def traced(name):
+    """Decorate a function to run it within a span called `name`."""
+
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _exporter is None:
+                return function(*args, **kwargs)
+            with Span(name, _exporter, {}):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def traced_methods(cls):
+    """Decorate a class to run each of its public methods within a span
+    called `<class>.<method>`."""
+    for name, method in list(vars(cls).items()):
+        if isinstance(method, types.FunctionType) and name[0] != "_":
+            setattr(cls, name, traced(f"{cls.__name__}.{name}")(method))
+    return cls
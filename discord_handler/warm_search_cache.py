@@ -0,0 +1,41 @@
+# warm_search_cache.py
+#
+# Description
+# ===========
+#
+# This script fills the `/nominate` autocomplete search cache in the FilmBot
+# table with the IMDb results for each of the prefixes in a file (one per
+# line), so that the most common keystrokes never reach IMDb.  Prefixes that
+# are already cached are skipped, so it can be rerun regularly to refresh
+# searches that have expired.
+#
+# Usage
+# =====
+#
+# $ python warm_search_cache.py PREFIXES_FILE [--limit N]
+
+import argparse
+import os
+import boto3
+from film_search import warm_search_cache, SEARCH_SUPERSET_SIZE
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fill the /nominate autocomplete search cache"
+    )
+    parser.add_argument("prefixes")
+    # Only searches with the same limit as `search_films` uses are found
+    parser.add_argument("--limit", type=int, default=SEARCH_SUPERSET_SIZE)
+    args = parser.parse_args()
+
+    with open(args.prefixes, encoding="utf-8") as f:
+        prefixes = f.read().splitlines()
+
+    client = boto3.client("dynamodb", region_name=os.environ["AWS_REGION"])
+    count = warm_search_cache(client, prefixes, Limit=args.limit)
+    print(f"Cached {count} searches")
+
+
+if __name__ == "__main__":
+    main()
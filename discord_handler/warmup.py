@@ -0,0 +1,180 @@
+import datetime as dt
+import importlib
+from time import monotonic
+
+# `lambda_function` imports this module for `WARMUP` on every cold start, so
+# everything else is imported when it's used
+
+# The key that marks an event as a scheduled warm-up, e.g. from an
+# EventBridge rule with `{"filmbot-warmup": true}` as its constant input.
+# Like `deferral.DEFERRED`, events from Discord can't have it.
+WARMUP = "filmbot-warmup"
+
+# A record per guild, all in a single partition outside of any guild, with a
+# map of the weekly slots (weekday and hour) that the guild has started
+# watching films in to when it last did.  This lets a warm-up find the guilds
+# that are about to watch a film with a single query, rather than reading
+# the history of every guild.  There are only 168 slots in a week, so the map
+# stays small without removing the slots that a guild has stopped using.
+SCREENING_PK = "PK"
+SCREENING_SK = "SK"
+SCREENING_PKValue = "WARMUP"
+SCREENING_Slots = "Slots"
+
+# Guilds that usually watch a film within this time of a warm-up have their
+# state loaded by it
+WARMUP_LOOKAHEAD = dt.timedelta(hours=2)
+
+# Slots that a guild hasn't watched a film in for this long are ones that it
+# has stopped meeting in, so aren't warmed up for
+SCREENING_EXPIRY = dt.timedelta(weeks=8)
+
+# The modules that requests import when they first need them (see
+# `test_cold_start.py`), which a warm-up imports ahead of time
+WARMUP_MODULES = [
+    "discord_handler",
+    "film_search",
+    "guild_ranking",
+    "catalog",
+    "enrichment",
+    # Searching IMDb creates its client when first needed, which is quick
+    # once this has been imported
+    "imdb",
+]
+
+
+def screening_slot(DateTime):
+    """Return the weekly slot that `DateTime` is in, e.g. "4#20" for a
+    Friday evening."""
+    return f"{DateTime.weekday()}#{DateTime.hour:02d}"
+
+
+def upcoming_slots(Now, Lookahead=WARMUP_LOOKAHEAD):
+    """Return the set of weekly slots from `Now` until `Lookahead` later."""
+    slots = set()
+    hour = Now.replace(minute=0, second=0, microsecond=0)
+    while hour <= Now + Lookahead:
+        slots.add(screening_slot(hour))
+        hour += dt.timedelta(hours=1)
+    return slots
+
+
+def record_screening(client, GuildID, DateTime):
+    """Record that `GuildID` started watching a film at `DateTime`."""
+    from filmbot import TABLE_NAME
+
+    key = {
+        SCREENING_PK: {"S": SCREENING_PKValue},
+        SCREENING_SK: {"S": f"GUILD#{GuildID}"},
+    }
+    slot = screening_slot(DateTime)
+    watched = {"S": DateTime.isoformat()}
+    # A slot can only be set once the guild has a map of them, which another
+    # request could create between our attempts
+    for _ in range(2):
+        try:
+            client.update_item(
+                TableName=TABLE_NAME,
+                Key=key,
+                UpdateExpression="SET #Slots.#Slot = :LastWatched",
+                ConditionExpression="attribute_exists(#Slots)",
+                ExpressionAttributeNames={
+                    "#Slots": SCREENING_Slots,
+                    "#Slot": slot,
+                },
+                ExpressionAttributeValues={":LastWatched": watched},
+            )
+            return
+        except client.exceptions.ConditionalCheckFailedException:
+            pass
+        try:
+            client.update_item(
+                TableName=TABLE_NAME,
+                Key=key,
+                UpdateExpression="SET #Slots = :Slots",
+                ConditionExpression="attribute_not_exists(#Slots)",
+                ExpressionAttributeNames={"#Slots": SCREENING_Slots},
+                ExpressionAttributeValues={":Slots": {"M": {slot: watched}}},
+            )
+            return
+        except client.exceptions.ConditionalCheckFailedException:
+            pass
+
+
+def get_screening_guilds(client, Now):
+    """Return the IDs of the guilds that usually watch a film soon after
+    `Now`."""
+    from filmbot import TABLE_NAME
+
+    slots = upcoming_slots(Now)
+    since = (Now - SCREENING_EXPIRY).isoformat()
+    guilds = []
+    kwargs = {
+        "TableName": TABLE_NAME,
+        "KeyConditionExpression": f"{SCREENING_PK} = :PK",
+        "ExpressionAttributeValues": {":PK": {"S": SCREENING_PKValue}},
+    }
+    while True:
+        response = client.query(**kwargs)
+        for item in response["Items"]:
+            recent = {
+                slot
+                for (slot, watched) in item[SCREENING_Slots]["M"].items()
+                if watched["S"] >= since
+            }
+            if slots & recent:
+                guilds.append(item[SCREENING_SK]["S"].removeprefix("GUILD#"))
+        if "LastEvaluatedKey" not in response:
+            return guilds
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def preload_guild(client, GuildID, Deadline=None):
+    """Load what the first requests from `GuildID` at a screening read into
+    the caches of this container."""
+    from catalog import get_catalog_entries
+    from filmbot import FilmBot
+    from guild_ranking import get_guild_ranking
+    from nomination_choices import update_nomination_choices
+
+    filmbot = FilmBot(
+        DynamoDBClient=client, GuildID=GuildID, Deadline=Deadline
+    )
+    get_guild_ranking(client, GuildID)
+    nominations = filmbot.get_recent_nominations()
+    if not filmbot.truncated:
+        update_nomination_choices(GuildID, nominations)
+    # `/watch` adds the catalog entry of the film to the guild's ranking
+    get_catalog_entries(client, [n.IMDbID for n in nominations])
+
+
+def warm_up(client, Now=None, Deadline=None):
+    """
+    Import the modules that requests load lazily, connect to DynamoDB and
+    load the state of the guilds with a screening coming up, stopping at
+    `Deadline`.  Return a summary of what was warmed up.
+    """
+    from film_search import get_title_index
+
+    for module in WARMUP_MODULES:
+        importlib.import_module(module)
+    get_title_index()
+
+    # This is our first request to DynamoDB, so it opens the connection
+    guilds = get_screening_guilds(client, Now or dt.datetime.now())
+    preloaded = []
+    for guild in guilds:
+        if Deadline is not None and monotonic() >= Deadline:
+            break
+        try:
+            preload_guild(client, guild, Deadline=Deadline)
+        except Exception as e:
+            # The guild's requests will load it themselves
+            print(f"Failed to preload guild {guild}: {e}")
+            continue
+        preloaded.append(guild)
+    return {
+        "warmup": True,
+        "guilds": preloaded,
+        "skipped": len(guilds) - len(preloaded),
+    }
@@ -87,6 +87,38 @@ commands = [
         "name": "history",
         "type": 1,
         "description": "Display the films that have previously been watched",
+        "options": [
+            {
+                "name": "nominator",
+                "description": "Only show films nominated by this user",
+                "type": 6,
+                "required": False,
+            },
+            {
+                "name": "title",
+                "description": "Only show films whose title starts with this",
+                "type": 3,
+                "required": False,
+            },
+            {
+                "name": "from",
+                "description": "Only show films watched on or after this date (YYYY-MM-DD)",
+                "type": 3,
+                "required": False,
+            },
+            {
+                "name": "to",
+                "description": "Only show films watched on or before this date (YYYY-MM-DD)",
+                "type": 3,
+                "required": False,
+            },
+            {
+                "name": "attended",
+                "description": "Only show films that you attended",
+                "type": 5,
+                "required": False,
+            },
+        ],
     },
 ]
 